@@ -0,0 +1,221 @@
+"""
+Batch_Runner Class
+
+    one OutputCalculation per date window over inputs loaded once: FEDS is fetched
+    once for the whole batch and sliced per window, the reference set is loaded
+    (and indexed) once per year; run as a script, e.g. the 2020 monthly analysis:
+
+    python Batch_Runner.py --monthly 2020-01 2020-12 \
+        --bbox -125.0 24.396308 -66.93457 49.384358 \
+        --ref-title Downloaded_InterAgencyFirePerimeterHistory_All_Years_View \
+        --apply-finalfire --output-dir /projects/my-public-bucket/VEDA-PEC/results
+"""
+
+import os
+import sys
+import argparse
+import logging
+import calendar
+import pandas as pd
+
+from Input_FEDS import InputFEDS
+from Input_Reference import InputReference
+from Output_Calculation import OutputCalculation
+
+
+class BatchRunner():
+    """ BatchRunner
+        Runs OutputCalculation for every (start, stop) window, sharing loaded inputs:
+
+        - FEDS: one InputFEDS over min(start)..max(stop); each window is a
+          InputFEDS.window slice of it (finalfire applied within the window)
+        - reference: one InputReference per year of window starts (the reference
+          filters keep the year of usr_start), so its polygon index and spatial
+          index are built once and reused by all windows of that year
+
+        one output per window: {output_dir}/{name_prefix}{YYYY_MMDD}_to_{MMDD}_analysis.{ext}
+    """
+
+    # output file extension per output format
+    OUTPUT_EXTENSIONS = {"csv": "csv", "parquet": "parquet", "geoparquet": "parquet", "arrow": "arrow"}
+
+    def __init__(self,
+                 windows: list,
+                 search_bbox: list,
+                 crs,
+                 feds_settings: dict,
+                 ref_settings: dict,
+                 output_dir: str,
+                 output_format: str = "csv",
+                 day_search_range: int = 7,
+                 calc_settings: dict = None,
+                 name_prefix: str = ""):
+
+        # USER INPUT
+        self._windows = windows
+        self._search_bbox = search_bbox
+        self._crs = crs
+        self._feds_settings = feds_settings
+        self._ref_settings = ref_settings
+        self._output_dir = output_dir.rstrip("/")
+        self._output_format = output_format
+        self._day_search_range = day_search_range
+        self._calc_settings = {} if calc_settings is None else calc_settings
+        self._name_prefix = name_prefix
+
+        # PROGRAM SET
+        self._feds_input = None
+        self._outputs = {}
+
+        assert len(windows) != 0, "FATAL: no date windows provided"
+        assert output_format in BatchRunner.OUTPUT_EXTENSIONS, f"Provided output format {output_format} is NOT VALID, select only from: {list(BatchRunner.OUTPUT_EXTENSIONS)}"
+        for start, stop in windows:
+            assert BatchRunner.utc_timestamp(start) <= BatchRunner.utc_timestamp(stop), f"Invalid window {start} -> {stop}: start after stop"
+
+    @property
+    def feds_input(self):
+        return self._feds_input
+
+    @property
+    def outputs(self):
+        """ (start, stop) -> output url of every window written so far """
+        return self._outputs
+
+    def output_url(self, start: str, stop: str) -> str:
+        start, stop = BatchRunner.utc_timestamp(start), BatchRunner.utc_timestamp(stop)
+        name = f"{self._name_prefix}{start:%Y_%m%d}_to_{stop:%m%d}_analysis.{BatchRunner.OUTPUT_EXTENSIONS[self._output_format]}"
+        return f"{self._output_dir}/{name}"
+
+    # RUN
+    def run(self):
+        """ load FEDS once, then run every window year by year; returns outputs """
+        windows = sorted(self._windows, key=lambda window: BatchRunner.utc_timestamp(window[0]))
+        self._feds_input = InputFEDS(self._feds_settings["title"],
+                                     self._feds_settings["collection"],
+                                     windows[0][0],
+                                     max(windows, key=lambda window: BatchRunner.utc_timestamp(window[1]))[1],
+                                     self._search_bbox,
+                                     self._crs,
+                                     **{key: value for key, value in self._feds_settings.items() if key not in ["title", "collection"]})
+
+        for year in sorted(set(BatchRunner.utc_timestamp(start).year for start, _ in windows)):
+            year_windows = [window for window in windows if BatchRunner.utc_timestamp(window[0]).year == year]
+            # previous year's reference is released before the next is loaded
+            ref_input = InputReference(year_windows[0][0],
+                                       max(year_windows, key=lambda window: BatchRunner.utc_timestamp(window[1]))[1],
+                                       self._search_bbox,
+                                       self._crs,
+                                       **self._ref_settings)
+            # spatial index built once here, reused by every window's matching
+            ref_input.polygons.sindex
+            logging.info(f"BatchRunner: {ref_input.polygons.shape[0]} reference polygons for {len(year_windows)} windows in {year}")
+
+            for start, stop in year_windows:
+                self.run_window(start, stop, ref_input)
+
+        return self._outputs
+
+    def run_window(self, start: str, stop: str, ref_input: InputReference):
+        """ one window's OutputCalculation against the shared reference input """
+        feds_window = self._feds_input.window(start, stop)
+        if feds_window.polygons.shape[0] == 0:
+            logging.warning(f"BatchRunner: no FEDS polygons in window {start} -> {stop}; no output written")
+            return None
+
+        output_url = self.output_url(start, stop)
+        logging.info(f"BatchRunner: window {start} -> {stop} with {feds_window.polygons.shape[0]} FEDS polygons -> {output_url}")
+        OutputCalculation(feds_window,
+                          ref_input,
+                          self._output_format,
+                          output_url,
+                          self._day_search_range,
+                          False,
+                          False,
+                          **self._calc_settings)
+        self._outputs[(start, stop)] = output_url
+
+        return output_url
+
+    # WINDOWS
+    def utc_timestamp(stamp: str) -> pd.Timestamp:
+        """ naive utc timestamp of a window bound; naive strings are taken as utc """
+        stamp = pd.Timestamp(stamp)
+        return stamp.tz_convert('UTC').tz_localize(None) if stamp.tzinfo is not None else stamp
+    
+    def monthly_windows(first_month: str, last_month: str) -> list:
+        """ calendar month windows from first_month to last_month ("YYYY-MM", inclusive) """
+        windows = []
+        for month in pd.period_range(first_month, last_month, freq="M"):
+            last_day = calendar.monthrange(month.year, month.month)[1]
+            windows.append((f"{month.year}-{month.month:02d}-01T00:00:00+00:00",
+                            f"{month.year}-{month.month:02d}-{last_day:02d}T23:59:59+00:00"))
+        return windows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run FEDS vs reference calculations over many date windows with inputs loaded once")
+    windows = parser.add_argument_group("windows (at least one)")
+    windows.add_argument("--window", nargs=2, action="append", default=[], metavar=("START", "STOP"), help="iso start/stop, e.g. 2020-10-01T00:00:00+00:00 2020-10-31T23:59:59+00:00; repeatable")
+    windows.add_argument("--monthly", nargs=2, metavar=("FIRST", "LAST"), help="one window per calendar month, YYYY-MM to YYYY-MM")
+    parser.add_argument("--bbox", nargs=4, required=True, metavar=("MINLON", "MINLAT", "MAXLON", "MAXLAT"), help="search bbox")
+    parser.add_argument("--crs", type=int, default=3857, help="EPSG code for calculations")
+    parser.add_argument("--day-range", type=int, default=7, help="day search range")
+    parser.add_argument("--feds-title", default="firenrt")
+    parser.add_argument("--feds-collection", default="public.eis_fire_lf_perimeter_archive")
+    parser.add_argument("--feds-limit", type=int, default=9000, help="features per api page")
+    parser.add_argument("--apply-finalfire", action="store_true", help="keep the final perimeter per fire within each window")
+    parser.add_argument("--shard-days", type=int, default=None, help="split the FEDS fetch into shards of this many days")
+    parser.add_argument("--ref-title", required=True)
+    parser.add_argument("--ref-control-type", default="defined")
+    parser.add_argument("--ref-custom-url", default="none")
+    parser.add_argument("--ref-custom-read-type", default="none")
+    parser.add_argument("--output-dir", required=True, help="local directory or s3:// prefix")
+    parser.add_argument("--output-format", default="csv", choices=list(BatchRunner.OUTPUT_EXTENSIONS))
+    parser.add_argument("--name-prefix", default="", help="prefix of every output file name")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--metric-backend", default="overlay", choices=OutputCalculation.METRIC_BACKENDS)
+    parser.add_argument("--stream-batch-size", type=int, default=None)
+    parser.add_argument("--s3-endpoint-url", default=None)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+
+    window_list = [tuple(window) for window in args.window]
+    if args.monthly is not None:
+        window_list += BatchRunner.monthly_windows(*args.monthly)
+    if not len(window_list):
+        parser.error("provide --window and/or --monthly")
+    if args.stream_batch_size is not None and args.workers > 1:
+        parser.error("--stream-batch-size runs in one process; it cannot be combined with --workers > 1")
+
+    if not args.output_dir.startswith("s3://"):
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    runner = BatchRunner(window_list,
+                         args.bbox,
+                         args.crs,
+                         feds_settings={"title": args.feds_title,
+                                        "collection": args.feds_collection,
+                                        "access_type": "api",
+                                        "limit": args.feds_limit,
+                                        "apply_finalfire": args.apply_finalfire,
+                                        "shard_days": args.shard_days},
+                         ref_settings={"title": args.ref_title,
+                                       "control_type": args.ref_control_type,
+                                       "custom_url": args.ref_custom_url,
+                                       "custom_read_type": args.ref_custom_read_type},
+                         output_dir=args.output_dir,
+                         output_format=args.output_format,
+                         day_search_range=args.day_range,
+                         calc_settings={"workers": args.workers,
+                                        "metric_backend": args.metric_backend,
+                                        "stream_batch_size": args.stream_batch_size,
+                                        "s3_endpoint_url": args.s3_endpoint_url},
+                         name_prefix=args.name_prefix)
+    outputs = runner.run()
+    print(f"Batch complete: {len(outputs)} of {len(window_list)} windows written to {args.output_dir}")
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+"""
+Disk_Cache Class
+
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+import geopandas as gpd
+
+
+class DiskCache():
+    """ DiskCache
+        GeoParquet-backed cache of GeoDataFrames on local disk
+
+        each entry is a {key}.parquet file plus a {key}.json metadata sidecar
+        entries older than ttl seconds are treated as misses; once the cache
+        grows past max_bytes, least recently used entries are evicted
+    """
+
+    def __init__(self, cache_dir: str, ttl=86400, max_bytes=2 * 1024**3):
+
+        # USER INPUT
+        self._cache_dir = cache_dir
+        self._ttl = ttl
+        self._max_bytes = max_bytes
+
+        os.makedirs(self._cache_dir, exist_ok=True)
+
+    @property
+    def cache_dir(self):
+        return self._cache_dir
+
+    @property
+    def ttl(self):
+        return self._ttl
+
+    @property
+    def max_bytes(self):
+        return self._max_bytes
+
+    def make_key(*parts) -> str:
+        """ stable hash of any json-serializable request parameters """
+        raw = json.dumps(parts, sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def __paths(self, key: str):
+        return (os.path.join(self._cache_dir, f"{key}.parquet"),
+                os.path.join(self._cache_dir, f"{key}.json"))
+
+    def get(self, key: str):
+        """ return (GeoDataFrame, metadata dict) for a fresh entry, else None """
+        data_path, meta_path = self.__paths(key)
+        if not (os.path.exists(data_path) and os.path.exists(meta_path)):
+            return None
+
+        with open(meta_path) as meta_file:
+            meta = json.load(meta_file)
+
+        if self._ttl is not None and time.time() - meta["created"] > self._ttl:
+            logging.info(f"DiskCache: entry {key} expired")
+            return None
+
+        try:
+            gdf = gpd.read_parquet(data_path)
+        except Exception as e:
+            logging.warning(f"DiskCache: unreadable entry {key} ({e}); treating as miss")
+            self.remove(key)
+            return None
+
+        # mark as recently used for LRU eviction
+        os.utime(meta_path)
+
+        return gdf, meta
+
+    def put(self, key: str, gdf, meta: dict = None):
+        """ store a GeoDataFrame + metadata; writes are atomic per file """
+        data_path, meta_path = self.__paths(key)
+        meta = dict(meta or {}, created=time.time())
+
+        tmp_data = f"{data_path}.tmp"
+        gdf.to_parquet(tmp_data)
+        os.replace(tmp_data, data_path)
+
+        tmp_meta = f"{meta_path}.tmp"
+        with open(tmp_meta, "w") as meta_file:
+            json.dump(meta, meta_file, default=str)
+        os.replace(tmp_meta, meta_path)
+
+        self.evict()
+
+        return self
+
+    def remove(self, key: str):
+        """ drop an entry if present """
+        for path in self.__paths(key):
+            if os.path.exists(path):
+                os.remove(path)
+        return self
+
+    def evict(self):
+        """ remove least recently used entries until under max_bytes """
+        if self._max_bytes is None:
+            return self
+
+        entries = []
+        total = 0
+        for name in os.listdir(self._cache_dir):
+            if not name.endswith(".json"):
+                continue
+            key = name[:-len(".json")]
+            data_path, meta_path = self.__paths(key)
+            size = os.path.getsize(meta_path)
+            if os.path.exists(data_path):
+                size += os.path.getsize(data_path)
+            entries.append((os.path.getmtime(meta_path), key, size))
+            total += size
+
+        for _, key, size in sorted(entries):
+            if total <= self._max_bytes:
+                break
+            self.remove(key)
+            total -= size
+            logging.info(f"DiskCache: evicted entry {key}")
+
+        return self
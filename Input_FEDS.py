@@ -3,17 +3,27 @@ Input_FEDS Class
 
 """
 
+import os
+import copy
 import glob
 import sys
 import logging
+import requests
+import numpy as np
 import pandas as pd
 import geopandas as gpd
 from pyproj import CRS
 from owslib.ogcapi.features import Features
 import geopandas as gpd
 import datetime as dt
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from functools import singledispatch
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+
+import Utilities
+from Disk_Cache import DiskCache
+from Polygon_Index import PolygonIndex
 
 pd.set_option('display.max_columns',None)
 
@@ -31,6 +41,9 @@ class InputFEDS():
                 "staging-stac": "https://staging-stac.delta-backend.com",
                 "staging-raster" : "https://staging-raster.delta-backend.com" }
     
+    # format of the feds 't' column
+    TIME_FORMAT = "%Y-%m-%dT%H:%M:%S"
+    
     def __init__(self, title: str, 
                  collection: str, 
                  usr_start: str,
@@ -40,7 +53,14 @@ class InputFEDS():
                  access_type="api",
                  limit=1000,
                  custom_filter=False,
-                 apply_finalfire=False
+                 apply_finalfire=False,
+                 api_url=None,
+                 shard_days=None,
+                 max_workers=4,
+                 use_cache=True,
+                 refresh_cache=False,
+                 cache=None,
+                 incremental=False
                  ):
         
         # USER INPUT / FILTERS
@@ -55,14 +75,25 @@ class InputFEDS():
         self._crs = CRS.from_user_input(crs)
         self._units = self._crs.axis_info[0].unit_name
         self._apply_finalfire = apply_finalfire
+        self._shard_days = shard_days
+        self._max_workers = max_workers
+        self._use_cache = use_cache
+        self._refresh_cache = refresh_cache
+        self._cache = cache
+        self._incremental = incremental
         
         # PROGRAM SET
-        self._api_url = None
+        self._api_url = api_url
         self._ds_bbox = None
         self._range_start = None
         self._range_stop = None
         self._polygons = None
+        self._raw_polygons = None
+        self._polygon_index = None
+        self._raw_index = None
         self._queryables = None
+        self._state_store = None
+        self._stored_index_max = -1
         
         # singleset up functions
         self.__set_up_master()
@@ -92,6 +123,14 @@ class InputFEDS():
     def polygons(self):
         return self._polygons
     
+    @property
+    def raw_polygons(self):
+        return self._raw_polygons
+    
+    @property
+    def polygon_index(self):
+        return self._polygon_index
+    
     @property
     def queryables(self):
         return self._queryables
@@ -103,8 +142,17 @@ class InputFEDS():
         if self._access_type == "api":
             assert self._title in InputFEDS.TITLE_SETS, "ERR INPUTFEDS: Invalid title provided"
             self.__set_api_url()
-            self.__fetch_api_collection()
-            self.__set_api_polygons()
+            if self._incremental:
+                # stored set + only features newer than the latest seen t
+                self.__set_incremental_polygons()
+            else:
+                # cache hit skips the network entirely (metadata + items)
+                df = self.__read_cache()
+                if df is None:
+                    self.__fetch_api_collection()
+                    df = self.__fetch_api_polygons()
+                    self.__write_cache(df)
+                self.__set_api_polygons(df)
         elif self._access_type == "local":
             logging.warning('API NOT SELECTED: discretion advised due to direct file access.')
             self.set_hard_dataset()
@@ -113,9 +161,9 @@ class InputFEDS():
     
     # API DATA ACCESS HELPERS
     def __set_api_url(self):
-        """ fetch api url based on valid title"""
+        """ fetch api url based on valid title; an explicitly passed api_url wins (e.g. stub servers)"""
         
-        if self._title in InputFEDS.OGC_URLS:
+        if self._api_url is None and self._title in InputFEDS.OGC_URLS:
             self._api_url = InputFEDS.OGC_URLS[self._title]
         
         return self
@@ -147,59 +195,336 @@ class InputFEDS():
         # return perm
         return self
     
-    # @polygons.setter
-    def __set_api_polygons(self):
+    # RESPONSE CACHE HELPERS
+    def __cache_key(self) -> str:
+        """ cache key over every parameter that shapes the api response """
+        return DiskCache.make_key(self._api_url, 
+                                  self._title, 
+                                  self._collection, 
+                                  self._usr_bbox, 
+                                  [self._usr_start, self._usr_stop], 
+                                  self._custom_filter, 
+                                  self._srch_limit)
+    
+    def __get_cache(self):
+        """ user passed cache or the default one in the repo data dir """
+        if self._cache is None:
+            script_dir = os.path.dirname(os.path.abspath(__file__))
+            self._cache = DiskCache(os.path.join(script_dir, "data", "cache", "feds"))
+        return self._cache
+    
+    def __live_window(self) -> bool:
+        """ True when usr_stop is within the cache ttl of now (or later): features for
+            the window may still be arriving (NRT), so a cached response could be stale
+        """
+        stop = datetime.fromisoformat(self._usr_stop)
+        if stop.tzinfo is None:
+            stop = stop.replace(tzinfo=timezone.utc)
+        ttl = self.__get_cache().ttl
+        return stop > datetime.now(timezone.utc) - timedelta(seconds=0 if ttl is None else ttl)
+    
+    def __read_cache(self):
+        """ return raw cached polygons + restore collection metadata, or None on miss/bypass;
+            live windows always go to the api
+        """
+        if not self._use_cache or self._refresh_cache:
+            return None
+        if self.__live_window():
+            logging.info(f"INPUTFEDS: window ends within the cache ttl; fetching {self._collection} fresh")
+            return None
+        
+        hit = self.__get_cache().get(self.__cache_key())
+        if hit is None:
+            return None
+        
+        df, meta = hit
+        self._ds_bbox = meta["ds_bbox"]
+        self._range_start = meta["range_start"]
+        self._range_stop = meta["range_stop"]
+        self._queryables = meta["queryables"]
+        logging.info(f"INPUTFEDS: loaded {df.shape[0]} cached features for {self._collection}")
+        
+        return df
+    
+    def __write_cache(self, df):
+        """ persist raw polygons + collection metadata; live windows are not cached """
+        if not self._use_cache or self.__live_window():
+            return self
+        
+        meta = {"ds_bbox": self._ds_bbox,
+                "range_start": self._range_start,
+                "range_stop": self._range_stop,
+                "queryables": self._queryables}
+        try:
+            self.__get_cache().put(self.__cache_key(), df, meta)
+        except Exception as e:
+            logging.warning(f"INPUTFEDS: unable to write response cache: {e}")
+        
+        return self
+    
+    # INCREMENTAL (NRT) HELPERS
+    def __state_key(self) -> str:
+        """ incremental state is per collection query, independent of the time window """
+        return DiskCache.make_key("incremental",
+                                  self._api_url, 
+                                  self._title, 
+                                  self._collection, 
+                                  self._usr_bbox, 
+                                  self._custom_filter)
+    
+    def __get_state_store(self):
+        """ never-expiring store for incremental state in the repo data dir """
+        if self._state_store is None:
+            script_dir = os.path.dirname(os.path.abspath(__file__))
+            self._state_store = DiskCache(os.path.join(script_dir, "data", "cache", "incremental"), ttl=None, max_bytes=None)
+        return self._state_store
+    
+    def __write_state(self):
+        """ persist raw polygons seen so far + collection metadata
+            
+            a run resumed from the stored state merges into it (rows seen now replace
+            their stored copies), so a sub-window run keeps the rest of the stored
+            season; a full fetch replaces it (its indices start over)
+        """
+        raw = self._raw_polygons
+        covered_start = self._usr_start
+        
+        hit = self.__get_state_store().get(self.__state_key()) if self._stored_index_max >= 0 else None
+        if hit is not None:
+            stored, stored_meta = hit
+            stored = stored[~stored['feature_id'].isin(raw['feature_id'])]
+            raw = gpd.GeoDataFrame(pd.concat([stored, raw]), crs=raw.crs).sort_values(by='index', kind='mergesort')
+            covered_start = min(stored_meta["covered_start"], self._usr_start, key=datetime.fromisoformat)
+        
+        meta = {"covered_start": covered_start,
+                "ds_bbox": self._ds_bbox,
+                "range_start": self._range_start,
+                "range_stop": self._range_stop,
+                "queryables": self._queryables}
+        self.__get_state_store().put(self.__state_key(), raw, meta)
+        
+        return self
+    
+    def __set_incremental_polygons(self):
+        """ resume from stored state when it covers usr_start, else do a full fetch """
+        
+        hit = self.__get_state_store().get(self.__state_key())
+        
+        if hit is None or datetime.fromisoformat(hit[1]["covered_start"]) > datetime.fromisoformat(self._usr_start):
+            self.__fetch_api_collection()
+            self.__set_api_polygons(self.__fetch_api_polygons())
+            self.__write_state()
+            return self
+        
+        raw, meta = hit
+        # new features continue after every stored index, not just the window's
+        self._stored_index_max = int(raw['index'].max()) if raw.shape[0] else -1
+        self._ds_bbox = meta["ds_bbox"]
+        self._range_start = meta["range_start"]
+        self._range_stop = meta["range_stop"]
+        self._queryables = meta["queryables"]
+        
+        # keep only stored perimeters within the requested window
+        times = pd.to_datetime(raw['t'], format=InputFEDS.TIME_FORMAT)
+        raw = raw[(times >= InputFEDS.naive_utc(self._usr_start)).values & (times <= InputFEDS.naive_utc(self._usr_stop)).values]
+        raw.index = raw['index'].values
+        self._raw_polygons = raw
+        self.__set_final_polygons(raw)
+        
+        return self.refresh()
+    
+    def refresh(self, usr_stop: str = None):
+        """ incremental poll: request only features at/after the latest seen t,
+            merge the unseen ones into the current set and re-apply finalfire
+            on just the fire ids they touch
+            
+            usr_stop optionally moves the end of the window forward
+        """
+        assert self._access_type == "api", "ERR INPUTFEDS: refresh only supported for api access"
+        assert self._raw_polygons is not None, "ERR INPUTFEDS: nothing to refresh; polygons not set up"
+        
+        if usr_stop is not None:
+            self._usr_stop = usr_stop
+        
+        raw = self._raw_polygons
+        # nothing seen in the window yet: poll the whole window
+        latest_t = datetime.fromisoformat(raw['t'].max() if raw.shape[0] else self._usr_start)
+        if latest_t.tzinfo is None:
+            latest_t = latest_t.replace(tzinfo=timezone.utc)
+        
+        new = self.__fetch_api_polygons(start=latest_t.isoformat(), allow_empty=True)
+        new = new[~new['feature_id'].isin(raw['feature_id'])]
+        
+        if not new.empty:
+            # new rows continue the index so existing indices stay stable
+            new = new.reset_index(drop=True)
+            new.index = new.index + max(int(raw['index'].max()) if raw.shape[0] else -1, self._stored_index_max) + 1
+            new['index'] = new.index
+            new = self.__project(new)
+            
+            raw = gpd.GeoDataFrame(pd.concat([raw, new]), crs=raw.crs)
+            
+            if self._title == "firenrt" and self._apply_finalfire:
+                # only fires with new perimeters can change their final perimeter
+                affected = new['fireid'].unique()
+                kept = self._polygons[~self._polygons['fireid'].isin(affected)]
+                redone = InputFEDS.final_fire_perimeters(raw[raw['fireid'].isin(affected)])
+                polygons = gpd.GeoDataFrame(pd.concat([kept, redone]), crs=raw.crs).sort_values(by='fireid', kind='mergesort')
+            else:
+                polygons = raw
+            
+            self._raw_polygons = raw
+            self._polygons = polygons
+            self._polygon_index = PolygonIndex(polygons, time_col='t', time_format=InputFEDS.TIME_FORMAT)
+        
+        logging.info(f"INPUTFEDS: refresh added {new.shape[0]} new features")
+        
+        if self._incremental:
+            self.__write_state()
+        
+        return self
+    
+    def window(self, usr_start: str, usr_stop: str):
+        """ InputFEDS over the [usr_start, usr_stop] sub-range of the features already
+            loaded by this instance, as a fetch of just that range would return them;
+            nothing is re-fetched, and finalfire is applied within the window
+            
+            the raw features' time index is built once and shared by all windows
+        """
+        assert self._raw_polygons is not None, "ERR INPUTFEDS: window needs loaded api polygons"
+        
+        if self._raw_index is None or self._raw_index.polygons is not self._raw_polygons:
+            self._raw_index = PolygonIndex(self._raw_polygons, time_col='t', time_format=InputFEDS.TIME_FORMAT)
+        
+        positions = np.sort(self._raw_index.time_window(InputFEDS.naive_utc(usr_start), InputFEDS.naive_utc(usr_stop)))
+        
+        view = copy.copy(self)
+        view._usr_start = usr_start
+        view._usr_stop = usr_stop
+        view._incremental = False
+        view._raw_index = None
+        view._raw_polygons = self._raw_polygons.iloc[positions]
+        view.__set_final_polygons(view._raw_polygons)
+        
+        return view
+    
+    def __fetch_api_polygons(self, start: str = None, stop: str = None, allow_empty: bool = False):
         """ fetch polygons from collection of interest; called with filter params from user
             fetch all filters from instance attributes
+            
+            pages of at most `limit` features are streamed and converted one at a time,
+            so no item cap applies and only one raw page is held in memory
+            
+            returns raw (un-projected, un-filtered) polygons
         """
         
         if self._title == "firenrt":
             
-            # usr filter applied - assumes valid filter is passed
-            if self._custom_filter:
-                perm_results = Features(url=self._api_url).collection_items(
-                    self._collection,  # name of the dataset we want
-                    bbox= self._usr_bbox,  # coords of bounding box,
-                    datetime=[self._usr_start + "/" + self._usr_stop],  # user date range
-                    limit=self._srch_limit,  # max number of items returned
-                    filter= ext_query,  # additional filters based on queryable fields
-                )
+            start = self._usr_start if start is None else start
+            stop = self._usr_stop if stop is None else stop
             
-            # no usr filter
+            # one shard == whole range unless the user requests time sharding
+            if self._shard_days is None:
+                shards = [(start, stop)]
             else:
+                shards = Utilities.split_time_range(start, stop, self._shard_days)
+            
+            workers = max(1, min(self._max_workers, len(shards)))
+            with requests.Session() as session:
+                # shared connection pool sized to the thread pool
+                adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
                 
-                perm_results = Features(url=self._api_url).collection_items(
-                    self._collection,  # name of the dataset we want
-                    bbox= self._usr_bbox,  # coords of bounding box,
-                    datetime=  [self._usr_start + "/" + self._usr_stop],
-                    limit=self._srch_limit  # max number of items returned
-                )
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    shard_pages = list(executor.map(lambda shard: self.__fetch_shard(session, shard[0], shard[1]), shards))
+            
+            # keep shard order (chronological) so later perimeters keep higher indices
+            pages = [page for shard in shard_pages for page in shard]
                 
         else:
             logging.error(f"TODO: ERR INPUTFEDS: no setting method for the _title: {self._title}")
             sys.exit()
         
-        if not perm_results["numberMatched"] == perm_results["numberReturned"]:
-            raise ValueError("INPUTFEDS: provided item limit on API cuts out items; increase limit and/or decrease time range to prevent corrupt results")
-            
-        df = gpd.GeoDataFrame.from_features(perm_results["features"])
-        if df.empty:
+        if not len(pages) and allow_empty:
+            return gpd.GeoDataFrame(columns=['geometry', 'feature_id', 'fireid', 't'], geometry='geometry')
+        if not len(pages):
             raise ValueError("INPUTFEDS: No FEDS results found. Please re-try with different date range/bbox region")
+        df = gpd.GeoDataFrame(pd.concat(pages, ignore_index=True))
+        
+        # shards share boundary instants: drop repeated features by id
+        repeated = df['feature_id'].notna() & df.duplicated(subset='feature_id', keep='first')
+        df = df[~repeated].reset_index(drop=True)
+        
+        return df
+    
+    # @polygons.setter
+    def __set_api_polygons(self, df):
+        """ set polygons from raw api results: index, crs and finalfire handling """
         
         df['index'] = df.index
+        df = self.__project(df)
+        
+        self._raw_polygons = df
+        self.__set_final_polygons(df)
         
-        # set/to crs based on usr input
+        return self
+    
+    def __project(self, df):
+        """ set/to crs based on usr input """
         try:
             df = df.set_crs(self._crs)
         except Exception as e:
             logging.error(f'Encountered {e}, no FEDS geom found. Retry with different dates / region')
         df = df.to_crs(self._crs)
         
-        # apply finalized fire perim: take highest indices of duplicate fire ids
+        return df
+    
+    def __set_final_polygons(self, df):
+        """ apply finalfire (if requested) to projected raw polygons + build lookup index """
         if self._title == "firenrt" and self._apply_finalfire:
-            sorted_gdf = df.sort_values(by=['fireid', 'index'], ascending=[True, False])
-            df = sorted_gdf.drop_duplicates(subset='fireid', keep='first')
+            df = InputFEDS.final_fire_perimeters(df)
             
         self._polygons = df
+        self._polygon_index = PolygonIndex(df, time_col='t', time_format=InputFEDS.TIME_FORMAT)
         
-        return self
\ No newline at end of file
+        return self
+    
+    def naive_utc(stamp: str) -> pd.Timestamp:
+        """ search string as a naive utc timestamp, comparable to feds t (naive utc);
+            search strings may carry an offset
+        """
+        stamp = pd.Timestamp(stamp)
+        return stamp.tz_convert('UTC').tz_localize(None) if stamp.tzinfo is not None else stamp
+    
+    def final_fire_perimeters(df):
+        """ apply finalized fire perim: take highest indices of duplicate fire ids """
+        sorted_gdf = df.sort_values(by=['fireid', 'index'], ascending=[True, False])
+        return sorted_gdf.drop_duplicates(subset='fireid', keep='first')
+    
+    def __fetch_shard(self, session, shard_start: str, shard_stop: str) -> list:
+        """ stream all pages of one time shard; returns list of page frames """
+        
+        params = {
+            "datetime": shard_start + "/" + shard_stop,  # shard date range
+            "limit": self._srch_limit  # max number of items per page
+        }
+        if self._usr_bbox is not None:
+            params["bbox"] = ",".join(map(str, self._usr_bbox))  # coords of bounding box
+        # usr filter applied - assumes valid filter is passed
+        if self._custom_filter:
+            params["filter"] = self._custom_filter  # additional filters based on queryable fields
+        
+        items_url = f"{self._api_url}/collections/{self._collection}/items"
+        
+        return [InputFEDS.features_to_frame(page["features"]) 
+                for page in Utilities.iter_ogc_pages(session, items_url, params)
+                if len(page.get("features", []))]
+    
+    def features_to_frame(features: list):
+        """ convert one page of geojson features into a GeoDataFrame
+            keeps the OGC feature id as 'feature_id' for de-duplication
+        """
+        df = gpd.GeoDataFrame.from_features(features)
+        df['feature_id'] = [feature.get("id") for feature in features]
+        return df
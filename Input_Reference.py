@@ -4,10 +4,13 @@ Input_Reference Class
 """
 
 import os
+import json
+import time
 import glob
 import sys
 import logging
 import requests
+import numpy as np
 import pandas as pd
 import geopandas as gpd
 import fsspec
@@ -18,7 +21,15 @@ import geopandas as gpd
 import datetime
 from datetime import timedelta
 from functools import singledispatch
+from dateutil.tz import tzlocal
 from botocore.config import Config
+from requests.adapters import HTTPAdapter
+from shapely.geometry import box, Polygon
+
+import Utilities
+from Disk_Cache import DiskCache
+from Polygon_Index import PolygonIndex
+from Reference_Store import ReferenceStore
 
 
 pd.set_option('display.max_columns',None)
@@ -33,22 +44,36 @@ class InputReference():
     # AGENCY - these map to specific read types
     REFERENCE_PREDEFINED_SETS = [ "InterAgencyFirePerimeterHistory_All_Years_View",
                                  "Downloaded_InterAgencyFirePerimeterHistory_All_Years_View",
+                                 "Partitioned_InterAgencyFirePerimeterHistory_All_Years_View",
                                  "WFIGS_current_interagency_fire_perimeters",
                                  "california_fire_perimeters_all",
                                  "none"]
     # CONTROL - custom will need to provide their own read types
     CONTROL_TYPE = ["defined", "custom"]
+    # points per usr_bbox edge when reprojecting the search area
+    BBOX_EDGE_POINTS = 64
     
     # PREDEFINED AGENCY URLS
     URL_MAPS = { 
         "InterAgencyFirePerimeterHistory_All_Years_View": ["https://services3.arcgis.com/T4QMspbfLg3qTGWY/arcgis/rest/services/InterAgencyFirePerimeterHistory_All_Years_View/FeatureServer/0/query?outFields=*&where=1%3D1&f=geojson", "arc_gis_online"],
         "Downloaded_InterAgencyFirePerimeterHistory_All_Years_View": ["/projects/shared-buckets/ksharonin/Latest_Interagency_Fire_Perimeters", "shp_local", 's3://maap-ops-workspace/shared/ksharonin/Latest_Interagency_Fire_Perimeters/Latest_Interagency_Fire_Perimeters.json'],
+        # built with Reference_Store.py from the Downloaded_ source above
+        "Partitioned_InterAgencyFirePerimeterHistory_All_Years_View": ["/projects/shared-buckets/ksharonin/Latest_Interagency_Fire_Perimeters_Store", "geoparquet_store"],
         # "WFIGS_Interagency_Fire_Perimeters": [ "https://services3.arcgis.com/T4QMspbfLg3qTGWY/arcgis/rest/services/WFIGS_Interagency_Perimeters/FeatureServer/0/query?outFields=*&where=1%3D1&f=geojson", "arc_gis_online"],
             "WFIGS_current_interagency_fire_perimeters" : ["https://services3.arcgis.com/T4QMspbfLg3qTGWY/arcgis/rest/services/WFIGS_Interagency_Perimeters_Current/FeatureServer/0/query?outFields=*&where=1%3D1&f=geojson" , "arc_gis_online"],
             # "current_wildland_fire_incident_locations" :[ "https://services3.arcgis.com/T4QMspbfLg3qTGWY/arcgis/rest/services/WFIGS_Incident_Locations_Current/FeatureServer/0/query?outFields=*&where=1%3D1&f=geojson", "arc_gis_online"],
             "california_fire_perimeters_all": [ "https://services1.arcgis.com/jUJYIo9tSA7EHvfZ/arcgis/rest/services/California_Fire_Perimeters/FeatureServer/0/query?outFields=*&where=1%3D1&f=geojson", "arc_gis_online"]
             }
     
+    # PREDEFINED SOURCE SCHEMAS - time column + how to read it, incident name column, other fields used downstream
+    SOURCE_SCHEMAS = {
+        "InterAgencyFirePerimeterHistory_All_Years_View": {"time": "DATE_CUR", "time_format": "%Y%m%d", "time_length": 8, "incident_name": "INCIDENT", "fields": ["GIS_ACRES"]},
+        "Downloaded_InterAgencyFirePerimeterHistory_All_Years_View": {"time": "DATE_CUR", "time_format": "%Y%m%d", "time_length": 8, "incident_name": "INCIDENT", "fields": ["GIS_ACRES"]},
+        "Partitioned_InterAgencyFirePerimeterHistory_All_Years_View": {"time": "DATE_CUR", "time_format": "%Y%m%d", "time_length": 8, "incident_name": "INCIDENT", "fields": ["GIS_ACRES"]},
+        "WFIGS_current_interagency_fire_perimeters": {"time": "poly_PolygonDateTime", "time_unit": "ms", "incident_name": "poly_IncidentName", "fields": []},
+        "california_fire_perimeters_all": {"time": "ALARM_DATE", "time_unit": "ms", "incident_name": "FIRE_NAME", "fields": []}
+    }
+    
     # instance initiation
     def __init__(self, 
                  usr_start: str,
@@ -61,6 +86,10 @@ class InputReference():
                  custom_read_type: str ="none",
                  custom_col_assign: dict = {},
                  custom_filter: bool = False,
+                 max_workers: int = 4,
+                 page_size: int = 2000,
+                 cache_max_age: int = 300,
+                 refresh_cache: bool = False
                 ):
         
         # USER INPUT / FILTERS
@@ -73,6 +102,10 @@ class InputReference():
         self._custom_read_type = custom_read_type
         self._custom_filter = custom_filter
         self._custom_col_assign = custom_col_assign
+        self._max_workers = max_workers
+        self._page_size = page_size
+        self._cache_max_age = cache_max_age
+        self._refresh_cache = refresh_cache
         self._crs = CRS.from_user_input(crs)
         self._units = self._crs.axis_info[0].unit_name
         
@@ -82,6 +115,8 @@ class InputReference():
         self._ds_start = None
         self._ds_stop = None
         self._polygons = None
+        self._polygon_index = None
+        self._coords_crs = None
         self._ds_url = None
         self._ds_read_type = None
         
@@ -113,6 +148,10 @@ class InputReference():
     def polygons(self):
         return self._polygons
     
+    @property
+    def polygon_index(self):
+        return self._polygon_index
+    
     
     # MASTER SET UP FUNCTION
     def __set_up_master(self):
@@ -148,6 +187,10 @@ class InputReference():
         if self._ds_read_type in InputReference.READ_TYPE.keys():
             custom_set_func = InputReference.READ_TYPE[self._ds_read_type]
             custom_set_func(self)
+            # drop anything outside the search area before it reaches matching
+            self._polygons = self.clip_to_bbox(self._polygons)
+            # positional lookup store, built once for all pair resolution
+            self._polygon_index = PolygonIndex(self._polygons, time_col='DATE_CUR_STAMP')
         else:
             logging.error(f"Fatal: No function mapping defined for read type: {self._ds_read_type}")
             sys.exit()
@@ -158,18 +201,27 @@ class InputReference():
             if not custom/agency defined, then preset filters will be applied
             users are welcome to modify/remove filters at their own discretion
         """
+        # bbox pushed into the reader; reprojected to the file crs by geopandas
+        bbox = self.bbox_geometry()
+        df = None
         try:
-            df = gpd.read_file(self._ds_url)
+            df = gpd.read_file(self._ds_url, bbox=bbox)
         except Exception as e:
             pass
+        # predefined sets also keep an s3 copy; custom sets only have the local url
+        s3_url = InputReference.URL_MAPS[self._title][2] if self._title in InputReference.URL_MAPS else None
         try:
-            fs = fsspec.filesystem("s3")
-            with fs.open(InputReference.URL_MAPS[self._title][2]) as f:
-                df = gpd.GeoDataFrame.from_file(f)
+            if s3_url is not None:
+                fs = fsspec.filesystem("s3")
+                with fs.open(s3_url) as f:
+                    df = gpd.GeoDataFrame.from_file(f, bbox=bbox)
             
             # df = gpd.read_file(InputReference.URL_MAPS[self._title][2], config=config)
         except IOError as io_err:
-            logging.error(f"ERR: unable to read local shp from url: {self._ds_url} and {InputReference.URL_MAPS[self._title][2]}, produced error: {io_err}")
+            logging.error(f"ERR: unable to read local shp from url: {self._ds_url} and {s3_url}, produced error: {io_err}")
+            sys.exit()
+        if df is None:
+            logging.error(f"ERR: unable to read local shp from url: {self._ds_url}")
             sys.exit()
         
         # filter based on predfined conds 
@@ -199,19 +251,18 @@ class InputReference():
         data_dir = os.path.join(script_dir, "data")
         location = os.path.join(data_dir, f"{self._title}.geojson")
         
-        geojson_url = self._ds_url
-        response = requests.get(geojson_url)
-        
-        if response.status_code == 200:
-            with open(location, "wb") as geojson_file:
-                geojson_file.write(response.content)
-            logging.info(f"GeoJSON data downloaded and saved to {location}")
-        else:
-            logging.error(f"Failed to retrieve data. Status code: {response.status_code}")
+        # push bbox, date window and fields into the query; page concurrently
+        query_url = self._ds_url.split("?")[0]
+        try:
+            with requests.Session() as session:
+                adapter = HTTPAdapter(pool_connections=self._max_workers, pool_maxsize=self._max_workers)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                gdf = self.__read_arcgis_cached(session, query_url, location)
+        except (requests.RequestException, IOError, ValueError) as e:
+            logging.error(f"Failed to retrieve data from {query_url}: {e}")
             sys.exit()
         
-        gdf = gpd.read_file(location)
-        
         # manually move filtering due to bug
         df_date = datetime.datetime.fromisoformat(self._usr_start)
         df_year = df_date.year
@@ -224,20 +275,14 @@ class InputReference():
             gdf['is_valid_geometry'] = gdf['geometry'].is_valid
             gdf = gdf[gdf['is_valid_geometry'] == True]
             gdf = gdf[gdf.geometry != None]
-            gdf['DATE_NOT_NONE'] = gdf.apply(lambda row : getattr(row, 'poly_PolygonDateTime') is not None, axis = 1)
-            gdf = gdf[gdf.DATE_NOT_NONE == True]
-            gdf = gdf.dropna(subset=['poly_PolygonDateTime'])
-            gdf['DATE_CUR_STAMP'] =  gdf.apply(lambda row :  datetime.datetime.fromtimestamp(getattr(row, 'poly_PolygonDateTime') / 1000.0), axis = 1)
+            gdf = InputReference.normalize_dates(gdf, InputReference.SOURCE_SCHEMAS[self._title])
             # outcast non matches in year self._usr_start
             gdf = gdf[gdf.DATE_CUR_STAMP.dt.year == int(self._usr_start[:4])]
         
         elif self._title == "california_fire_perimeters_all":
             gdf['is_valid_geometry'] = gdf['geometry'].is_valid
             gdf = gdf[gdf['is_valid_geometry'] == True]
-            gdf['DATE_NOT_NONE'] = gdf.apply(lambda row : getattr(row, 'ALARM_DATE') is not None, axis = 1)
-            gdf = gdf[gdf.DATE_NOT_NONE == True]
-            gdf = gdf.dropna(subset=['ALARM_DATE'])
-            gdf['DATE_CUR_STAMP'] =  gdf.apply(lambda row :  datetime.datetime.fromtimestamp(getattr(row, 'ALARM_DATE') / 1000.0), axis = 1)
+            gdf = InputReference.normalize_dates(gdf, InputReference.SOURCE_SCHEMAS[self._title])
             # outcast non matches in year self._usr_start
             gdf = gdf[gdf.DATE_CUR_STAMP.dt.year == int(self._usr_start[:4])]
             gdf = gdf.to_crs(self._crs)
@@ -245,14 +290,8 @@ class InputReference():
         elif self._title == "WFIGS_Interagency_Fire_Perimeters":
             gdf['is_valid_geometry'] = gdf['geometry'].is_valid
             gdf = gdf[gdf['is_valid_geometry'] == True]
-            # gdf['DATE_NOT_NONE'] = gdf.apply(lambda row : getattr(row, 'DATE_CUR') is not None, axis = 1)
-            gdf['DATE_NOT_NONE'] = gdf.apply(lambda row : getattr(row, 'poly_PolygonDateTime') is not None, axis = 1)
-            gdf = gdf[gdf.DATE_NOT_NONE == True]
-            # cur_format = '%Y%m%d' 
-            # gdf['DATE_CUR_STAMP'] = gdf.apply(lambda row : datetime.strptime(row.DATE_CUR, cur_format), axis = 1)
-            gdf['DATE_NOT_NONE'] = gdf.apply(lambda row : getattr(row, 'poly_PolygonDateTime') is not None, axis = 1)
-            gdf = gdf.dropna(subset=['poly_PolygonDateTime'])
-            gdf['DATE_CUR_STAMP'] =  gdf.apply(lambda row : datetime.fromtimestamp(getattr(row, 'poly_PolygonDateTime') / 1000.0), axis = 1)
+            # same time column as the current WFIGS perimeters
+            gdf = InputReference.normalize_dates(gdf, InputReference.SOURCE_SCHEMAS["WFIGS_current_interagency_fire_perimeters"])
             # gdf = gdf.set_crs(self._crs, allow_override=True)
             
             gdf = gdf[gdf.DATE_CUR_STAMP.dt.year == int(self._usr_start[:4])]
@@ -260,24 +299,13 @@ class InputReference():
             gdf = gdf.to_crs(self._crs)
         
         elif self._title == "InterAgencyFirePerimeterHistory_All_Years_View":
-            df_date = datetime.datetime.fromisoformat(self._usr_start)
-            df_start_year = df_date.year
-            df_date = datetime.datetime.fromisoformat(self._usr_stop)
-            df_stop_year = df_date.year
-
-            nifc_date_format = '%Y%m%d' 
-
             gdf = gdf[gdf.geometry != None]
             gdf = gdf[gdf.GIS_ACRES != 0]
-            gdf = gdf.set_crs(self._crs, allow_override=True)
+            gdf = self.relabel_crs(gdf)
 
             assert gdf.shape[0] != 0, "Invalid shape identified in ArcGIS API read"
 
-            gdf['DATE_NOT_NONE'] = gdf.apply(lambda row : getattr(row, 'DATE_CUR') is not None, axis = 1)
-            gdf = gdf[gdf.DATE_NOT_NONE == True]
-            gdf['DATE_LEN_VALID'] = gdf.apply(lambda row : len(getattr(row, 'DATE_CUR')) == 8 , axis = 1)
-            gdf = gdf[gdf.DATE_LEN_VALID == True]
-            gdf['DATE_CUR_STAMP'] =  gdf.apply(lambda row : datetime.datetime.strptime(getattr(row, 'DATE_CUR'), nifc_date_format), axis = 1)
+            gdf = InputReference.normalize_dates(gdf, InputReference.SOURCE_SCHEMAS[self._title])
             gdf = gdf[gdf.DATE_CUR_STAMP.dt.year == int(self._usr_start[:4])]
             
         
@@ -287,17 +315,218 @@ class InputReference():
     
         return self
     
+    def __read_arcgis_cached(self, session, query_url: str, location: str):
+        """ conditional download of an ArcGIS query into data/{title}.geojson
+            
+            next to the raw geojson sits a parsed GeoParquet copy + a .meta.json
+            with the query key, the layer lastEditDate and the fetch time:
+            - fetched within cache_max_age seconds -> load the parquet, no network
+            - older, but the layer lastEditDate is unchanged -> load the parquet
+            - otherwise (or refresh_cache) -> stream pages to disk, re-parse
+        """
+        parsed_location = location.replace(".geojson", ".parquet")
+        meta_location = location.replace(".geojson", ".meta.json")
+        params = self.arcgis_query_params()
+        key = DiskCache.make_key(query_url, params)
+        
+        meta = None
+        if not self._refresh_cache and os.path.exists(parsed_location) and os.path.exists(meta_location):
+            with open(meta_location) as meta_file:
+                meta = json.load(meta_file)
+            if meta.get("key") != key:
+                meta = None
+        
+        if meta is not None and time.time() - meta["fetched"] <= self._cache_max_age:
+            logging.info(f"Using cached reference data {parsed_location}")
+            return gpd.read_parquet(parsed_location)
+        
+        layer_info = Utilities.arcgis_layer_info(session, query_url)
+        last_edit = layer_info.get("editingInfo", {}).get("lastEditDate")
+        
+        if meta is not None and last_edit is not None and meta.get("last_edit") == last_edit:
+            logging.info(f"Reference source unchanged since last download; using {parsed_location}")
+            meta["fetched"] = time.time()
+            Utilities.atomic_write(meta_location, [json.dumps(meta)])
+            return gpd.read_parquet(parsed_location)
+        
+        # stream pages straight into the raw file as they arrive
+        def geojson_chunks():
+            yield '{"type": "FeatureCollection", "features": ['
+            first = True
+            for features in Utilities.iter_arcgis_pages(session, 
+                                                        query_url, 
+                                                        params, 
+                                                        layer_info,
+                                                        page_size=self._page_size, 
+                                                        max_workers=self._max_workers):
+                for feature in features:
+                    yield ('' if first else ',') + json.dumps(feature)
+                    first = False
+            yield ']}'
+        
+        Utilities.atomic_write(location, geojson_chunks())
+        logging.info(f"GeoJSON data downloaded and saved to {location}")
+        
+        gdf = gpd.read_file(location)
+        
+        tmp_parsed = f"{parsed_location}.tmp"
+        gdf.to_parquet(tmp_parsed)
+        os.replace(tmp_parsed, parsed_location)
+        Utilities.atomic_write(meta_location, [json.dumps({"key": key, "last_edit": last_edit, "fetched": time.time()})])
+        
+        return gdf
+    
+    def __set_polygon_geoparquet_store(self):
+        """ read a year-partitioned GeoParquet store (see Reference_Store.py)
+            only the usr_start year partition is opened (the year the Downloaded_
+            filters keep) and, within it, only row groups whose bounds intersect
+            usr_bbox; dates are already normalized at ingest
+        """
+        years = [int(self._usr_start[:4])]
+        try:
+            df = ReferenceStore(self._ds_url).read(years, self._usr_bbox)
+        except (IOError, AssertionError) as e:
+            logging.error(f"ERR: unable to read reference store at {self._ds_url}, produced error: {e}")
+            sys.exit()
+        
+        df = df[df.geometry != None]
+        if "GIS_ACRES" in df.columns:
+            df = df[df.GIS_ACRES != 0]
+        # relabelled, not reprojected: same coordinates as the Downloaded_ path and FEDS
+        df = self.relabel_crs(df)
+        
+        # custom stores: map the incident name if provided
+        if "incident_name" in self._custom_col_assign:
+            df['INCIDENT'] = df[self._custom_col_assign["incident_name"]]
+        
+        df['index'] = df.index
+        
+        self._polygons = df
+        
+        return self
+    
+    def bbox_geometry(self):
+        """ usr_bbox as a one-row GeoSeries in EPSG:4326, None if no bbox set;
+            edges are densified so the area still follows its parallels and
+            meridians once reprojected to a non-rectilinear crs (e.g. conic)
+        """
+        if self._usr_bbox is None:
+            return None
+        minx, miny, maxx, maxy = map(float, self._usr_bbox)
+        # each edge from its corner up to (not including) the next one
+        step = np.linspace(0, 1, InputReference.BBOX_EDGE_POINTS, endpoint=False)
+        width, height = maxx - minx, maxy - miny
+        ring = np.concatenate([np.column_stack([minx + step * width, np.full(step.size, miny)]),
+                               np.column_stack([np.full(step.size, maxx), miny + step * height]),
+                               np.column_stack([maxx - step * width, np.full(step.size, maxy)]),
+                               np.column_stack([np.full(step.size, minx), maxy - step * height])])
+        return gpd.GeoSeries([Polygon(ring)], crs=4326)
+    
+    def relabel_crs(self, df):
+        """ label df with the user crs without moving its coordinates, as the predefined
+            sets (and FEDS) are handled; the crs the coordinates are really in is kept
+            for clip_to_bbox
+        """
+        if df.crs is not None and df.crs != self._crs:
+            self._coords_crs = df.crs
+        return df.set_crs(self._crs, allow_override=True)
+    
+    def clip_to_bbox(self, df):
+        """ keep only polygons intersecting usr_bbox (whole polygons, not cut)
+            the bbox is reprojected to the crs the coordinates are really in (the source
+            crs when relabel_crs only relabelled them) and run against the spatial index;
+            covers read types that cannot filter at read time
+        """
+        if self._usr_bbox is None or df.shape[0] == 0:
+            return df
+        
+        if self._coords_crs is not None:
+            coords_crs = self._coords_crs
+        else:
+            coords_crs = df.crs if df.crs is not None else self._crs
+        area = self.bbox_geometry().to_crs(coords_crs).iloc[0]
+        positions = np.sort(df.sindex.query(area, predicate="intersects"))
+        logging.info(f"InputReference: {positions.shape[0]} of {df.shape[0]} reference polygons within usr_bbox")
+        
+        return df.iloc[positions]
+    
+    def arcgis_query_params(self) -> dict:
+        """ server-side filters for an ArcGIS FeatureServer query:
+            - where: year of usr_start (the same window the local filters keep) on the
+              source time column, padded a day each side for timezone differences
+            - geometry: usr_bbox envelope in EPSG:4326
+            - outFields: only the columns used downstream
+            sources without a schema fall back to all rows/fields
+        """
+        params = {"where": "1=1", "outFields": "*", "f": "geojson"}
+        
+        if self._usr_bbox is not None:
+            params.update(geometry=",".join(map(str, self._usr_bbox)),
+                          geometryType="esriGeometryEnvelope",
+                          inSR=4326,
+                          spatialRel="esriSpatialRelIntersects")
+        
+        if self._title not in InputReference.SOURCE_SCHEMAS:
+            return params
+        
+        schema = InputReference.SOURCE_SCHEMAS[self._title]
+        year = int(self._usr_start[:4])
+        window_start = datetime.datetime(year, 1, 1) - timedelta(days=1)
+        window_stop = datetime.datetime(year + 1, 1, 1) + timedelta(days=1)
+        time_col = schema["time"]
+        
+        if "time_format" in schema:
+            # string dates e.g. DATE_CUR 'YYYYMMDD'
+            params["where"] = f"{time_col} >= '{window_start.strftime(schema['time_format'])}' AND {time_col} <= '{window_stop.strftime(schema['time_format'])}'"
+        else:
+            # esri date fields
+            params["where"] = f"{time_col} >= TIMESTAMP '{window_start:%Y-%m-%d %H:%M:%S}' AND {time_col} < TIMESTAMP '{window_stop:%Y-%m-%d %H:%M:%S}'"
+        
+        params["outFields"] = ",".join([time_col, schema["incident_name"]] + schema["fields"])
+        
+        return params
+    
     # READ TYPE - function map; if agency not specific, then must be custom set
     READ_TYPE = {  
                     "shp_local": __set_polygon_shp_local,
                     # "raster_local": __set_polygon_set_raster_local,
                     "arc_gis_online": __set_polygon_arcgis_online,
+                    "geoparquet_store": __set_polygon_geoparquet_store,
                     # "s3": __set_polygon_s3,
                     "other": None
                 }
     
     # PREDEFINED DS FILTER FUNCTIONS 
     
+    # DATE NORMALIZATION
+    def normalize_dates(df, schema: dict):
+        """ vectorized DATE_CUR_STAMP generation driven by a source schema 
+            (see SOURCE_SCHEMAS) 
+            actions:
+            - flag and remove rows with no time value (DATE_NOT_NONE)
+            - string times: flag and remove values not of `time_length` (DATE_LEN_VALID),
+              then parse the whole column with `time_format`
+            - epoch times: convert from `time_unit` to local naive datetimes 
+              (same result as datetime.fromtimestamp per row)
+        """
+        time_col = schema["time"]
+        
+        not_none = df[time_col].notna()
+        df = df[not_none].copy()
+        df['DATE_NOT_NONE'] = True
+        
+        if "time_format" in schema:
+            if "time_length" in schema:
+                len_valid = df[time_col].astype(str).str.len() == schema["time_length"]
+                df = df[len_valid].copy()
+                df['DATE_LEN_VALID'] = True
+            df['DATE_CUR_STAMP'] = pd.to_datetime(df[time_col], format=schema["time_format"])
+        else:
+            stamps = pd.to_datetime(df[time_col], unit=schema["time_unit"], utc=True)
+            df['DATE_CUR_STAMP'] = stamps.dt.tz_convert(tzlocal()).dt.tz_localize(None)
+        
+        return df
+    
     # CUSTOM
     def filter_custom_local(self, df):
         """ set proper columns from user df
@@ -310,26 +539,20 @@ class InputReference():
         assert "time" in self._custom_col_assign, "Fatal: no time column detected for custom local dataset"
         assert "time_format" in self._custom_col_assign, "Fatal: no time format detected for custom local dataset"
         
-        t_format = self._custom_col_assign["time_format"]
-        df_date = datetime.datetime.fromisoformat(self._usr_start)
-        df_year = df_date.year
-        
         # crs management
-        df = gdf.set_crs(self._crs, allow_override=True)
-        df = gdf.to_crs(self._crs)
+        df = self.relabel_crs(df)
+        df = df.to_crs(self._crs)
         
         # geom validity
         df['is_valid_geometry'] = df['geometry'].is_valid
-        df = gdf[df['is_valid_geometry'] == True]
-        df = gdf[df.geometry != None]
+        df = df[df['is_valid_geometry'] == True]
+        df = df[df.geometry != None]
         
         # time parse + mapping
         time_col_name = self._custom_col_assign["time"]
-        df['DATE_NOT_NONE'] = df.apply(lambda row : getattr(row, time_col_name) is not None, axis = 1)
-        df = df[df.DATE_NOT_NONE == True]
         # check type is str passed, cannot apply operation on datetime objects
-        assert type(df.iloc[0][time_col_name]) is str, "Fatal: time column not in string form, see README documentation for proper column requirements"
-        df['DATE_CUR_STAMP'] =  df.apply(lambda row : datetime.datetime.strptime(getattr(row, time_col_name), t_format), axis = 1)
+        assert df[time_col_name].dropna().map(type).eq(str).all(), "Fatal: time column not in string form, see README documentation for proper column requirements"
+        df = InputReference.normalize_dates(df, {"time": time_col_name, "time_format": self._custom_col_assign["time_format"]})
         
         # outcast non matches in year self._usr_start
         df = df[df.DATE_CUR_STAMP.dt.year == int(self._usr_start[:4])]
@@ -355,28 +578,16 @@ class InputReference():
             - generate datetime object from date
         """
         
-        # fetch dates
-        df_date = datetime.datetime.fromisoformat(self._usr_start)
-        df_start_year = df_date.year
-        df_date = datetime.datetime.fromisoformat(self._usr_stop)
-        df_stop_year = df_date.year
-            
-        nifc_date_format = '%Y%m%d' 
-        
         # actions as docstring specifies
         df = df[df.geometry != None]
         df = df[df.GIS_ACRES != 0]
-        df = df.set_crs(self._crs, allow_override=True)    
+        df = self.relabel_crs(df)
         
         if df.shape[0] == 0:
             assert 1 == 0, "Not possible"
             sys.exit()
         
-        df['DATE_NOT_NONE'] = df.apply(lambda row : getattr(row, 'DATE_CUR') is not None, axis = 1)
-        df = df[df.DATE_NOT_NONE == True]
-        df['DATE_LEN_VALID'] = df.apply(lambda row : len(getattr(row, 'DATE_CUR')) == 8 , axis = 1)
-        df = df[df.DATE_LEN_VALID == True]
-        df['DATE_CUR_STAMP'] =  df.apply(lambda row : datetime.datetime.strptime(getattr(row, 'DATE_CUR'), nifc_date_format), axis = 1)
+        df = InputReference.normalize_dates(df, InputReference.SOURCE_SCHEMAS["InterAgencyFirePerimeterHistory_All_Years_View"])
         # outcast non matches in year self._usr_start
         df = df[df.DATE_CUR_STAMP.dt.year == int(self._usr_start[:4])]
         
@@ -391,14 +602,27 @@ class InputReference():
             - remove none dates
         
         """
-        df_date = datetime.fromisoformat(self._usr_start)
-        df_year = df_date.year
-        df = df.set_crs(self._crs, allow_override=True)
+        df = self.relabel_crs(df)
         
-        df['DATE_NOT_NONE'] = df.apply(lambda row : getattr(row, 'poly_PolygonDateTime') is not None, axis = 1)
-        df = df[df.DATE_NOT_NONE == True]
-        df['DATE_CUR_STAMP'] =  df.apply(lambda row :  datetime.datetime.fromtimestamp(getattr(row, 'poly_PolygonDateTime') / 1000.0), axis = 1)
+        df = InputReference.normalize_dates(df, InputReference.SOURCE_SCHEMAS["WFIGS_current_interagency_fire_perimeters"])
         # outcast non matches in year self._usr_start
         df = df[df.DATE_CUR_STAMP.dt.year == int(self._usr_start[:4])]  
         
         return df
+    
+    def filter_california_fire_perimeters_all(self, df):
+        """ predefined filter for the california_fire_perimeters_all set
+            - remove invalid geometries
+            - generate 'DATE_CUR_STAMP' col
+            - remove none dates
+            - set crs
+        """
+        df['is_valid_geometry'] = df['geometry'].is_valid
+        df = df[df['is_valid_geometry'] == True]
+        
+        df = InputReference.normalize_dates(df, InputReference.SOURCE_SCHEMAS["california_fire_perimeters_all"])
+        # outcast non matches in year self._usr_start
+        df = df[df.DATE_CUR_STAMP.dt.year == int(self._usr_start[:4])]
+        df = df.to_crs(self._crs)
+        
+        return df
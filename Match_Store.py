@@ -0,0 +1,138 @@
+"""
+Match_Store Class
+
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import numpy as np
+import geopandas as gpd
+
+from Pair_Metrics import PairMetrics
+
+
+class MatchStore():
+    """ MatchStore
+        Snapshot of the last OutputCalculation run of a recurring job (one scope
+        per job, e.g. an NRT region), so the next run only re-matches what changed
+
+        feds polygons are identified by feature id + t, reference polygons by a
+        hash of their geometry + timestamp; each stored feds entry keeps its
+        candidate and selected reference ids, nearest-date distance and the
+        metrics of its selected pairs
+
+        a stored feds entry is reused when the polygon is unchanged, none of its
+        candidates were removed and no newly added reference intersects it;
+        the snapshot is replaced after every run so entries always describe
+        the previous run's reference set
+    """
+
+    # bump when matching/metric definitions change so old snapshots are ignored
+    VERSION = 2
+
+    def __init__(self, path: str, scope: str = "default"):
+
+        # USER INPUT
+        self._path = path
+        self._scope = scope
+
+        # PROGRAM SET
+        self._conn = None
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def scope(self):
+        return self._scope
+
+    def __connect(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self._path, timeout=60)
+            self._conn.execute("CREATE TABLE IF NOT EXISTS runs (scope TEXT PRIMARY KEY, context TEXT NOT NULL, created REAL NOT NULL)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS feds (scope TEXT NOT NULL, feds_id TEXT NOT NULL, entry TEXT NOT NULL, metrics BLOB, PRIMARY KEY (scope, feds_id))")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS refs (scope TEXT NOT NULL, ref_id TEXT NOT NULL, PRIMARY KEY (scope, ref_id))")
+            self._conn.commit()
+        return self._conn
+
+    # IDENTITIES
+    def geometry_hashes(geometries) -> list:
+        """ short content hash per geometry (WKB) """
+        return [hashlib.blake2b(wkb, digest_size=12).hexdigest() for wkb in gpd.GeoSeries(geometries).to_wkb().tolist()]
+
+    def feds_ids(feds_polygons) -> tuple:
+        """ (ids, versions) per feds row: feature id + t identifies the polygon,
+            its geometry hash tells whether it changed
+        """
+        versions = MatchStore.geometry_hashes(feds_polygons.geometry.values)
+        times = feds_polygons['t'].astype(str).tolist()
+        if 'feature_id' in feds_polygons.columns:
+            ids = [f"{feature_id}|{t}" for feature_id, t in zip(feds_polygons['feature_id'].astype(str).tolist(), times)]
+        else:
+            # local sets without feature ids: the geometry is the identity
+            ids = [f"{version}|{t}" for version, t in zip(versions, times)]
+        return ids, versions
+
+    def ref_ids(ref_polygons, ref_times) -> list:
+        """ geometry hash + timestamp per reference row; a changed perimeter gets a new id
+            
+            rows sharing both (e.g. multi-part perimeters split at ingest) are told apart
+            by their occurrence number, so every row keeps its own id
+        """
+        ids, seen = [], {}
+        for geom_hash, stamp in zip(MatchStore.geometry_hashes(ref_polygons.geometry.values),
+                                    np.asarray(ref_times).astype(str).tolist()):
+            ref_id = f"{geom_hash}|{stamp}"
+            seen[ref_id] = seen.get(ref_id, 0) + 1
+            ids.append(ref_id if seen[ref_id] == 1 else f"{ref_id}|{seen[ref_id] - 1}")
+        return ids
+
+    # SNAPSHOT ACCESS
+    def load(self, context: dict):
+        """ (feds_id -> entry dict, set of reference ids) of the last run in this scope;
+            empty if there was none or it ran under a different context (crs, backend, ...)
+        """
+        conn = self.__connect()
+        row = conn.execute("SELECT context FROM runs WHERE scope = ?", (self._scope,)).fetchone()
+        if row is None or json.loads(row[0]) != dict(context, version=MatchStore.VERSION):
+            return {}, set()
+
+        entries = {}
+        for feds_id, entry, metrics in conn.execute("SELECT feds_id, entry, metrics FROM feds WHERE scope = ?", (self._scope,)):
+            entry = json.loads(entry)
+            values = np.frombuffer(metrics, dtype=np.float64).reshape(-1, len(PairMetrics.METRICS)) if metrics else np.zeros((0, len(PairMetrics.METRICS)))
+            entry['metrics'] = [dict(zip(PairMetrics.METRICS, row)) for row in values.tolist()]
+            entries[feds_id] = entry
+        ref_ids = {ref_id for (ref_id,) in conn.execute("SELECT ref_id FROM refs WHERE scope = ?", (self._scope,))}
+
+        return entries, ref_ids
+
+    def save(self, context: dict, entries: dict, ref_ids):
+        """ replace this scope's snapshot; entries: feds_id -> dict with version,
+            candidates, selected (reference ids), min_diff, invalid and metrics
+            (one METRICS dict per selected pair)
+        """
+        conn = self.__connect()
+        rows = []
+        for feds_id, entry in entries.items():
+            metrics = entry.get('metrics', [])
+            blob = np.array([[pair[key] for key in PairMetrics.METRICS] for pair in metrics], dtype=np.float64).tobytes() if metrics else None
+            rows.append((self._scope, feds_id, json.dumps({key: value for key, value in entry.items() if key != 'metrics'}), blob))
+
+        with conn:
+            conn.execute("DELETE FROM feds WHERE scope = ?", (self._scope,))
+            conn.execute("DELETE FROM refs WHERE scope = ?", (self._scope,))
+            conn.executemany("INSERT INTO feds (scope, feds_id, entry, metrics) VALUES (?, ?, ?, ?)", rows)
+            conn.executemany("INSERT INTO refs (scope, ref_id) VALUES (?, ?)", [(self._scope, ref_id) for ref_id in set(ref_ids)])
+            conn.execute("INSERT OR REPLACE INTO runs (scope, context, created) VALUES (?, ?, ?)",
+                         (self._scope, json.dumps(dict(context, version=MatchStore.VERSION)), time.time()))
+        logging.info(f"MatchStore: saved {len(rows)} feds entries for scope {self._scope}")
+
+        return self
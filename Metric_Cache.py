@@ -0,0 +1,151 @@
+"""
+Metric_Cache Class
+
+"""
+
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+import numpy as np
+import geopandas as gpd
+
+from Pair_Metrics import PairMetrics
+
+
+class MetricCache():
+    """ MetricCache
+        On-disk (sqlite) memo of pair metrics, keyed by a blake2b hash of the crs,
+        both geometries' WKB and the metric backend, so a pair evaluated in an
+        earlier run is never overlaid again
+
+        values are stored as one float64 blob per pair (NaN/inf kept exactly);
+        once the file grows past max_bytes, least recently used pairs are evicted
+    """
+
+    # bump when metric definitions change so stale entries stop matching
+    VERSION = 1
+    # stored per pair, in this order
+    VALUES = PairMetrics.METRICS + ['TP', 'FP', 'FN', 'TN', 'area_total']
+    # sqlite host parameter limit safe on all builds
+    CHUNK = 500
+
+    def __init__(self, path: str, max_bytes=512 * 1024**2):
+
+        # USER INPUT
+        self._path = path
+        self._max_bytes = max_bytes
+
+        # PROGRAM SET - connection opened lazily, per process
+        self._conn = None
+        self._pid = None
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def max_bytes(self):
+        return self._max_bytes
+
+    def __getstate__(self):
+        """ pickled for pool workers without the open connection """
+        state = self.__dict__.copy()
+        state['_conn'] = None
+        state['_pid'] = None
+        return state
+
+    def __connect(self):
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(self._path, timeout=60)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS metrics (key TEXT PRIMARY KEY, vals BLOB NOT NULL, used REAL NOT NULL)")
+            self._conn.commit()
+            self._pid = os.getpid()
+        return self._conn
+
+    # KEYS
+    def pair_keys(feds_geoms, ref_geoms, crs, backend: str) -> list:
+        """ stable key per aligned (feds, reference) geometry pair """
+        feds_wkbs = gpd.GeoSeries(feds_geoms).to_wkb().tolist()
+        ref_wkbs = gpd.GeoSeries(ref_geoms).to_wkb().tolist()
+        prefix = f"{MetricCache.VERSION}|{backend}|{crs.to_string()}|".encode("utf-8")
+
+        keys = []
+        for feds_wkb, ref_wkb in zip(feds_wkbs, ref_wkbs):
+            digest = hashlib.blake2b(prefix, digest_size=20)
+            digest.update(len(feds_wkb).to_bytes(8, "little"))
+            digest.update(feds_wkb)
+            digest.update(ref_wkb)
+            keys.append(digest.hexdigest())
+        return keys
+
+    # ACCESS
+    def get_many(self, keys: list) -> dict:
+        """ key -> values dict for every cached key; hits are marked as recently used """
+        conn = self.__connect()
+        unique = list(dict.fromkeys(keys))
+        hits = {}
+        for start in range(0, len(unique), MetricCache.CHUNK):
+            chunk = unique[start:start + MetricCache.CHUNK]
+            rows = conn.execute(f"SELECT key, vals FROM metrics WHERE key IN ({','.join('?' * len(chunk))})", chunk).fetchall()
+            for key, vals in rows:
+                hits[key] = dict(zip(MetricCache.VALUES, np.frombuffer(vals, dtype=np.float64).tolist()))
+
+        if hits:
+            now = time.time()
+            conn.executemany("UPDATE metrics SET used = ? WHERE key = ?", [(now, key) for key in hits])
+            conn.commit()
+        return hits
+
+    def put_many(self, entries: dict):
+        """ store key -> values dict (VALUES keys) """
+        if not entries:
+            return self
+        conn = self.__connect()
+        now = time.time()
+        rows = [(key, np.array([values[name] for name in MetricCache.VALUES], dtype=np.float64).tobytes(), now)
+                for key, values in entries.items()]
+        conn.executemany("INSERT OR REPLACE INTO metrics (key, vals, used) VALUES (?, ?, ?)", rows)
+        conn.commit()
+        return self
+
+    def fetch(self, feds_geoms, ref_geoms, crs, backend: str, compute) -> list:
+        """ values dict per aligned pair; compute(positions) must return values dicts
+            for those positions and is only called for pairs not already cached
+        """
+        keys = MetricCache.pair_keys(feds_geoms, ref_geoms, crs, backend)
+        hits = self.get_many(keys)
+        missing = [i for i, key in enumerate(keys) if key not in hits]
+        logging.info(f"MetricCache: {len(keys) - len(missing)} of {len(keys)} pairs cached")
+
+        computed = compute(missing) if missing else []
+        self.put_many({keys[i]: values for i, values in zip(missing, computed)})
+
+        results = [hits.get(key) for key in keys]
+        for i, values in zip(missing, computed):
+            results[i] = values
+        return results
+
+    def evict(self):
+        """ drop least recently used pairs until the database is under max_bytes """
+        if self._max_bytes is None or not os.path.exists(self._path):
+            return self
+        conn = self.__connect()
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        size = os.path.getsize(self._path)
+        if size <= self._max_bytes:
+            return self
+
+        count = conn.execute("SELECT COUNT(*) FROM metrics").fetchone()[0]
+        # trim to 90% so eviction does not run on every write
+        n_drop = int(np.ceil(count * (1 - 0.9 * self._max_bytes / size)))
+        conn.execute("DELETE FROM metrics WHERE key IN (SELECT key FROM metrics ORDER BY used LIMIT ?)", (n_drop,))
+        conn.commit()
+        conn.execute("VACUUM")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        logging.info(f"MetricCache: evicted {n_drop} pairs")
+        return self
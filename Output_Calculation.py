@@ -3,6 +3,7 @@ Output_Calculation Class
 
 """
 
+import os
 import glob
 import sys
 import logging
@@ -15,6 +16,7 @@ import datetime as dt
 import logging
 import csv
 import rasterio
+import numpy as np
 import matplotlib.pyplot as plt
 
 from tqdm import tqdm
@@ -25,8 +27,13 @@ from botocore.exceptions import NoCredentialsError, PartialCredentialsError, End
 
 # class imports
 import Utilities
+import Parallel_Calculation
 from Input_Reference import InputReference
 from Input_FEDS import InputFEDS
+from Pair_Metrics import PairMetrics
+from Metric_Cache import MetricCache
+from Match_Store import MatchStore
+from Result_Sink import ResultSink
 
 class OutputCalculation():
     
@@ -34,8 +41,20 @@ class OutputCalculation():
         Class representing output calculation of feds_input vs ref_input
     """
     
-    # implemented output formats
-    OUTPUT_FORMATS = ["csv"]
+    # implemented output formats; arrow == Arrow IPC (feather v2) file
+    OUTPUT_FORMATS = ["csv", "parquet", "geoparquet", "arrow"]
+    # polygon columns of parquet / arrow outputs: WKB, or only the source ids
+    GEOMETRY_OUTPUTS = ["wkb", "ids"]
+    # results table columns, in output order
+    RESULT_COLUMNS = ['feds_index', 'feds_polygon', 'ref_index', 'ref_polygon', 'incident_name', 'feds_timestamp', 'ref_timestamp'] + PairMetrics.METRICS
+    # matching engines: bulk spatial index query or legacy per-polygon loop (reference mode)
+    MATCH_MODES = ["bulk", "loop"]
+    # metric engines: vectorized over all pairs at once, or one PairMetrics per pair
+    CALC_MODES = ["batch", "pairwise"]
+    # metric area backends: overlay pipeline (difference overlays), areas derived from the
+    # intersection, burned areas and union envelope (see PairMetrics.analytic_metrics),
+    # or approximate pixel counts on a per pair grid (see PairMetrics.raster_metrics)
+    METRIC_BACKENDS = ["overlay", "analytic", "raster"]
     
     def __init__(self, 
                  feds_input: InputFEDS, 
@@ -44,7 +63,19 @@ class OutputCalculation():
                  output_maap_url: str,
                  day_search_range: int,
                  print_on: bool,
-                 plot_on: bool):
+                 plot_on: bool,
+                 match_mode: str = "bulk",
+                 calc_mode: str = "batch",
+                 workers: int = 1,
+                 use_metric_cache: bool = True,
+                 metric_cache = None,
+                 match_store = None,
+                 metric_backend: str = "overlay",
+                 debug_geometries: bool = False,
+                 raster_resolution: float = None,
+                 geometry_output: str = "wkb",
+                 stream_batch_size: int = None,
+                 s3_endpoint_url: str = None):
 
         # USER INPUT / FILTERS
         self._feds_input = feds_input
@@ -54,10 +85,24 @@ class OutputCalculation():
         self._day_search_range = day_search_range
         self._print_on = print_on
         self._plot_on = plot_on
+        self._match_mode = match_mode
+        self._calc_mode = calc_mode
+        self._workers = workers
+        self._use_metric_cache = use_metric_cache
+        self._metric_cache = metric_cache
+        self._match_store = match_store
+        self._metric_backend = metric_backend
+        self._debug_on = debug_geometries
+        self._raster_resolution = raster_resolution
+        self._geometry_output = geometry_output
+        self._stream_batch_size = stream_batch_size
+        self._s3_endpoint_url = s3_endpoint_url
         
         # PROGRAM SET
         self._polygons = None
         self._calculations = None 
+        self._debug_geometries = None
+        self._error_bounds = None
         self._s3_url = None
         
         # SINGLE SETUP
@@ -75,56 +120,85 @@ class OutputCalculation():
     def polygons(self):
         return self._polygons
     
+    @property
+    def error_bounds(self):
+        """ per calculation row worst case area error of the raster backend (None if unmatched) """
+        return self._error_bounds
+    
+    @property
+    def debug_geometries(self):
+        """ per matched pair confusion geometries (debug_geometries=True only) """
+        return self._debug_geometries
+    
     # MASTER SET UP FUNCTION
     def __set_up_master(self):
         """ set up outputcalc instance with checks and generations; run main calculations"""
         
         assert self._output_format in OutputCalculation.OUTPUT_FORMATS, f"Provided output format {self._output_format} is NOT VALID, select only from implemented formats: {OutputCalculation.OUTPUT_FORMATS}"
-        assert self.__set_up_valid_maap_url, f"Invalid URL: see assertions and/or possibly missing s3://maap-ops-workspace/shared/ in url. Provided url: {self._output_maap_url}"
+        assert self._geometry_output in OutputCalculation.GEOMETRY_OUTPUTS, f"Provided geometry output {self._geometry_output} is NOT VALID, select only from: {OutputCalculation.GEOMETRY_OUTPUTS}"
+        assert self.__set_up_valid_maap_url(), f"Invalid URL: see assertions and/or possibly missing s3://maap-ops-workspace/shared/ in url. Provided url: {self._output_maap_url}"
         assert self._day_search_range >= 0, f"Invalid provided day range {self._day_search_range}. Must be x >= 0"
+        assert self._match_mode in OutputCalculation.MATCH_MODES, f"Provided match mode {self._match_mode} is NOT VALID, select only from: {OutputCalculation.MATCH_MODES}"
+        assert self._calc_mode in OutputCalculation.CALC_MODES, f"Provided calc mode {self._calc_mode} is NOT VALID, select only from: {OutputCalculation.CALC_MODES}"
+        assert self._metric_backend in OutputCalculation.METRIC_BACKENDS, f"Provided metric backend {self._metric_backend} is NOT VALID, select only from: {OutputCalculation.METRIC_BACKENDS}"
+        assert self._raster_resolution is None or self._raster_resolution > 0, f"Invalid raster resolution {self._raster_resolution}. Must be None or x > 0"
+        if self._stream_batch_size is not None:
+            assert isinstance(self._stream_batch_size, int) and self._stream_batch_size >= 1, f"Invalid stream batch size {self._stream_batch_size}. Must be None or an integer x >= 1"
+            assert not (self._print_on or self._plot_on or self._debug_on), "FATAL: print_on / plot_on / debug_geometries need all results in memory; disable them when streaming"
+            assert self._match_store is None, "FATAL: match_store runs cannot be streamed"
+            assert self._workers == 1, "FATAL: streamed runs are single process; set workers=1 or stream_batch_size=None"
+        assert isinstance(self._workers, int) and self._workers >= 1, f"Invalid worker count {self._workers}. Must be an integer x >= 1"
+        assert self._match_store is None or self._workers == 1, "FATAL: match_store runs are single process; set workers=1 or match_store=None"
         assert self._feds_input.crs == self._ref_input.crs, f"Mismatching CRS for FEDS and reference; must correct before continuing: feds: {self._feds_input.crs} vs ref: {self._ref_input.crs}"
         
         # run calculations
         self.__run_calculations() # --> internally finds best matches and runs on the best matches
         
+        # streamed runs wrote their output batch by batch and keep no results
+        if self._stream_batch_size is not None:
+            return self
+        
+        if self._metric_backend == "raster":
+            self.__set_error_bounds()
+        if self._debug_on:
+            self.__set_debug_geometries()
+        
         if self._print_on:
             self.__print_output()
         if self._plot_on:
             self.__plot_output()
           
-        # write to csv
-        self.write_to_csv()
+        # write in the requested format
+        self.write_output()
         
         return self
     
-    def __set_up_valid_maap_url(self):
-        """ given a maap-ops-workspace url, check if valid with naming + s3 access"""
+    def __set_up_valid_maap_url(self) -> bool:
+        """ check the output location before any work is done
+            s3 url: must be under s3://maap-ops-workspace/shared/ (unless a custom endpoint
+                    is used) and its parent prefix must exist; one MaxKeys=1 request over a
+                    pooled client, cached per bucket + prefix for the process
+            local path: the parent directory must exist
+        """
+        url = self._output_maap_url
+        
+        if not url.startswith("s3://"):
+            parent = os.path.dirname(os.path.abspath(url))
+            if not os.path.isdir(parent):
+                logging.error(f"ERR: output directory {parent} does not exist; invalid path passed {url}")
+                return False
+            return True
         
-        maap_ops_contained ="s3://maap-ops-workspace/shared/" in self._output_maap_url
-        s3_url = self._output_maap_url 
+        if self._s3_endpoint_url is None and "s3://maap-ops-workspace/shared/" not in url:
+            logging.error(f"ERR: output url must be under s3://maap-ops-workspace/shared/; invalid url passed {url}")
+            return False
         
         try:
-            s3 = boto3.client('s3')
-            bucket, key, nested = Utilities.split_s3_path(s3_url)
-
-            if nested:
-                # iter and locate bucket
-                assert len(bucket) == 2, "FATAL: bucket + prefix design should only be len2"
-                response = s3.list_objects_v2(Bucket=bucket[0], Prefix=bucket[1])
-                folders = set(object['Key'][:object['Key'].rfind('/')+1] for object in response['Contents'] if '/' in object['Key'])
-                if bucket[1] in folders: 
-                    return True and maap_ops_contained
-                else:
-                    logging.error(f"ERR: prefix {bucket[1]} not located; invalid url passed {self._output_maap_url}")
-                    return False
-            else:
-                s3 = boto3.resource('s3')
-                obj = s3.Bucket(bucket)
-            
-                if bucket_obj.creation_date:
-                    return True and maap_ops_contained
-                else:
-                    return False
+            bucket, key = ResultSink.split_url(url)
+            prefix = key[:key.rfind('/')+1]
+            if Utilities.s3_prefix_exists(bucket, prefix, self._s3_endpoint_url):
+                return True
+            logging.error(f"ERR: prefix {prefix} not located in bucket {bucket}; invalid url passed {url}")
         
         except NoCredentialsError:
             print("AWS credentials not found. Please configure your AWS credentials.")
@@ -139,53 +213,27 @@ class OutputCalculation():
     
     def __run_calculations(self):
         """ orchestrate all calculations; either return back to enable output write or write here"""
+        if self._stream_batch_size is not None:
+            self.__streaming_calculations()
+        elif self._match_store is not None:
+            self.__incremental_calculations()
+        elif self._workers > 1:
+            self.__parallel_calculations()
+        else:
+            self.__serial_calculations()
+        
+        # keep the on-disk metric cache under its size cap, once per run
+        if self.__get_metric_cache() is not None:
+            self.__get_metric_cache().evict()
+        
+        return self
+    
+    def __serial_calculations(self):
+        """ match + metrics in the calling process """
         # feds polygon index mapping to reference index of closest type (or None)
         index_pairs = OutputCalculation.closest_date_match(self)
         
-        calculations = { 'index_pairs': index_pairs,
-                         'ratio': [],
-                         'accuracy': [],
-                         'precision': [],
-                         'recall': [],
-                         'iou': [],
-                         'f1': [],
-                         'symm_ratio': []
-                       }
-                                 
-        for feds_ref_pair in index_pairs: # e.g. (4, 1) <- feds index 4 best matches with ref poly at index 1
-                                 
-            skip_first_key = True
-                                 
-            # no reference polygon --> attach none to tracked calculations
-            if (feds_ref_pair[1] is None):
-                for key in calculations:
-                    if skip_first_key:
-                        skip_first_key = False
-                        continue  # Skip the first key
-                    calculations[key].append(None)
-                continue
-           
-            # fetch corresponding polygons
-            feds_poly = self._feds_input.polygons[self._feds_input.polygons['index'] == feds_ref_pair[0]]
-            ref_poly = self._ref_input.polygons[self._ref_input.polygons['index'] == feds_ref_pair[1]]
-               
-            # run through calculations
-            ratio = OutputCalculation.ratioCalculation(feds_poly, ref_poly)
-            accuracy = OutputCalculation.accuracyCalculation(feds_poly, ref_poly)
-            precision = OutputCalculation.precisionCalculation(feds_poly, ref_poly)
-            recall = OutputCalculation.recallCalculation(feds_poly, ref_poly)
-            iou= OutputCalculation.IOUCalculation(feds_poly, ref_poly)
-            f1 = OutputCalculation.f1ScoreCalculation(feds_poly, ref_poly) 
-            symm_ratio = OutputCalculation.symmDiffRatioCalculation(feds_poly, ref_poly) # indep calc
-            
-            # add to tracking arr                    
-            calculations['ratio'].append(ratio)
-            calculations['accuracy'].append(accuracy)
-            calculations['precision'].append(precision)
-            calculations['recall'].append(recall)
-            calculations['iou'].append(iou)
-            calculations['f1'].append(f1)
-            calculations['symm_ratio'].append(symm_ratio)
+        calculations = self.__metric_calculations(index_pairs)
             
         # verify same sizing
         for key in calculations: 
@@ -196,6 +244,353 @@ class OutputCalculation():
         logging.info('Calculations complete!')
         
         return self
+    
+    def __streaming_calculations(self):
+        """ match, evaluate and write stream_batch_size feds polygons at a time through
+            a ResultSink; only one batch of pairs is ever held, whatever the run size,
+            and each batch is flushed, so finished batches survive a crash
+        """
+        feds_index = self._feds_input.polygon_index
+        ref_index = self._ref_input.polygon_index
+        feds_polygons = feds_index.polygons
+        ref_polygons = ref_index.polygons
+        assert feds_index.times is not None and ref_index.times is not None, "FATAL: polygon indices built without a time column; cannot date match"
+        
+        n_batches = max(1, int(np.ceil(feds_index.size / self._stream_batch_size)))
+        logging.info(f"Streaming {feds_index.size} feds polygons in {n_batches} batches to {self._output_maap_url}")
+        
+        with self.__set_up_output_maap_file(single_file=False) as sink:
+            for batch in np.array_split(np.arange(feds_index.size), n_batches):
+                # PHASE 1 + 2 on the batch, re-keyed to global feds positions
+                if self._match_mode == "loop":
+                    candidates = OutputCalculation.intersect_candidates_loop(feds_polygons.iloc[batch], ref_polygons)
+                else:
+                    candidates = OutputCalculation.intersect_candidates(feds_polygons.iloc[batch], ref_polygons)
+                selected, out_of_range, invalid = OutputCalculation.nearest_date_candidates(feds_index.times[batch], 
+                                                                                            ref_index.times, 
+                                                                                            candidates, 
+                                                                                            self._day_search_range)
+                index_pairs = self.__flatten_matches({int(batch[i]): refs for i, refs in candidates.items()},
+                                                     {int(batch[i]): refs for i, refs in selected.items()},
+                                                     [int(batch[i]) for i in out_of_range],
+                                                     [int(batch[i]) for i in invalid],
+                                                     positions=batch)
+                
+                calculations = self.__metric_calculations(index_pairs)
+                # every finished batch is made durable before the next one starts
+                sink.write(self.output_table(calculations)).flush()
+        
+        print(f"{self._output_format.upper()} output streamed! Check {self._output_maap_url} for results. NOTE: None result rows were excluded.")
+        logging.info('Calculations complete!')
+        
+        return self
+    
+    def __metric_calculations(self, index_pairs) -> dict:
+        """ calculations for all matched pairs; the metric cache is consulted
+            first so only pairs never evaluated before reach the overlays
+        """
+        feds_index = self._feds_input.polygon_index
+        ref_index = self._ref_input.polygon_index
+        matched = [pair for pair in index_pairs if pair[1] is not None]
+        
+        pair_metrics = {}
+        if len(matched):
+            feds_positions = feds_index.positions([feds_key for feds_key, _ in matched])
+            ref_positions = ref_index.positions([ref_key for _, ref_key in matched])
+            values = OutputCalculation.pair_metric_values(feds_index.geometries[feds_positions], 
+                                                          ref_index.geometries[ref_positions], 
+                                                          self._feds_input.crs, 
+                                                          self._calc_mode, 
+                                                          self.__get_metric_cache(), 
+                                                          self._metric_backend, 
+                                                          self._raster_resolution)
+            pair_metrics = dict(zip(zip(feds_positions.tolist(), ref_positions.tolist()), values))
+        
+        return self.__pair_calculations(index_pairs, pair_metrics)
+    
+    def __pair_calculations(self, index_pairs, pair_metrics: dict) -> dict:
+        """ calculations dict for index_pairs; pair_metrics maps
+            (feds position, reference position) -> metrics of every matched pair
+        """
+        feds_index = self._feds_input.polygon_index
+        ref_index = self._ref_input.polygon_index
+        
+        calculations = {'index_pairs': index_pairs}
+        for key in PairMetrics.METRICS:
+            calculations[key] = [None] * len(index_pairs)
+        
+        for i, (feds_key, ref_key) in enumerate(index_pairs):
+            # no reference polygon --> attach none to tracked calculations
+            if ref_key is None:
+                continue
+            metrics = pair_metrics[(feds_index.position(feds_key), ref_index.position(ref_key))]
+            for key in PairMetrics.METRICS:
+                calculations[key][i] = metrics[key]
+        
+        return calculations
+    
+    def __incremental_calculations(self):
+        """ match + score only what changed since the last run in the match store scope:
+            new/changed feds polygons, feds polygons whose candidates were removed, and
+            feds polygons intersecting newly added references; all other feds polygons
+            reuse their stored matches + metrics (see Match_Store.py)
+        """
+        feds_index = self._feds_input.polygon_index
+        ref_index = self._ref_input.polygon_index
+        feds_polygons = feds_index.polygons
+        ref_polygons = ref_index.polygons
+        
+        context = {"crs": self._feds_input.crs.to_string(), "backend": OutputCalculation.backend_key(self._metric_backend, self._raster_resolution)}
+        stored, stored_refs = self._match_store.load(context)
+        
+        feds_ids, feds_versions = MatchStore.feds_ids(feds_polygons)
+        ref_ids = MatchStore.ref_ids(ref_polygons, ref_index.times)
+        ref_pos_of = {ref_id: pos for pos, ref_id in enumerate(ref_ids)}
+        assert len(ref_pos_of) == len(ref_ids), "FATAL: duplicate reference ids; stored matches cannot be mapped back to rows"
+        removed_refs = stored_refs - set(ref_pos_of)
+        new_ref_pos = np.array([pos for pos, ref_id in enumerate(ref_ids) if ref_id not in stored_refs], dtype=np.int64)
+        
+        # reusable: same polygon as last run, same ids unique within this run, no candidate removed
+        id_counts = {}
+        for feds_id in feds_ids:
+            id_counts[feds_id] = id_counts.get(feds_id, 0) + 1
+        clean = [pos for pos, feds_id in enumerate(feds_ids) 
+                 if feds_id in stored 
+                 and id_counts[feds_id] == 1
+                 and stored[feds_id]['version'] == feds_versions[pos]
+                 and not removed_refs.intersection(stored[feds_id]['candidates'])]
+        
+        # ... and not touched by any newly added reference
+        if len(clean) and new_ref_pos.size:
+            touched = OutputCalculation.intersect_candidates(feds_polygons.iloc[clean], ref_polygons.iloc[new_ref_pos])
+            clean = [pos for i, pos in enumerate(clean) if i not in touched]
+        clean_set = set(clean)
+        dirty = np.array([pos for pos in range(feds_index.size) if pos not in clean_set], dtype=np.int64)
+        logging.info(f"MatchStore: reusing {len(clean)} feds polygons, matching {dirty.size} new/changed against {new_ref_pos.size} new references")
+        
+        candidates, selected, out_of_range, invalid, pair_metrics = {}, {}, [], [], {}
+        
+        # REUSED
+        for pos in clean:
+            entry = stored[feds_ids[pos]]
+            if entry['invalid']:
+                invalid.append(pos)
+                continue
+            if not entry['candidates']:
+                continue
+            candidates[pos] = [ref_pos_of[ref_id] for ref_id in entry['candidates']]
+            selected[pos] = [ref_pos_of[ref_id] for ref_id in entry['selected']]
+            if entry['min_diff'] > pd.Timedelta(days=self._day_search_range).value:
+                out_of_range.append(pos)
+            for r_pos, metrics in zip(selected[pos], entry['metrics']):
+                pair_metrics[(pos, r_pos)] = metrics
+        
+        # NEW / CHANGED
+        if dirty.size:
+            dirty_polygons = feds_polygons.iloc[dirty]
+            if self._match_mode == "loop":
+                dirty_candidates = OutputCalculation.intersect_candidates_loop(dirty_polygons, ref_polygons)
+            else:
+                dirty_candidates = OutputCalculation.intersect_candidates(dirty_polygons, ref_polygons)
+            dirty_selected, dirty_out_of_range, dirty_invalid = OutputCalculation.nearest_date_candidates(feds_index.times[dirty], 
+                                                                                                          ref_index.times, 
+                                                                                                          dirty_candidates, 
+                                                                                                          self._day_search_range)
+            candidates.update({int(dirty[i]): refs for i, refs in dirty_candidates.items()})
+            selected.update({int(dirty[i]): refs for i, refs in dirty_selected.items()})
+            out_of_range.extend(int(dirty[i]) for i in dirty_out_of_range)
+            invalid.extend(int(dirty[i]) for i in dirty_invalid)
+            
+            pairs = [(int(dirty[i]), r_pos) for i in sorted(dirty_selected) for r_pos in dirty_selected[i]]
+            if len(pairs):
+                values = OutputCalculation.pair_metric_values(feds_index.geometries[[f_pos for f_pos, _ in pairs]],
+                                                              ref_index.geometries[[r_pos for _, r_pos in pairs]],
+                                                              self._feds_input.crs,
+                                                              self._calc_mode,
+                                                              self.__get_metric_cache(),
+                                                              self._metric_backend,
+                                                              self._raster_resolution)
+                pair_metrics.update(zip(pairs, values))
+        
+        index_pairs = self.__flatten_matches(candidates, selected, sorted(out_of_range), sorted(invalid))
+        
+        calculations = self.__pair_calculations(index_pairs, pair_metrics)
+        
+        # SNAPSHOT FOR THE NEXT RUN
+        invalid = set(invalid)
+        entries = {}
+        for pos, feds_id in enumerate(feds_ids):
+            if id_counts[feds_id] != 1:
+                continue
+            chosen = selected.get(pos, [])
+            entries[feds_id] = {'version': feds_versions[pos],
+                                'invalid': pos in invalid,
+                                'candidates': [ref_ids[r_pos] for r_pos in candidates.get(pos, [])],
+                                'selected': [ref_ids[r_pos] for r_pos in chosen],
+                                'min_diff': int(abs(ref_index.times[chosen[0]] - feds_index.times[pos]).astype(np.int64)) if len(chosen) else None,
+                                'metrics': [pair_metrics[(pos, r_pos)] for r_pos in chosen]}
+        self._match_store.save(context, entries, ref_ids)
+        
+        # persist calcs in dict form
+        self._calculations = calculations
+        logging.info('Calculations complete!')
+        
+        return self
+    
+    def __set_error_bounds(self):
+        """ raster backend: area error bound of every matched calculation row """
+        feds_index = self._feds_input.polygon_index
+        ref_index = self._ref_input.polygon_index
+        index_pairs = self._calculations['index_pairs']
+        matched = [i for i, pair in enumerate(index_pairs) if pair[1] is not None]
+        
+        self._error_bounds = [None] * len(index_pairs)
+        if not len(matched):
+            return self
+        bounds = PairMetrics.raster_error_bounds(feds_index.geometries[feds_index.positions([index_pairs[i][0] for i in matched])],
+                                                 ref_index.geometries[ref_index.positions([index_pairs[i][1] for i in matched])],
+                                                 self._raster_resolution)
+        for i, bound in zip(matched, bounds.tolist()):
+            self._error_bounds[i] = bound
+        
+        return self
+    
+    def recheck_flagged(self, max_rel_error: float = 0.1, backend: str = "overlay") -> list:
+        """ re-evaluate raster rows whose error bound exceeds max_rel_error of the
+            smaller burned area with an exact vector backend ("overlay" or "analytic");
+            their calculations are replaced and error bounds set to 0
+            
+            returns the re-checked calculation row numbers; call write_to_csv to persist
+        """
+        assert self._metric_backend == "raster", "FATAL: only raster backend results carry error bounds to re-check"
+        assert backend in ["overlay", "analytic"], f"Provided recheck backend {backend} is NOT VALID, select only from: ['overlay', 'analytic']"
+        
+        feds_index = self._feds_input.polygon_index
+        ref_index = self._ref_input.polygon_index
+        index_pairs = self._calculations['index_pairs']
+        matched = [i for i, pair in enumerate(index_pairs) if pair[1] is not None]
+        if not len(matched):
+            return []
+        
+        feds_geoms = feds_index.geometries[feds_index.positions([index_pairs[i][0] for i in matched])]
+        ref_geoms = ref_index.geometries[ref_index.positions([index_pairs[i][1] for i in matched])]
+        min_area = np.minimum(gpd.GeoSeries(feds_geoms).area.values, gpd.GeoSeries(ref_geoms).area.values)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            flagged = ~(np.array([self._error_bounds[i] for i in matched]) <= max_rel_error * min_area)
+        flagged = np.flatnonzero(flagged)
+        logging.info(f"Re-checking {flagged.size} of {len(matched)} raster pairs with the {backend} backend")
+        if not flagged.size:
+            return []
+        
+        values = OutputCalculation.pair_metric_values(feds_geoms[flagged], 
+                                                      ref_geoms[flagged], 
+                                                      self._feds_input.crs, 
+                                                      self._calc_mode, 
+                                                      self.__get_metric_cache(), 
+                                                      backend)
+        rows = [matched[pos] for pos in flagged.tolist()]
+        for i, pair_values in zip(rows, values):
+            for key in PairMetrics.METRICS:
+                self._calculations[key][i] = pair_values[key]
+            self._error_bounds[i] = 0.0
+        
+        return rows
+    
+    def __set_debug_geometries(self):
+        """ confusion geometries of every matched pair, keyed by feds/reference index """
+        feds_index = self._feds_input.polygon_index
+        ref_index = self._ref_input.polygon_index
+        matched = [pair for pair in self._calculations['index_pairs'] if pair[1] is not None]
+        
+        debug = PairMetrics.debug_geometries(feds_index.geometries[feds_index.positions([feds_key for feds_key, _ in matched])],
+                                             ref_index.geometries[ref_index.positions([ref_key for _, ref_key in matched])],
+                                             self._feds_input.crs)
+        debug.insert(0, 'feds_index', [feds_key for feds_key, _ in matched])
+        debug.insert(1, 'ref_index', [ref_key for _, ref_key in matched])
+        self._debug_geometries = debug
+        
+        return self
+    
+    def __get_metric_cache(self):
+        """ user passed metric cache or the default one in the repo data dir; None if disabled """
+        if not self._use_metric_cache:
+            return None
+        if self._metric_cache is None:
+            script_dir = os.path.dirname(os.path.abspath(__file__))
+            self._metric_cache = MetricCache(os.path.join(script_dir, "data", "cache", "metrics.sqlite"))
+        return self._metric_cache
+    
+    def backend_key(backend: str, raster_resolution=None) -> str:
+        """ backend name as stored by the metric cache / match store; raster values
+            depend on the grid, so its resolution is part of the key
+        """
+        if backend == "raster":
+            return f"raster:{'auto' if raster_resolution is None else float(raster_resolution)}"
+        return backend
+    
+    def pair_metric_values(feds_geoms, ref_geoms, crs, calc_mode: str, metric_cache=None, backend: str = "overlay", raster_resolution=None) -> list:
+        """ metrics + component areas (MetricCache.VALUES) for aligned geometry pairs,
+            served from metric_cache where possible
+            
+            backend "raster": approximate pixel counts, one grid per pair (PairMetrics.raster_metrics)
+            backend "analytic": areas only, always vectorized (PairMetrics.analytic_metrics)
+            backend "overlay" + calc_mode "batch": one vectorized pass (PairMetrics.batch_metrics)
+            backend "overlay" + calc_mode "pairwise": one overlay-based PairMetrics per pair
+        """
+        def compute(positions):
+            if backend == "raster":
+                results = PairMetrics.raster_metrics(feds_geoms[positions], ref_geoms[positions], raster_resolution)
+                return [dict(zip(MetricCache.VALUES, row)) for row in zip(*[results[name].tolist() for name in MetricCache.VALUES])]
+            if backend == "analytic" or calc_mode == "batch":
+                evaluate = PairMetrics.analytic_metrics if backend == "analytic" else PairMetrics.batch_metrics
+                results = evaluate(feds_geoms[positions], ref_geoms[positions])
+                return [dict(zip(MetricCache.VALUES, row)) for row in zip(*[results[name].tolist() for name in MetricCache.VALUES])]
+            
+            values = []
+            for pos in positions:
+                feds_poly = gpd.GeoDataFrame(geometry=[feds_geoms[pos]], crs=crs)
+                ref_poly = gpd.GeoDataFrame(geometry=[ref_geoms[pos]], crs=crs)
+                # run through calculations - each overlay computed once per pair
+                pair_metrics = PairMetrics(feds_poly, ref_poly)
+                values.append(dict(pair_metrics.metrics(), 
+                                   TP=pair_metrics.TP, 
+                                   FP=pair_metrics.FP, 
+                                   FN=pair_metrics.FN, 
+                                   TN=pair_metrics.TN, 
+                                   area_total=pair_metrics.area_total))
+            return values
+        
+        if metric_cache is None:
+            return compute(list(range(len(feds_geoms))))
+        # batch and pairwise agree, so calc_mode is not part of the key; backends do not
+        return metric_cache.fetch(feds_geoms, ref_geoms, crs, OutputCalculation.backend_key(backend, raster_resolution), compute)
+    
+    def __parallel_calculations(self):
+        """ matching + metrics in a process pool (see Parallel_Calculation.py);
+            same pairs, order and values as the serial path
+        """
+        feds_index = self._feds_input.polygon_index
+        ref_index = self._ref_input.polygon_index
+        
+        candidates, selected, out_of_range, invalid, pair_metrics = Parallel_Calculation.run_parallel(feds_index,
+                                                                                                      ref_index,
+                                                                                                      self._feds_input.crs,
+                                                                                                      self._workers,
+                                                                                                      self._match_mode,
+                                                                                                      self._calc_mode,
+                                                                                                      self._day_search_range,
+                                                                                                      self.__get_metric_cache(),
+                                                                                                      self._metric_backend,
+                                                                                                      self._raster_resolution)
+        index_pairs = self.__flatten_matches(candidates, selected, out_of_range, invalid)
+        
+        calculations = self.__pair_calculations(index_pairs, pair_metrics)
+        
+        # persist calcs in dict form
+        self._calculations = calculations
+        logging.info('Calculations complete!')
+        
+        return self
                                  
     def __print_output(self):
         """ print output using the _calculations var"""
@@ -235,13 +630,11 @@ class OutputCalculation():
         calculations = self._calculations
         
         # poly + time fetch
-        feds_polygons = self._feds_input.polygons
-        ref_polygons = self._ref_input.polygons
+        feds_index = self._feds_input.polygon_index
+        ref_index = self._ref_input.polygon_index
         
         # TODO generate series of plots for all non-None results
-        for pair in calculations['index_pairs']:
-            # coresponding index
-            i = calculations['index_pairs'].index(pair)
+        for i, pair in enumerate(calculations['index_pairs']):
             # ignore none value results
             if all( value is None for value in 
                     [
@@ -257,15 +650,11 @@ class OutputCalculation():
                     continue
             
             # poly + time extraction
-            feds_poly = feds_polygons[feds_polygons['index'] == calculations['index_pairs'][i][0]]
-            ref_poly = ref_polygons[ref_polygons['index'] == calculations['index_pairs'][i][1]]
-            feds_time = feds_poly.t.values[0]
-            ref_time = ref_poly['DATE_CUR_STAMP'].values[0]
-        
-            # apply indices
             index1, index2 = pair
-            feds_poly = feds_polygons[feds_polygons['index'] == index1]
-            ref_poly = ref_polygons[ref_polygons['index'] == index2]
+            feds_poly = feds_index.frame(index1)
+            ref_poly = ref_index.frame(index2)
+            feds_time = feds_index.value(index1, 't')
+            ref_time = ref_index.value(index2, 'DATE_CUR_STAMP')
 
             # new fig per pair
             fig, ax = plt.subplots(figsize=(15, 15))
@@ -283,19 +672,15 @@ class OutputCalculation():
         
         print("PLOTTING COMPLETE")
     
-    def __set_up_output_maap_file(self):
-        """ with a valid maap-ops-workspace url (bucket + key) --> make an object in the bucket with prefix; rechecks access should any edge cases occur (e.g. aws going down/skipping)"""
-        
-        # test out bucket access and put in object if available
-        # s3_url = self._output_maap_url 
-                                 
-        # TODO: into nested bucket
-        # s3.put_object(
-            # Bucket=buckey,
-            # Key=key+'.'+{self._output_format} # since only name is passed, must add on prefix
-        # )
-                                 
-        return self
+    def __set_up_output_maap_file(self, single_file: bool = True) -> ResultSink:
+        """ result sink for output_maap_url: a local path, or an s3:// url written
+            by multipart upload (s3_endpoint_url for S3-compatible stores)
+            single_file: one output file (otherwise a directory of parts for columnar formats)
+        """
+        return ResultSink(self._output_maap_url, 
+                          self._output_format, 
+                          single_file=single_file, 
+                          endpoint_url=self._s3_endpoint_url)
     
     def export_polygons(self, polygons, path: str):
         """ export polygons to designated paths by user
@@ -320,47 +705,108 @@ class OutputCalculation():
             returns: dataset with d->m->y closest matches
         """
 
-        # timestamp = timestamp.item()
-        transformed = dataset.DATE_CUR_STAMP.tolist()
-        clos_dict = {
-          abs(timestamp.timestamp() - date.timestamp()) : date
-          for date in transformed
-        }
-
-        res = clos_dict[min(clos_dict.keys())]
+        # vectorized over the column; ties keep the later row, as the old dict did
+        stamps = dataset.DATE_CUR_STAMP.values.astype('datetime64[ns]')
+        diffs = np.abs(stamps - np.datetime64(timestamp, 'ns'))
+        res = stamps[len(diffs) - 1 - np.argmin(diffs[::-1])]
 
-        # check on dayrange flexibility - trigger outer exception if failing
-        if abs(timestamp.day - res.day) > dayrange and dayrange == 7:
+        # nearest date outside dayrange days: caller decides what to keep
+        if diffs.min() > np.timedelta64(pd.Timedelta(days=dayrange)):
             return None
 
-        if not abs(timestamp.day - res.day) <= dayrange: 
-            logging.error("WARNING in get_nearest_by_date: No dates found in specified range for this reference collection; try a more flexible range by adjusting `dayrange` var")
         # fetch rows with res timestamp
-        finalized = dataset[dataset['DATE_CUR_STAMP'] == res]
+        finalized = dataset[stamps == res]
 
         return finalized
+    
+    def nearest_date_candidates(feds_times, ref_times, candidates: dict, dayrange: int):
+        """ PHASE 2 (vectorized): nearest reference date per feds polygon over all
+            candidate pairs at once
+            
+            feds_times / ref_times: datetime64 per row position (PolygonIndex.times)
+            candidates: feds position -> reference positions (see intersect_candidates)
+            
+            per feds polygon keeps the candidates sharing the nearest date (ties on
+            distance resolve to the later candidate, as get_nearest_by_date); feds
+            polygons whose nearest date is more than dayrange days away (true time
+            difference) are reported so the caller can flag them
+            
+            returns (dict feds position -> kept reference positions, 
+                     feds positions whose nearest date was out of range, 
+                     feds positions with no valid timestamp)
+        """
+        feds_order = np.array(sorted(candidates.keys()), dtype=np.int64)
+        invalid = feds_order[np.isnat(feds_times[feds_order])] if feds_order.size else feds_order
+        feds_order = feds_order[~np.isnat(feds_times[feds_order])] if feds_order.size else feds_order
+        if feds_order.size == 0:
+            return {}, [], invalid.tolist()
+        
+        counts = np.array([len(candidates[pos]) for pos in feds_order], dtype=np.int64)
+        pair_feds = np.repeat(feds_order, counts)
+        pair_ref = np.concatenate([np.asarray(candidates[pos], dtype=np.int64) for pos in feds_order])
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        
+        pair_times = ref_times[pair_ref]
+        diffs = np.abs(pair_times - feds_times[pair_feds]).astype(np.int64)
+        
+        # nearest distance per feds polygon + the later pair holding it
+        min_diffs = np.minimum.reduceat(diffs, starts)
+        is_min = diffs == np.repeat(min_diffs, counts)
+        last_min = np.maximum.reduceat(np.where(is_min, np.arange(diffs.size), -1), starts)
+        nearest = np.repeat(pair_times[last_min], counts)
+        
+        in_range = min_diffs <= pd.Timedelta(days=dayrange).value
+        keep = pair_times == nearest
+        
+        kept_feds = pair_feds[keep]
+        kept_ref = pair_ref[keep]
+        bounds = np.searchsorted(kept_feds, feds_order, side='left'), np.searchsorted(kept_feds, feds_order, side='right')
+        selected = {int(pos): kept_ref[lo:hi].tolist() for pos, lo, hi in zip(feds_order, *bounds)}
+        
+        return selected, feds_order[~in_range].tolist(), invalid.tolist()
                                  
                                  
-    def closest_date_match(self) -> list:
-        """ given the feds and reference polygons
-            return list mapping the feds input to 
-            closest reference polygons
+    def intersect_candidates(feds_polygons, ref_polygons) -> dict:
+        """ PHASE 1 (bulk): one spatial index over the reference set, queried once
+            with every feds geometry
+            
+            returns dict mapping feds position -> reference positions (ascending),
+            only for feds polygons with at least one intersecting reference
         """
+        if feds_polygons.empty or ref_polygons.empty:
+            return {}
         
-        # store as (feds_poly index, ref_polygon index)
-        matches = []
-
-        # fetch polygons
-        feds_polygons = self._feds_input.polygons
-        ref_polygons = self._ref_input.polygons
+        feds_pos, ref_pos = Utilities.sindex_query_bulk(ref_polygons.sindex, 
+                                                        feds_polygons.geometry.values, 
+                                                        predicate="intersects")
         
-        logging.info(f'Number of total feds_polygons: {len(self._feds_input.polygons.index)}')
-        logging.info(f'Number of total ref_polygons: {len(self._ref_input.polygons.index)}')
+        # overlay(how='intersection') drops point/line results, so pairs that only
+        # touch on their boundaries never counted as matches in the loop; mirror that
+        if len(feds_pos):
+            feds_geoms = feds_polygons.geometry.iloc[feds_pos].reset_index(drop=True)
+            ref_geoms = ref_polygons.geometry.iloc[ref_pos].reset_index(drop=True)
+            keep = ~feds_geoms.touches(ref_geoms, align=False).values
+            feds_pos, ref_pos = feds_pos[keep], ref_pos[keep]
+        
+        # same ordering as the loop: by feds position, then reference position
+        order = np.lexsort((ref_pos, feds_pos))
+        feds_pos, ref_pos = feds_pos[order], ref_pos[order]
         
-        total_iterations = feds_polygons.shape[0]
+        candidates = {}
+        for f_pos, r_pos in zip(feds_pos.tolist(), ref_pos.tolist()):
+            candidates.setdefault(f_pos, []).append(r_pos)
+        
+        return candidates
+    
+    def intersect_candidates_loop(feds_polygons, ref_polygons) -> dict:
+        """ PHASE 1 (loop): legacy O(F x R) search with a one-row sindex per feds
+            polygon and an overlay per reference candidate
+            
+            kept as a reference mode for equivalence checks against the bulk engine
+        """
+        candidates = {}
         
-        # iterate through all feds polys
-        for feds_poly_i in tqdm(range(total_iterations), desc="Running FEDS-Reference Match Algorithm", unit="polygon"):
+        for feds_poly_i in tqdm(range(feds_polygons.shape[0]), desc="Running FEDS-Reference Intersection Loop", unit="polygon"):
             
             # grab feds polygon + index layout
             curr_feds_poly = feds_polygons.iloc[[feds_poly_i]]
@@ -369,7 +815,6 @@ class OutputCalculation():
             # indices of refs that intersected with this feds poly
             curr_finds = []
             
-            # PHASE 1: FIND INTERSECTIONS OF ANY KIND
             for idx in range(len(ref_polygons)):
                 ref_poly = ref_polygons.iloc[idx]
                 tmp_bbox = ref_poly.geometry.bounds
@@ -379,164 +824,210 @@ class OutputCalculation():
                     intersect = gpd.overlay(ref_polygons.iloc[[idx]], possible_matches, how='intersection')
                     if not intersect.empty:
                         curr_finds.append(idx)
-           
-            if not len(curr_finds):
-                # debug warnings
-                # logging.warning(f'NO MATCHES FOUND FOR FEDS_POLYGON AT INDEX: {feds_polygons["index"].iloc[feds_poly_i]}; UNABLE TO FIND BEST DATE MATCHES, ATTACHING NONE FOR REFERENCE INDEX')
-                matches.append((feds_polygons['index'].iloc[feds_poly_i], None))
-                continue
             
-            
-            timestamp = curr_feds_poly.t # feds time stamp - 2023-09-22T12:00:00 in str format 
-            set_up_finds = ref_polygons.take(curr_finds)
+            if len(curr_finds):
+                candidates[feds_poly_i] = curr_finds
+        
+        return candidates
                                  
-            # PHASE 2: GET BEST TIME STAMP SET, TEST IF INTERSECTIONS FIT THIS BEST DATE
-            try:
-                timestamp = datetime.strptime(timestamp.values[0], "%Y-%m-%dT%H:%M:%S")
-                time_matches = OutputCalculation.get_nearest_by_date(set_up_finds, timestamp, self._day_search_range)
-            except Exception as e:
-                sys.stdout.write(f'Encountered error when running get_nearest_by_date: {e} \n')
+    def closest_date_match(self) -> list:
+        """ given the feds and reference polygons
+            return list mapping the feds input to 
+            closest reference polygons
+        """
+        return self.__flatten_matches(*self.__match_candidates())
+    
+    def __match_candidates(self):
+        """ PHASE 1 + 2 over the full inputs: intersecting candidates per feds polygon,
+            then the nearest-date subset of them (see nearest_date_candidates)
+        """
+        # fetch polygons
+        feds_polygons = self._feds_input.polygons
+        ref_polygons = self._ref_input.polygons
+        
+        logging.info(f'Number of total feds_polygons: {len(self._feds_input.polygons.index)}')
+        logging.info(f'Number of total ref_polygons: {len(self._ref_input.polygons.index)}')
+        
+        # PHASE 1: FIND INTERSECTIONS OF ANY KIND
+        if self._match_mode == "loop":
+            candidates = OutputCalculation.intersect_candidates_loop(feds_polygons, ref_polygons)
+        else:
+            candidates = OutputCalculation.intersect_candidates(feds_polygons, ref_polygons)
+        
+        # PHASE 2: BEST TIME STAMP PER FEDS POLYGON OVER ITS INTERSECTIONS
+        feds_index = self._feds_input.polygon_index
+        ref_index = self._ref_input.polygon_index
+        assert feds_index.times is not None and ref_index.times is not None, "FATAL: polygon indices built without a time column; cannot date match"
+        selected, out_of_range, invalid = OutputCalculation.nearest_date_candidates(feds_index.times, 
+                                                                                    ref_index.times, 
+                                                                                    candidates, 
+                                                                                    self._day_search_range)
+        
+        return candidates, selected, out_of_range, invalid
+    
+    def __flatten_matches(self, candidates: dict, selected: dict, out_of_range: list, invalid: list, positions=None) -> list:
+        """ PHASE 3: flatten per-feds selections into (feds index, ref index) pairs, in feds order
+            positions: feds positions to flatten (default: all)
+        """
+        
+        # store as (feds_poly index, ref_polygon index)
+        matches = []
+        
+        feds_index = self._feds_input.polygon_index
+        ref_index = self._ref_input.polygon_index
+        feds_keys = feds_index.column('index')
+        ref_keys = ref_index.column('index')
+        out_of_range = set(out_of_range)
+        invalid = set(invalid)
+        
+        positions = range(feds_index.size) if positions is None else positions.tolist()
+        for feds_poly_i in tqdm(positions, desc="Running FEDS-Reference Match Algorithm", unit="polygon"):
+            
+            feds_key = feds_keys[feds_poly_i]
+            
+            if feds_poly_i in invalid:
+                sys.stdout.write(f'Encountered error when running get_nearest_by_date: invalid FEDS timestamp {feds_index.value(feds_key, "t")} \n')
                 sys.stdout.flush()
-                sys.stdout.write(f'DUE TO ERR: FEDS POLY WITH INDEX {feds_polygons["index"].iloc[feds_poly_i]} HAS NO INTERSECTIONS AT BEST DATES: ATTACHING NONE FOR REFERENCE INDEX \n')
+                sys.stdout.write(f'DUE TO ERR: FEDS POLY WITH INDEX {feds_key} HAS NO INTERSECTIONS AT BEST DATES: ATTACHING NONE FOR REFERENCE INDEX \n')
                 sys.stdout.flush()
-                
-                matches.append((feds_polygons['index'].iloc[feds_poly_i], None))
+                matches.append((feds_key, None))
                 continue
-            if time_matches is None:
+            
+            if feds_poly_i not in selected:
+                # debug warnings
+                # logging.warning(f'NO MATCHES FOUND FOR FEDS_POLYGON AT INDEX: {feds_key}; UNABLE TO FIND BEST DATE MATCHES, ATTACHING NONE FOR REFERENCE INDEX')
+                matches.append((feds_key, None))
+                continue
+            
+            if feds_poly_i in out_of_range:
                 sys.stdout.write(f'TIME MATCH WARNING: the intersecting pair does not have a timestamp difference within the specified day search range window: {self._day_search_range} \n')
                 sys.stdout.flush()
-                sys.stdout.write(f'Intersection pair will still be included for user inspection; FEDS at index {feds_poly_i} and Reference at index {curr_finds}. \n')
+                sys.stdout.write(f'Intersection pair will still be included for user inspection; FEDS at index {feds_key} and Reference at index {ref_keys[selected[feds_poly_i]].tolist()}. \n')
                 sys.stdout.flush()
-                
-                time_matches = set_up_finds
-                
             
-            # PHASE 3: FLATTEN TIME MATCHES + INTERSECTING
-            intersect_and_date = [time_matches.iloc[[indx]]['index'].values[0] for indx in range(time_matches.shape[0])]
+            intersect_and_date = selected[feds_poly_i]
             assert len(intersect_and_date) != 0, "FATAL: len 0 should not occur with the intersect + best date array"
-            # if len(intersect_and_date) > 1:
-            #     sys.stdout.write(f'FEDS polygon at index {feds_polygons["index"].iloc[feds_poly_i]} has MULTIPLE qualifying polygons to compare against: {len(intersect_and_date)} resulted. Select first polygon only; SUBJECT TO CHANGE! \n')
-            #     sys.stdout.flush()
-                
             # multi match supressor
-            # [matches.append((feds_polygons['index'].iloc[feds_poly_i], a_match)) for a_match in intersect_and_date[0:1]]
-            [matches.append((feds_polygons['index'].iloc[feds_poly_i], a_match)) for a_match in intersect_and_date]
+            # [matches.append((feds_key, a_match)) for a_match in intersect_and_date[0:1]]
+            [matches.append((feds_key, ref_keys[a_match])) for a_match in intersect_and_date]
             
                                
         print('DATE MATCHING COMPLETE')
         return matches
     
-    def write_to_csv(self):
-        """ take result calculation columns and output into csv format
-            take note of instance vars:
-            
-            self._output_format = output_format
-            self._output_maap_url = output_maap_url
-            self._dump = None # content to dump into file
+    def results_table(self, geometry: str = "wkt", calculations: dict = None) -> pd.DataFrame:
+        """ all matched calculation rows as one typed table (RESULT_COLUMNS order),
+            built with array lookups rather than per row access
             
-            wants cols for the feds index, reference index, then corresponding calcs
-            
-            e.g. for calculations = { 'index_pairs': index_pairs,
-                         'ratio': [],
-                         'accuracy': [],
-                         'precision': [],
-                         'recall': [],
-                         'iou': [],
-                         'f1': [],
-                         'symm_ratio': []
-                       }
-            row i = feds index: index_pairs[i][0], 
-                    ref index: index_pairs[i][1],
-                    ratio: ratio[i],
-                    etc.
+            rows where every metric is None (no reference polygon) are excluded
+            geometry: polygon column content, one of
+                "wkt" (text), "wkb" (bytes), "geometry" (shapely objects), "ids" (dropped;
+                feds_index / ref_index + feds_feature_id if available refer to the sources)
+            calculations: a calculations dict to tabulate instead of the run's (streamed batches)
+        """
+        assert geometry in ["wkt", "wkb", "geometry", "ids"], f"Invalid results table geometry {geometry}"
+        
+        calculations = self._calculations if calculations is None else calculations
+        feds_index = self._feds_input.polygon_index
+        ref_index = self._ref_input.polygon_index
+        ref_columns = ref_index.polygons.columns
+        
+        # skip None values for write in
+        rows = [i for i in range(len(calculations['index_pairs'])) 
+                if not all(calculations[key][i] is None for key in PairMetrics.METRICS)]
+        feds_keys = [calculations['index_pairs'][i][0] for i in rows]
+        ref_keys = [calculations['index_pairs'][i][1] for i in rows]
+        feds_pos = feds_index.positions(feds_keys)
+        ref_pos = ref_index.positions(ref_keys)
+        
+        table = {'feds_index': feds_index.column('index')[feds_pos] if len(rows) else np.array(feds_keys),
+                 'feds_polygon': feds_index.geometries[feds_pos],
+                 'ref_index': ref_index.column('index')[ref_pos] if len(rows) else np.array(ref_keys),
+                 'ref_polygon': ref_index.geometries[ref_pos]}
         
+        # suspect name match - use known pre-definedd col labels
+        for name_col in ['INCIDENT', 'poly_IncidentName', 'FIRE_NAME']:
+            if name_col in ref_columns:
+                names = pd.Series(ref_index.column(name_col)[ref_pos], dtype=object)
+                table['incident_name'] = names.where(names.notna(), "").values
+                break
+        else:
+            table['incident_name'] = np.full(len(rows), "", dtype=object)
+        
+        # TODO t difference (feds t is an iso string, reference times are datetimes)
+        table['feds_timestamp'] = feds_index.column('t')[feds_pos]
+        table['ref_timestamp'] = ref_index.column('DATE_CUR_STAMP')[ref_pos]
+        
+        for key in PairMetrics.METRICS:
+            table[key] = np.array([calculations[key][i] for i in rows], dtype=np.float64)
+        
+        if geometry == "wkt":
+            table['feds_polygon'] = Utilities.geometry_wkt(table['feds_polygon'])
+            table['ref_polygon'] = Utilities.geometry_wkt(table['ref_polygon'])
+        elif geometry == "wkb":
+            table['feds_polygon'] = gpd.GeoSeries(table['feds_polygon']).to_wkb().values
+            table['ref_polygon'] = gpd.GeoSeries(table['ref_polygon']).to_wkb().values
+        
+        table = pd.DataFrame(table, columns=OutputCalculation.RESULT_COLUMNS)
+        
+        if geometry == "ids":
+            table = table.drop(columns=['feds_polygon', 'ref_polygon'])
+            if 'feature_id' in feds_index.polygons.columns:
+                table.insert(1, 'feds_feature_id', feds_index.column('feature_id')[feds_pos])
+        
+        return table
+    
+    def output_table(self, calculations: dict = None):
+        """ results table prepared for the output format
+            csv: WKT polygons, datetimes as numpy prints them (as written per row before)
+            parquet / arrow: typed times, polygons per geometry_output
+            geoparquet: typed times, feds polygon as the primary geometry and the
+                        reference polygon as a second geometry column
         """
+        if self._output_format == "csv":
+            table = self.results_table(geometry="wkt", calculations=calculations)
+            for col in ['feds_timestamp', 'ref_timestamp']:
+                if table[col].dtype.kind == 'M':
+                    table[col] = np.datetime_as_string(table[col].values)
+            return table
         
-        # fetch dict 
-        calculations = self._calculations
+        geometry = "geometry" if self._output_format == "geoparquet" else self._geometry_output
+        table = self.results_table(geometry=geometry, calculations=calculations)
+        # columnar outputs carry typed times; feds t is parsed from its iso string
+        table['feds_timestamp'] = pd.to_datetime(table['feds_timestamp'], format=InputFEDS.TIME_FORMAT)
+        if self._output_format == "geoparquet":
+            table['ref_polygon'] = gpd.GeoSeries(table['ref_polygon'].values, crs=self._feds_input.crs)
+            table = gpd.GeoDataFrame(table, geometry='feds_polygon', crs=self._feds_input.crs)
+        
+        return table
+    
+    def write_output(self):
+        """ write the results table to output_maap_url in the output format """
+        if self._output_format == "csv":
+            return self.write_to_csv()
+        
+        file_name = self._output_maap_url
+        with self.__set_up_output_maap_file() as sink:
+            sink.write(self.output_table())
+        
+        print("\n")
+        print(f"{self._output_format.upper()} output complete! Check file {file_name} for results. NOTE: None result rows were excluded.")
+        
+        return self
+    
+    def write_to_csv(self):
+        """ take result calculation columns and output into csv format
+            
+            one row per matched pair: feds index + polygon (WKT), reference index +
+            polygon (WKT), incident name, both timestamps, then the METRICS columns;
+            the table is built in one pass by results_table
+        """
         # source length from top given all should be same len
         file_name = self._output_maap_url
-        # fetch polygons to extract meta data
-        feds_polygons = self._feds_input.polygons
-        ref_polygons = self._ref_input.polygons
         
-        with open(file_name, 'w', newline='') as csvfile:
-            # erase prev content 
-            csvfile.truncate()
-            
-            fieldnames = ['feds_index', 
-                          'feds_polygon',
-                          'ref_index', 
-                          'ref_polygon',
-                          'incident_name', # need to condition if available
-                          'feds_timestamp',
-                          'ref_timestamp',
-                          # 'feds_minus_ref_timestamp',
-                          'ratio', 
-                          'accuracy', 
-                          'precision', 
-                          'recall', 
-                          'iou', 
-                          'f1', 
-                          'symm_ratio']
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            writer.writeheader()
-            num_rows = len(calculations['index_pairs']) 
-
-            for i in range(num_rows):
-                # skip None values for write in
-                if all( value is None for value in 
-                    [
-                        calculations['ratio'][i],
-                        calculations['accuracy'][i],
-                        calculations['precision'][i],
-                        calculations['recall'][i],
-                        calculations['iou'][i],
-                        calculations['f1'][i],
-                        calculations['symm_ratio'][i]
-                    ]
-                ):
-                    continue
-                    
-                else: 
-                    # poly extraction
-                    feds_poly = feds_polygons[feds_polygons['index'] == calculations['index_pairs'][i][0]]
-                    ref_poly = ref_polygons[ref_polygons['index'] == calculations['index_pairs'][i][1]]
-                    # timestamp extract
-                    feds_time = feds_poly.t.values[0]
-                    ref_time = ref_poly['DATE_CUR_STAMP'].values[0]
-                    
-                    # TODO t difference
-                    # feds_minus_ref_time = feds_time - ref_time
-                    # UFuncTypeError: ufunc 'subtract' cannot use operands with types dtype('<U19') and dtype('<M8[ns]')
-                    # suspect name match - use known pre-definedd col labels
-                    if 'INCIDENT' in ref_poly.columns:
-                        incident_name = ref_poly['INCIDENT'].values[0]
-                    elif 'poly_IncidentName' in ref_poly.columns:
-                        incident_name = ref_poly['poly_IncidentName'].values[0]
-                    elif 'FIRE_NAME' in ref_poly.columns:
-                        incident_name = ref_poly['FIRE_NAME'].values[0]
-                    else:
-                        incident_name = ""
-                    
-                    row_data = {
-                        'feds_index': calculations['index_pairs'][i][0],
-                        'feds_polygon': self._feds_input._polygons.loc[calculations['index_pairs'][i][0]]['geometry'].wkt,
-                        'ref_index': calculations['index_pairs'][i][1],
-                        'ref_polygon': self._ref_input._polygons.loc[calculations['index_pairs'][i][1]]['geometry'].wkt,
-                        'incident_name': incident_name,
-                        'feds_timestamp': feds_time,
-                        'ref_timestamp': ref_time,
-                        # 'feds_minus_ref_timestamp': feds_minus_ref_time,
-                        'ratio': calculations['ratio'][i],
-                        'accuracy': calculations['accuracy'][i],
-                        'precision': calculations['precision'][i],
-                        'recall': calculations['recall'][i],
-                        'iou': calculations['iou'][i],
-                        'f1': calculations['f1'][i],
-                        'symm_ratio': calculations['symm_ratio'][i]
-                    }
-                    writer.writerow(row_data)
+        # erase prev content
+        with self.__set_up_output_maap_file() as sink:
+            sink.write(self.output_table())
         
         print("\n")
         print(f"CSV output complete! Check file {file_name} for results. NOTE: None result rows were excluded.")
@@ -555,9 +1046,9 @@ class OutputCalculation():
         
         assert req_calc in valid_calc_choices, f"Provided req_calc argument is not valid, please select a choice from the following: {valid_calc_choices}"
         
-        # assign main polygons
-        feds_polygons = self._feds_input.polygons
-        ref_polygons =self._ref_input.polygons
+        # assign main polygon stores
+        feds_index = self._feds_input.polygon_index
+        ref_index = self._ref_input.polygon_index
         indices = self._calculations['index_pairs']
         
         # correspond to indices/pairs
@@ -570,8 +1061,8 @@ class OutputCalculation():
             if index2 is None:
                 continue
                 
-            feds_inst = feds_polygons[feds_polygons['index'] == index1]
-            ref_inst = ref_polygons[ref_polygons['index'] == index2]
+            feds_inst = feds_index.frame(index1)
+            ref_inst = ref_index.frame(index2)
             
             # given an int time restriction, eliminate pairs not in bounds 
             if date_restrict is not None:
@@ -627,12 +1118,10 @@ class OutputCalculation():
         calculations = self._calculations
         
         # poly + time fetch
-        feds_polygons = self._feds_input.polygons
-        ref_polygons = self._ref_input.polygons
+        feds_index = self._feds_input.polygon_index
+        ref_index = self._ref_input.polygon_index
         
-        for pair in calculations['index_pairs']:
-            # coresponding index
-            i = calculations['index_pairs'].index(pair)
+        for i, pair in enumerate(calculations['index_pairs']):
             # ignore none value results
             if all( value is None for value in 
                     [
@@ -647,14 +1136,10 @@ class OutputCalculation():
                 ):
                     continue
             
-            # poly + time extraction
-            # feds_poly = feds_polygons[feds_polygons['index'] == calculations['index_pairs'][i][0]]
-            # ref_poly = ref_polygons[ref_polygons['index'] == calculations['index_pairs'][i][1]]
-        
             # apply indices
             index1, index2 = pair
-            feds_poly = feds_polygons[feds_polygons['index'] == index1]
-            ref_poly = ref_polygons[ref_polygons['index'] == index2]
+            feds_poly = feds_index.frame(index1)
+            ref_poly = ref_index.frame(index2)
             
 
             top_tolerance = 0
@@ -756,102 +1241,40 @@ class OutputCalculation():
             where both NIFC and FEDS burned
             return basic intersection
         """
-        overlay = gpd.overlay(feds_inst, nifc_inst, how='intersection')
-        result = OutputCalculation.areaCalculation(overlay) # overlay.geometry.area.item()
-        return result
+        return PairMetrics(feds_inst, nifc_inst).TP
 
     def falseNeg(feds_inst, nifc_inst):
         """ Calculate false negative area:
             NIFC burned but FEDS DID NOT burn (unburned needs envelope)
             make bounding -> get negative of Feds -> intersect with nifc (burning)
         """
-        # union to envelope 
-        unionr = gpd.overlay(feds_inst, nifc_inst, how='union')
-
-        # generate bounding box fitting both instances (even if multi-poly)
-        net_bounding = unionr.geometry.envelope
-        # net_barea = areaCalculation(net_bounding)
-        # convert to data frame
-        net_bounding = net_bounding.to_frame()
-
-        feds_neg = gpd.overlay(net_bounding, feds_inst, how='difference')
-        result = gpd.overlay(feds_neg, nifc_inst, keep_geom_type=False, how='intersection')
-        result = OutputCalculation.areaCalculation(result)
-
-        return result
+        return PairMetrics(feds_inst, nifc_inst).FN
 
     def falsePos(feds_inst, nifc_inst):
         """ Calculate false negative area:
             NIFC DID NOT burn (unburned needs envelope) but FEDS burned 
             bounding -> get negative of nifc -> intersect with feds (burning)
         """
-        # union to envelope 
-        unionr = gpd.overlay(feds_inst, nifc_inst, how='union')
-
-        # generate bounding box fitting both instances (even if multi-poly)
-        net_bounding = unionr.geometry.envelope
-        # net_barea = areaCalculation(net_bounding)
-        # convert to data frame
-        net_bounding = net_bounding.to_frame()
-
-        nifc_neg = gpd.overlay(net_bounding, nifc_inst, how='difference')
-
-        result = gpd.overlay(nifc_neg, feds_inst, keep_geom_type=False, how='intersection')
-        result = OutputCalculation.areaCalculation(result)
-
-        return result
+        return PairMetrics(feds_inst, nifc_inst).FP
 
     def trueNeg(feds_inst, nifc_inst):
         """ Calculate true negative area (agreeing on none geom)
             input: two geo dataframes
             output: area where both agree of no geom
         """
-
-        # union to envelope 
-        unionr = gpd.overlay(feds_inst, nifc_inst, how='union')
-
-        # generate bounding box fitting both instances (even if multi-poly)
-        net_bounding = unionr.geometry.envelope
-        net_barea = OutputCalculation.areaCalculation(net_bounding)
-        # convert to data frame
-        net_bounding = net_bounding.to_frame()
-
-        # subtract feds_inst and nifc_inst from bounding area
-        feds_neg = gpd.overlay(net_bounding, feds_inst, how='difference')
-        nifc_neg = gpd.overlay(net_bounding, nifc_inst, how='difference')
-
-        # TN = calculate intersection of both "negatives"
-        inter_neg = gpd.overlay(feds_neg, nifc_neg, keep_geom_type=False, how='intersection')
-        result = OutputCalculation.areaCalculation(inter_neg)
-
-        return result
+        return PairMetrics(feds_inst, nifc_inst).TN
 
     def areaTotal(feds_inst, nifc_inst):
         """ Calculate total Area defined in table 6:	
             FEDS_B/REF_B(burned area)
         """
-        # union to envelope 
-        unionr = gpd.overlay(feds_inst, nifc_inst, how='union')
-        # generate bounding box fitting both instances (even if multi-poly)
-        net_bounding = unionr.geometry.envelope
-        net_barea = OutputCalculation.areaCalculation(net_bounding)
-        # convert to data frame
-        # net_bounding = net_bounding.to_frame()
-
-        return net_barea
+        return PairMetrics(feds_inst, nifc_inst).area_total
 
     def ratioCalculation(feds_inst, nifc_inst):
         """ Calculate ratio defined in table 6:	
             FEDS_B/REF_B(burned area)
         """
-        # sum area (since mul entries may exist) up by calc
-        feds_area = OutputCalculation.areaCalculation(feds_inst)
-        nifc_area = OutputCalculation.areaCalculation(nifc_inst)
-
-        assert feds_area is not None, "None type detected for area; something went wrong"
-        assert nifc_area is not None, "None type detected for area; something went wrong"
-
-        return feds_area / nifc_area
+        return PairMetrics(feds_inst, nifc_inst).ratio
 
     def accuracyCalculation(feds_inst, nifc_inst):
         """ Calculate accuracy defined in table 6:
@@ -860,70 +1283,36 @@ class OutputCalculation():
             TN == agreed inverse by bounding box
             TP == FRAP + FEDS agree on burned (intersect)
         """
-        TN = OutputCalculation.trueNeg(feds_inst, nifc_inst)
-        TP = OutputCalculation.truePos(feds_inst, nifc_inst)
-        AREA_TOTAL = OutputCalculation.areaTotal(feds_inst, nifc_inst)
+        return PairMetrics(feds_inst, nifc_inst).accuracy
 
-        return (TN + TP) / AREA_TOTAL
-
-    # @TODO: call percision calculation func
     def precisionCalculation(feds_inst, nifc_inst):
         """ TP/FEDS_B
             TP == FRAP + FEDS agree on burned (intersect)
             FEDS_B == all burned of feds 
         """
         assert isinstance(feds_inst, pd.DataFrame) and isinstance(nifc_inst, pd.DataFrame), "Object types will fail intersection calculation; check inputs"
-        # calculate intersect (agreement) -> divide
-        # overlay = gpd.overlay(feds_inst, nifc_inst, how='intersection')
-        TP = OutputCalculation.truePos(feds_inst, nifc_inst)
-        feds_area = OutputCalculation.areaCalculation(feds_inst)
-
-        return TP / feds_area
+        return PairMetrics(feds_inst, nifc_inst).precision
 
     def recallCalculation(feds_inst, nifc_inst):
         """ TP/REF_B (nifc)
             TP == FRAP + FEDS agree on burned (intersect)
             REF_B == all burned of nifc/source
         """
-        # overlay = gpd.overlay(feds_inst, nifc_inst, how='intersection')
-        TP = OutputCalculation.truePos(feds_inst, nifc_inst)
-        nifc_area = OutputCalculation.areaCalculation(nifc_inst)
-
-        return TP / nifc_area
+        return PairMetrics(feds_inst, nifc_inst).recall
 
     def IOUCalculation(feds_inst, nifc_inst):
         """ IOU (inter over union)
-            TP/(TP + FP + FN)
+            TP/(TP + FP + FN)
         """
-
-        # overlay = gpd.overlay(feds_inst, nifc_inst, how='intersection')
-        TP = OutputCalculation.truePos(feds_inst, nifc_inst)
-        FP = OutputCalculation.falsePos(feds_inst, nifc_inst) # feds + nifc agree on no burning
-        FN = OutputCalculation.falseNeg(feds_inst, nifc_inst) # feds thinks unburned when nifc burned
-
-        return TP / (TP + FP + FN)
+        return PairMetrics(feds_inst, nifc_inst).iou
 
     def f1ScoreCalculation(feds_inst, nifc_inst):
-        """ 2 * (Precision * Recall)/(Precision + Recall)
+        """ 2 * (Precision * Recall)/(Precision + Recall)
         """
-        precision = OutputCalculation.precisionCalculation(feds_inst, nifc_inst)
-        recall = OutputCalculation.recallCalculation(feds_inst, nifc_inst)
-        calc = 2 * (precision*recall)/(precision+recall)
-
-        return calc
+        return PairMetrics(feds_inst, nifc_inst).f1
 
-    # @TODO: custom calc functions
     def symmDiffRatioCalculation(feds_inst, nifc_inst):
         """ symmetric difference calc, ratio 
             NOTE: error relative to NIFC/external soure
         """
-        sym_diff = feds_inst.symmetric_difference(nifc_inst, align=False)
-        # use item() to fetch int out of values
-        assert sym_diff.shape[0] == 1, "Multiple sym_diff entries identified; pair accuracy evaluation will fail."
-        # calculate error percent: (difference / "correct" shape aka nifc)
-        symm_area = OutputCalculation.areaCalculation(sym_diff)
-        nifc_area = OutputCalculation.areaCalculation(nifc_inst)
-        # symmDiff_ratio = sym_diff.geometry.area.item() / nifc_inst.geometry.area.item()
-        symmDiff_ratio = symm_area / nifc_area
-
-        return symmDiff_ratio
\ No newline at end of file
+        return PairMetrics(feds_inst, nifc_inst).symm_ratio
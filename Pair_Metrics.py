@@ -0,0 +1,406 @@
+"""
+Pair_Metrics Class
+
+"""
+
+import numpy as np
+import geopandas as gpd
+from shapely.ops import unary_union
+from rasterio import features
+from affine import Affine
+
+
+def area_sum(geom_instance):
+    """ sum area over all rows of a geom instance (frame or series)
+        rows are added in order, same as OutputCalculation.areaCalculation
+    """
+    area = 0
+    for row_area in geom_instance.geometry.area.tolist():
+        area += row_area
+    return area
+
+def polygonal(geoms):
+    """ keep only the polygon parts of mixed results, as overlay does
+        with its default keep_geom_type; geoms is a GeoSeries
+    """
+    mixed = (geoms.geom_type == 'GeometryCollection').values
+    if mixed.any():
+        geoms = geoms.copy()
+        geoms[mixed] = [unary_union([part for part in geom.geoms if part.geom_type in ('Polygon', 'MultiPolygon')])
+                        for geom in geoms[mixed]]
+    return geoms
+
+
+class PairMetrics():
+    """ PairMetrics
+        Single-pass evaluator for one feds/reference pair: every overlay
+        (intersection, union, envelope, negatives) is computed at most once
+        and shared by all derived metrics
+
+        terms follow OutputCalculation: FEDS == predicted class, reference == truth
+    """
+
+    # metric keys, in the order OutputCalculation tracks them
+    METRICS = ['ratio', 'accuracy', 'precision', 'recall', 'iou', 'f1', 'symm_ratio']
+    # raster backend: default cells along the longer envelope side, and grid size cap
+    RASTER_CELLS = 256
+    RASTER_MAX_CELLS = 2048 * 2048
+
+    def __init__(self, feds_inst, nifc_inst):
+
+        # USER INPUT
+        self._feds_inst = feds_inst
+        self._nifc_inst = nifc_inst
+
+        # PROGRAM SET - lazily filled overlays + areas
+        self._computed = {}
+
+    def __fetch(self, name, compute):
+        """ compute a named quantity once, then serve it from memory """
+        if name not in self._computed:
+            self._computed[name] = compute()
+        return self._computed[name]
+
+    # OVERLAYS
+    @property
+    def intersection(self):
+        return self.__fetch('intersection', lambda: gpd.overlay(self._feds_inst, self._nifc_inst, how='intersection'))
+
+    @property
+    def union(self):
+        return self.__fetch('union', lambda: gpd.overlay(self._feds_inst, self._nifc_inst, how='union'))
+
+    @property
+    def envelope(self):
+        """ bounding boxes fitting the union rows (even if multi-poly) """
+        return self.__fetch('envelope', lambda: self.union.geometry.envelope)
+
+    @property
+    def feds_neg(self):
+        """ envelope minus feds: where FEDS did not burn """
+        return self.__fetch('feds_neg', lambda: gpd.overlay(self.envelope.to_frame(), self._feds_inst, how='difference'))
+
+    @property
+    def nifc_neg(self):
+        """ envelope minus reference: where the reference did not burn """
+        return self.__fetch('nifc_neg', lambda: gpd.overlay(self.envelope.to_frame(), self._nifc_inst, how='difference'))
+
+    # AREAS
+    @property
+    def feds_area(self):
+        return self.__fetch('feds_area', lambda: area_sum(self._feds_inst))
+
+    @property
+    def nifc_area(self):
+        return self.__fetch('nifc_area', lambda: area_sum(self._nifc_inst))
+
+    @property
+    def TP(self):
+        """ where both reference and FEDS burned """
+        return self.__fetch('TP', lambda: area_sum(self.intersection))
+
+    @property
+    def FN(self):
+        """ reference burned but FEDS did not """
+        return self.__fetch('FN', lambda: area_sum(gpd.overlay(self.feds_neg, self._nifc_inst, keep_geom_type=False, how='intersection')))
+
+    @property
+    def FP(self):
+        """ FEDS burned but reference did not """
+        return self.__fetch('FP', lambda: area_sum(gpd.overlay(self.nifc_neg, self._feds_inst, keep_geom_type=False, how='intersection')))
+
+    @property
+    def TN(self):
+        """ both agree on no burning inside the envelope """
+        return self.__fetch('TN', lambda: area_sum(gpd.overlay(self.feds_neg, self.nifc_neg, keep_geom_type=False, how='intersection')))
+
+    @property
+    def area_total(self):
+        return self.__fetch('area_total', lambda: area_sum(self.envelope))
+
+    @property
+    def symm_area(self):
+        def compute():
+            sym_diff = self._feds_inst.symmetric_difference(self._nifc_inst, align=False)
+            assert sym_diff.shape[0] == 1, "Multiple sym_diff entries identified; pair accuracy evaluation will fail."
+            return area_sum(sym_diff)
+        return self.__fetch('symm_area', compute)
+
+    # METRICS
+    @property
+    def ratio(self):
+        """ FEDS_B/REF_B (burned area) """
+        assert self.feds_area is not None, "None type detected for area; something went wrong"
+        assert self.nifc_area is not None, "None type detected for area; something went wrong"
+        return self.feds_area / self.nifc_area
+
+    @property
+    def accuracy(self):
+        """ (TP+TN)/AREA_TOTAL """
+        return (self.TN + self.TP) / self.area_total
+
+    @property
+    def precision(self):
+        """ TP/FEDS_B """
+        return self.TP / self.feds_area
+
+    @property
+    def recall(self):
+        """ TP/REF_B """
+        return self.TP / self.nifc_area
+
+    @property
+    def iou(self):
+        """ TP/(TP + FP + FN) """
+        return self.TP / (self.TP + self.FP + self.FN)
+
+    @property
+    def f1(self):
+        """ 2 * (Precision * Recall)/(Precision + Recall) """
+        precision = self.precision
+        recall = self.recall
+        return 2 * (precision*recall)/(precision+recall)
+
+    @property
+    def symm_ratio(self):
+        """ symmetric difference area relative to the reference """
+        return self.symm_area / self.nifc_area
+
+    def metrics(self) -> dict:
+        """ all metrics keyed as in OutputCalculation calculations """
+        return {key: getattr(self, key) for key in PairMetrics.METRICS}
+
+    # BATCH (VECTORIZED) EVALUATION
+    def batch_metrics(feds_geoms, ref_geoms) -> dict:
+        """ evaluate many pairs at once over aligned geometry arrays
+            feds_geoms[i] is compared against ref_geoms[i]
+            
+            mirrors the overlay pipeline above: union rows are the intersection
+            and the two one-sided differences, each with its own envelope
+            
+            returns dict of numpy arrays keyed by METRICS plus the component
+            areas (TP, FP, FN, TN, area_total)
+        """
+        feds_geoms = gpd.GeoSeries(feds_geoms).reset_index(drop=True)
+        ref_geoms = gpd.GeoSeries(ref_geoms).reset_index(drop=True)
+        assert len(feds_geoms) == len(ref_geoms), "FATAL: batch metric inputs must be aligned pairs"
+        
+        feds_area = feds_geoms.area.values
+        nifc_area = ref_geoms.area.values
+        
+        # union rows: intersection, feds only, reference only
+        pieces = [polygonal(feds_geoms.intersection(ref_geoms, align=False)),
+                  polygonal(feds_geoms.difference(ref_geoms, align=False)),
+                  polygonal(ref_geoms.difference(feds_geoms, align=False))]
+        envelopes = [piece.envelope for piece in pieces]
+        
+        TP = pieces[0].area.values
+        area_total = np.zeros(len(feds_geoms))
+        for envelope in envelopes:
+            area_total = area_total + envelope.area.values
+        
+        # negatives per envelope row
+        feds_negs = [envelope.difference(feds_geoms, align=False) for envelope in envelopes]
+        nifc_negs = [envelope.difference(ref_geoms, align=False) for envelope in envelopes]
+        
+        FN = np.zeros(len(feds_geoms))
+        FP = np.zeros(len(feds_geoms))
+        TN = np.zeros(len(feds_geoms))
+        for feds_neg in feds_negs:
+            FN = FN + feds_neg.intersection(ref_geoms, align=False).area.values
+            for nifc_neg in nifc_negs:
+                TN = TN + feds_neg.intersection(nifc_neg, align=False).area.values
+        for nifc_neg in nifc_negs:
+            FP = FP + nifc_neg.intersection(feds_geoms, align=False).area.values
+        
+        symm_area = feds_geoms.symmetric_difference(ref_geoms, align=False).area.values
+        
+        with np.errstate(divide='ignore', invalid='ignore'):
+            precision = TP / feds_area
+            recall = TP / nifc_area
+            results = {
+                'ratio': feds_area / nifc_area,
+                'accuracy': (TN + TP) / area_total,
+                'precision': precision,
+                'recall': recall,
+                'iou': TP / (TP + FP + FN),
+                'f1': 2 * (precision*recall)/(precision+recall),
+                'symm_ratio': symm_area / nifc_area,
+                'TP': TP,
+                'FP': FP,
+                'FN': FN,
+                'TN': TN,
+                'area_total': area_total
+            }
+        
+        return results
+
+    # ANALYTIC EVALUATION
+    def analytic_metrics(feds_geoms, ref_geoms) -> dict:
+        """ evaluate many pairs from areas only: one intersection per pair, the
+            union area follows from inclusion-exclusion and its envelope from
+            the combined bounds, so no difference overlays are needed
+            
+            TP = intersection, FP = FEDS - TP, FN = ref - TP,
+            TN = envelope(union) - union
+            
+            NOTE: the overlay pipeline sums FP/FN/TN over one envelope per union
+            row, and those envelopes can overlap; here areas are exact
+            set areas, so FP, FN, TN, area_total (and accuracy, iou) differ
+            from the "overlay" backend while ratio, precision, recall, f1
+            and symm_ratio agree
+            
+            returns dict of numpy arrays keyed as batch_metrics
+        """
+        feds_geoms = gpd.GeoSeries(feds_geoms).reset_index(drop=True)
+        ref_geoms = gpd.GeoSeries(ref_geoms).reset_index(drop=True)
+        assert len(feds_geoms) == len(ref_geoms), "FATAL: analytic metric inputs must be aligned pairs"
+        
+        feds_area = feds_geoms.area.values
+        nifc_area = ref_geoms.area.values
+        TP = feds_geoms.intersection(ref_geoms, align=False).area.values
+        union_area = feds_area + nifc_area - TP
+        
+        feds_bounds = feds_geoms.bounds.values
+        ref_bounds = ref_geoms.bounds.values
+        lower = np.fmin(feds_bounds[:, :2], ref_bounds[:, :2])
+        upper = np.fmax(feds_bounds[:, 2:], ref_bounds[:, 2:])
+        area_total = np.prod(upper - lower, axis=1)
+        
+        FP = feds_area - TP
+        FN = nifc_area - TP
+        TN = area_total - union_area
+        
+        with np.errstate(divide='ignore', invalid='ignore'):
+            precision = TP / feds_area
+            recall = TP / nifc_area
+            results = {
+                'ratio': feds_area / nifc_area,
+                'accuracy': (TN + TP) / area_total,
+                'precision': precision,
+                'recall': recall,
+                'iou': TP / union_area,
+                'f1': 2 * (precision*recall)/(precision+recall),
+                'symm_ratio': (union_area - TP) / nifc_area,
+                'TP': TP,
+                'FP': FP,
+                'FN': FN,
+                'TN': TN,
+                'area_total': area_total
+            }
+        
+        return results
+    
+    def debug_geometries(feds_geoms, ref_geoms, crs=None):
+        """ full geometries behind the analytic areas, one row per aligned pair:
+            intersection (TP), union, envelope, false_pos, false_neg, true_neg
+            
+            debugging output only; this runs the difference overlays the
+            analytic backend avoids
+        """
+        feds_geoms = gpd.GeoSeries(feds_geoms, crs=crs).reset_index(drop=True)
+        ref_geoms = gpd.GeoSeries(ref_geoms, crs=crs).reset_index(drop=True)
+        
+        union = feds_geoms.union(ref_geoms, align=False)
+        envelope = union.envelope
+        
+        return gpd.GeoDataFrame({'intersection': polygonal(feds_geoms.intersection(ref_geoms, align=False)),
+                                 'union': union,
+                                 'envelope': envelope,
+                                 'false_pos': polygonal(feds_geoms.difference(ref_geoms, align=False)),
+                                 'false_neg': polygonal(ref_geoms.difference(feds_geoms, align=False)),
+                                 'true_neg': polygonal(envelope.difference(union, align=False))},
+                                geometry='intersection', 
+                                crs=crs)
+
+    # RASTER (APPROXIMATE) EVALUATION
+    def raster_grid(feds_geoms, ref_geoms, resolution=None):
+        """ per pair grid over the union envelope: (xmin, ymax, cell, nx, ny) arrays
+            resolution is the cell size in crs units (None: RASTER_CELLS cells along
+            the longer side); cells are coarsened so a grid never exceeds RASTER_MAX_CELLS
+        """
+        feds_bounds = gpd.GeoSeries(feds_geoms).bounds.values
+        ref_bounds = gpd.GeoSeries(ref_geoms).bounds.values
+        lower = np.fmin(feds_bounds[:, :2], ref_bounds[:, :2])
+        upper = np.fmax(feds_bounds[:, 2:], ref_bounds[:, 2:])
+        width, height = (upper - lower).T
+        
+        if resolution is None:
+            cell = np.maximum(width, height) / PairMetrics.RASTER_CELLS
+        else:
+            cell = np.full(len(width), float(resolution))
+        cell = np.fmax(cell, np.sqrt(width * height / PairMetrics.RASTER_MAX_CELLS))
+        
+        with np.errstate(divide='ignore', invalid='ignore'):
+            nx = np.nan_to_num(np.ceil(width / cell)).astype(np.int64)
+            ny = np.nan_to_num(np.ceil(height / cell)).astype(np.int64)
+        return lower[:, 0], upper[:, 1], cell, nx, ny
+    
+    def raster_error_bounds(feds_geoms, ref_geoms, resolution=None) -> np.ndarray:
+        """ worst case absolute error of any raster confusion area (TP/FP/FN/TN) per pair
+            
+            a cell is misclassified only if a boundary passes within one cell
+            diagonal d of its centre, so each area is off by at most the area of
+            the d-buffer of both boundaries: 2 d (L_feds + L_ref) + 2 pi d^2
+        """
+        _, _, cell, _, _ = PairMetrics.raster_grid(feds_geoms, ref_geoms, resolution)
+        diagonal = cell * np.sqrt(2)
+        perimeters = gpd.GeoSeries(feds_geoms).length.values + gpd.GeoSeries(ref_geoms).length.values
+        return 2 * diagonal * perimeters + 2 * np.pi * diagonal**2
+    
+    def raster_metrics(feds_geoms, ref_geoms, resolution=None) -> dict:
+        """ evaluate many pairs by rasterizing each pair onto a shared grid over its
+            envelope (cell centres inside a polygon burn) and counting pixels
+            
+            TN = envelope - (TP + FP + FN), with the exact envelope area; ratio uses
+            the exact burned areas, every other metric the pixel counts; see
+            raster_error_bounds for the accuracy of the areas
+            
+            returns dict of numpy arrays keyed as batch_metrics
+        """
+        feds_geoms = gpd.GeoSeries(feds_geoms).reset_index(drop=True)
+        ref_geoms = gpd.GeoSeries(ref_geoms).reset_index(drop=True)
+        assert len(feds_geoms) == len(ref_geoms), "FATAL: raster metric inputs must be aligned pairs"
+        
+        xmin, ymax, cell, nx, ny = PairMetrics.raster_grid(feds_geoms, ref_geoms, resolution)
+        counts = np.full((len(feds_geoms), 3), np.nan)
+        for i, (feds_geom, ref_geom) in enumerate(zip(feds_geoms.values, ref_geoms.values)):
+            if feds_geom.is_empty or ref_geom.is_empty or nx[i] == 0 or ny[i] == 0:
+                continue
+            # north-up grid anchored at the envelope's top left corner
+            transform = Affine(cell[i], 0.0, xmin[i], 0.0, -cell[i], ymax[i])
+            # one burn: feds adds 1, reference adds 2 -> 0 none, 1 FP, 2 FN, 3 TP
+            burned = features.rasterize([(feds_geom, 1), (ref_geom, 2)], 
+                                        out_shape=(ny[i], nx[i]), 
+                                        transform=transform, 
+                                        merge_alg=features.MergeAlg.add, 
+                                        dtype='uint8')
+            classes = np.bincount(burned.ravel(), minlength=4)
+            counts[i] = [classes[3], classes[1], classes[2]]
+        
+        cell_area = cell**2
+        TP, FP, FN = (counts * cell_area[:, None]).T
+        feds_bounds = feds_geoms.bounds.values
+        ref_bounds = ref_geoms.bounds.values
+        area_total = np.prod(np.fmax(feds_bounds[:, 2:], ref_bounds[:, 2:]) - np.fmin(feds_bounds[:, :2], ref_bounds[:, :2]), axis=1)
+        TN = area_total - (TP + FP + FN)
+        
+        with np.errstate(divide='ignore', invalid='ignore'):
+            precision = TP / (TP + FP)
+            recall = TP / (TP + FN)
+            results = {
+                'ratio': feds_geoms.area.values / ref_geoms.area.values,
+                'accuracy': (TN + TP) / area_total,
+                'precision': precision,
+                'recall': recall,
+                'iou': TP / (TP + FP + FN),
+                'f1': 2 * (precision*recall)/(precision+recall),
+                'symm_ratio': (FP + FN) / (TP + FN),
+                'TP': TP,
+                'FP': FP,
+                'FN': FN,
+                'TN': TN,
+                'area_total': area_total
+            }
+        
+        return results
@@ -0,0 +1,151 @@
+""" Parallel_Calculation.py
+
+    process-pool execution of OutputCalculation matching + pair metrics;
+    feds polygons are sharded by fireid (whole fires per shard). Both inputs are
+    exported once to shared memory (Shared_Geometry.py): tasks carry only feds
+    positions, and each worker decodes just the shard's feds polygons and the
+    reference polygons whose bounds overlap them
+"""
+
+import logging
+import numpy as np
+import geopandas as gpd
+from concurrent.futures import ProcessPoolExecutor
+
+import Output_Calculation
+from Pair_Metrics import PairMetrics
+from Shared_Geometry import SharedGeometry
+
+
+# shards per worker; more, smaller shards even out uneven fire sizes
+SHARDS_PER_WORKER = 4
+
+# shared inputs attached by a worker process, filled once by init_worker
+_SHARED = {}
+
+
+# SHARD PLANNING
+def plan_shards(feds_polygons, n_shards: int) -> list:
+    """ split feds row positions into n_shards sorted position arrays
+        with a fireid column, each fire stays within one shard and fires are
+        assigned largest first to the least loaded shard; otherwise rows are
+        split into contiguous chunks
+    """
+    n_rows = feds_polygons.shape[0]
+    n_shards = max(1, min(n_shards, n_rows))
+
+    if 'fireid' not in feds_polygons.columns:
+        return [shard for shard in np.array_split(np.arange(n_rows), n_shards) if len(shard)]
+
+    fire_ids, fire_of_row = np.unique(feds_polygons['fireid'].astype(str).values, return_inverse=True)
+    fire_sizes = np.bincount(fire_of_row, minlength=len(fire_ids))
+
+    loads = np.zeros(n_shards, dtype=np.int64)
+    shard_of_fire = np.empty(len(fire_ids), dtype=np.int64)
+    for fire in np.argsort(-fire_sizes, kind='stable'):
+        shard = int(np.argmin(loads))
+        shard_of_fire[fire] = shard
+        loads[shard] += fire_sizes[fire]
+
+    shard_of_row = shard_of_fire[fire_of_row]
+    return [np.flatnonzero(shard_of_row == shard) for shard in range(n_shards) if loads[shard]]
+
+
+# WORKER SIDE
+def init_worker(feds_handle: dict, ref_handle: dict, crs, metric_cache):
+    """ pool initializer: attach to both shared inputs for the life of the process """
+    _SHARED['feds'] = SharedGeometry.attach(feds_handle)
+    _SHARED['ref'] = SharedGeometry.attach(ref_handle)
+    _SHARED['crs'] = crs
+    _SHARED['metric_cache'] = metric_cache
+
+def bounds_overlap(feds_bounds, ref_bounds, chunk_size: int = 256) -> np.ndarray:
+    """ sorted reference positions whose bounds overlap any of feds_bounds """
+    hits = np.zeros(ref_bounds.shape[0], dtype=bool)
+    for start in range(0, feds_bounds.shape[0], chunk_size):
+        chunk = feds_bounds[start:start + chunk_size, None, :]
+        hits |= ((ref_bounds[None, :, 0] <= chunk[..., 2]) & (ref_bounds[None, :, 2] >= chunk[..., 0]) &
+                 (ref_bounds[None, :, 1] <= chunk[..., 3]) & (ref_bounds[None, :, 3] >= chunk[..., 1])).any(axis=0)
+    return np.flatnonzero(hits)
+
+def run_shard(feds_positions, match_mode: str, calc_mode: str, dayrange: int, backend: str = "overlay", raster_resolution=None) -> dict:
+    """ match + metrics for one shard of feds polygons against the shared reference set
+
+        returns the OutputCalculation phase results re-keyed to global feds/reference
+        positions, plus metrics for every selected (feds position, reference position) pair
+    """
+    OutputCalculation = Output_Calculation.OutputCalculation
+    feds_shared, ref_shared, crs = _SHARED['feds'], _SHARED['ref'], _SHARED['crs']
+    
+    feds_polygons = gpd.GeoDataFrame(geometry=gpd.GeoSeries(feds_shared.geometries(feds_positions), crs=crs))
+    # only references that can intersect this shard are decoded; ascending, so
+    # candidate order matches a search over the full set
+    ref_positions = bounds_overlap(feds_shared.bounds[feds_positions], ref_shared.bounds)
+    ref_polygons = gpd.GeoDataFrame(geometry=gpd.GeoSeries(ref_shared.geometries(ref_positions), crs=crs))
+
+    if match_mode == "loop":
+        candidates = OutputCalculation.intersect_candidates_loop(feds_polygons, ref_polygons)
+    else:
+        candidates = OutputCalculation.intersect_candidates(feds_polygons, ref_polygons)
+    selected, out_of_range, invalid = OutputCalculation.nearest_date_candidates(feds_shared.array('times')[feds_positions],
+                                                                                ref_shared.array('times')[ref_positions],
+                                                                                candidates,
+                                                                                dayrange)
+
+    pair_feds = [f_pos for f_pos in sorted(selected) for _ in selected[f_pos]]
+    pair_ref = [r_pos for f_pos in sorted(selected) for r_pos in selected[f_pos]]
+
+    values = []
+    if len(pair_feds):
+        values = OutputCalculation.pair_metric_values(feds_polygons.geometry.values[pair_feds],
+                                                      ref_polygons.geometry.values[pair_ref],
+                                                      crs,
+                                                      calc_mode,
+                                                      _SHARED['metric_cache'],
+                                                      backend,
+                                                      raster_resolution)
+
+    to_global = lambda local: int(feds_positions[local])
+    to_global_refs = lambda refs: ref_positions[refs].tolist()
+    return {'candidates': {to_global(f_pos): to_global_refs(refs) for f_pos, refs in candidates.items()},
+            'selected': {to_global(f_pos): to_global_refs(refs) for f_pos, refs in selected.items()},
+            'out_of_range': [to_global(f_pos) for f_pos in out_of_range],
+            'invalid': [to_global(f_pos) for f_pos in invalid],
+            'pairs': [(to_global(f_pos), int(ref_positions[r_pos])) for f_pos, r_pos in zip(pair_feds, pair_ref)],
+            'metrics': [{key: pair_values[key] for key in PairMetrics.METRICS} for pair_values in values]}
+
+
+# DRIVER SIDE
+def run_parallel(feds_index, ref_index, crs, workers: int, match_mode: str, calc_mode: str, dayrange: int, metric_cache=None, backend: str = "overlay", raster_resolution=None):
+    """ fan shards out over a process pool and merge results by feds position
+        (order independent of completion order, so output matches a serial run)
+
+        returns (candidates, selected, out_of_range, invalid, pair_metrics) where
+        pair_metrics maps (feds position, reference position) -> metrics dict
+    """
+    shards = plan_shards(feds_index.polygons, workers * SHARDS_PER_WORKER)
+    logging.info(f"Parallel_Calculation: {feds_index.size} feds polygons in {len(shards)} shards over {workers} workers")
+
+    with feds_index.share() as feds_shared, ref_index.share() as ref_shared:
+        with ProcessPoolExecutor(max_workers=workers,
+                                 initializer=init_worker,
+                                 initargs=(feds_shared.handle, ref_shared.handle, crs, metric_cache)) as pool:
+            futures = [pool.submit(run_shard,
+                                   shard,
+                                   match_mode,
+                                   calc_mode,
+                                   dayrange,
+                                   backend,
+                                   raster_resolution) for shard in shards]
+            results = [future.result() for future in futures]
+
+    candidates, selected, pair_metrics = {}, {}, {}
+    out_of_range, invalid = [], []
+    for result in results:
+        candidates.update(result['candidates'])
+        selected.update(result['selected'])
+        out_of_range.extend(result['out_of_range'])
+        invalid.extend(result['invalid'])
+        pair_metrics.update(zip(result['pairs'], result['metrics']))
+
+    return candidates, selected, sorted(out_of_range), sorted(invalid), pair_metrics
@@ -0,0 +1,117 @@
+"""
+Polygon_Index Class
+
+"""
+
+import numpy as np
+import pandas as pd
+
+from Shared_Geometry import SharedGeometry
+
+
+class PolygonIndex():
+    """ PolygonIndex
+        Positional geometry + attribute store over an input's polygons,
+        built once at ingest. Maps the 'index' column to row positions so
+        that resolving a (feds_index, ref_index) pair is constant time
+        instead of a boolean scan over the whole frame
+
+        with time_col set, that column is parsed once into a positional
+        datetime64 array, plus its time-sorted order for range/nearest lookups
+    """
+
+    def __init__(self, polygons, key: str = 'index', time_col: str = None, time_format: str = None):
+
+        # USER INPUT
+        self._polygons = polygons
+        self._key = key
+        self._time_col = time_col
+
+        # PROGRAM SET
+        self._positions = {value: pos for pos, value in enumerate(polygons[key].tolist())}
+        self._geometries = polygons.geometry.values
+        self._columns = {}
+        self._times = None
+        self._time_order = None
+        
+        if time_col is not None:
+            times = pd.to_datetime(polygons[time_col], format=time_format)
+            if getattr(times.dt, "tz", None) is not None:
+                times = times.dt.tz_localize(None)
+            self._times = times.values.astype('datetime64[ns]')
+            self._time_order = np.argsort(self._times, kind='stable')
+
+        assert len(self._positions) == polygons.shape[0], f"FATAL: duplicate values in key column '{key}'; cannot build polygon index"
+
+    @property
+    def polygons(self):
+        return self._polygons
+
+    @property
+    def geometries(self):
+        return self._geometries
+
+    @property
+    def size(self):
+        return len(self._positions)
+
+    @property
+    def times(self):
+        """ datetime64 per row position (None without a time column) """
+        return self._times
+
+    @property
+    def time_order(self):
+        """ row positions sorted by time """
+        return self._time_order
+
+    @property
+    def sorted_times(self):
+        return self._times[self._time_order]
+
+    def __contains__(self, value):
+        return value in self._positions
+
+    def position(self, value) -> int:
+        """ row position of a key value """
+        return self._positions[value]
+
+    def positions(self, values) -> np.ndarray:
+        """ row positions of many key values, in the given order """
+        return np.fromiter((self._positions[value] for value in values), dtype=np.int64, count=len(values))
+
+    def geometry(self, value):
+        """ shapely geometry of a key value """
+        return self._geometries[self._positions[value]]
+
+    def column(self, name: str) -> np.ndarray:
+        """ positional array of an attribute column, materialized once """
+        if name not in self._columns:
+            self._columns[name] = self._polygons[name].values
+        return self._columns[name]
+
+    def value(self, value, name: str):
+        """ attribute value of a key value """
+        return self.column(name)[self._positions[value]]
+
+    def frame(self, value):
+        """ one-row GeoDataFrame for a key value (as the old boolean scan returned) """
+        return self._polygons.iloc[[self._positions[value]]]
+
+    def time_window(self, start, stop) -> np.ndarray:
+        """ row positions with start <= time <= stop, in time order """
+        sorted_times = self.sorted_times
+        lo = np.searchsorted(sorted_times, np.datetime64(start, 'ns'), side='left')
+        hi = np.searchsorted(sorted_times, np.datetime64(stop, 'ns'), side='right')
+        return self._time_order[lo:hi]
+
+    def share(self):
+        """ export geometries (+ times) to shared memory for worker processes;
+            returns the owning Shared_Geometry.SharedGeometry, close it when done
+        """
+        arrays = {} if self._times is None else {'times': self._times}
+        return SharedGeometry.export(self._geometries, **arrays)
+
+    def take(self, values):
+        """ GeoDataFrame rows for many key values, in the given order """
+        return self._polygons.iloc[self.positions(values)]
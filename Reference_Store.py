@@ -0,0 +1,142 @@
+"""
+Reference_Store Class
+
+    one-time ingest of a reference dataset into GeoParquet partitioned by year;
+    run as a script to build a store, e.g.:
+
+    python Reference_Store.py --title Downloaded_InterAgencyFirePerimeterHistory_All_Years_View \
+        --source s3://maap-ops-workspace/shared/ksharonin/Latest_Interagency_Fire_Perimeters/Latest_Interagency_Fire_Perimeters.json \
+        --dest /projects/shared-buckets/ksharonin/Latest_Interagency_Fire_Perimeters_Store
+"""
+
+import os
+import sys
+import argparse
+import logging
+import fsspec
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+
+
+class ReferenceStore():
+    """ ReferenceStore
+        Year-partitioned GeoParquet copy of a reference dataset:
+
+        {store_dir}/year=YYYY/part.parquet
+
+        rows are spatially sorted within each partition and carry their
+        EPSG:4326 bounds (xmin/ymin/xmax/ymax), so row group statistics let a
+        bbox read skip groups entirely; DATE_CUR_STAMP is normalized at ingest
+    """
+
+    # file within each year partition
+    PART_NAME = "part.parquet"
+    # crs of the per-row bounds columns; matches usr_bbox
+    BOUNDS_CRS = 4326
+    BOUNDS_COLS = ["xmin", "ymin", "xmax", "ymax"]
+
+    def __init__(self, store_dir: str):
+
+        # USER INPUT
+        self._store_dir = store_dir.rstrip("/")
+
+        # PROGRAM SET
+        self._fs, _ = fsspec.core.url_to_fs(self._store_dir)
+
+    @property
+    def store_dir(self):
+        return self._store_dir
+
+    def partition_path(self, year: int) -> str:
+        return f"{self._store_dir}/year={year}/{ReferenceStore.PART_NAME}"
+
+    def has_partition(self, year: int) -> bool:
+        return self._fs.exists(self.partition_path(year))
+
+    # INGEST
+    def ingest(self, source: str, title: str, row_group_size: int = 10000):
+        """ read a full reference dataset once and write it as year partitions
+            - remove None geometries
+            - normalize dates with the title's source schema
+            - add EPSG:4326 bounds columns + hilbert sort for row group pruning
+        """
+        # deferred: Input_Reference reads stores through this module
+        from Input_Reference import InputReference
+
+        assert title in InputReference.SOURCE_SCHEMAS, f"FATAL: no source schema for title {title}; cannot normalize dates"
+
+        with fsspec.open(source) as f:
+            df = gpd.GeoDataFrame.from_file(f)
+        logging.info(f"ReferenceStore: read {df.shape[0]} rows from {source}")
+
+        df = df[df.geometry != None]
+        df = InputReference.normalize_dates(df, InputReference.SOURCE_SCHEMAS[title])
+
+        bounds = df.geometry.to_crs(ReferenceStore.BOUNDS_CRS).bounds if df.crs is not None else df.geometry.bounds
+        df[ReferenceStore.BOUNDS_COLS] = bounds[["minx", "miny", "maxx", "maxy"]].values
+
+        for year, part in df.groupby(df.DATE_CUR_STAMP.dt.year):
+            part = ReferenceStore.spatial_sort(part)
+            path = self.partition_path(int(year))
+            self._fs.makedirs(os.path.dirname(path), exist_ok=True)
+
+            tmp_path = f"{path}.tmp"
+            with self._fs.open(tmp_path, "wb") as f:
+                part.to_parquet(f, index=False, row_group_size=row_group_size)
+            self._fs.mv(tmp_path, path)
+            logging.info(f"ReferenceStore: wrote {part.shape[0]} rows to {path}")
+
+        return self
+
+    def spatial_sort(df):
+        """ order rows along a hilbert curve so nearby fires share row groups """
+        if hasattr(df.geometry, "hilbert_distance"):
+            order = df.geometry.hilbert_distance().values.argsort(kind="stable")
+        else:
+            # older geopandas: fall back to sorting on bounds
+            order = np.lexsort((df.xmin.values, df.ymin.values))
+        return df.iloc[order]
+
+    # READ
+    def read(self, years: list, bbox: list = None):
+        """ GeoDataFrame of the requested years, only reading row groups whose
+            bounds intersect bbox ([minx, miny, maxx, maxy], EPSG:4326; numbers
+            or numeric strings, as usr_bbox is given)
+        """
+        filters = None
+        if bbox is not None:
+            # bounds columns are doubles; usr_bbox holds strings
+            minx, miny, maxx, maxy = map(float, bbox)
+            filters = [("xmax", ">=", minx), ("xmin", "<=", maxx),
+                       ("ymax", ">=", miny), ("ymin", "<=", maxy)]
+
+        parts = []
+        for year in years:
+            if not self.has_partition(year):
+                logging.warning(f"ReferenceStore: no partition for year {year} in {self._store_dir}")
+                continue
+            parts.append(gpd.read_parquet(self.partition_path(year), filters=filters))
+
+        assert len(parts) != 0, f"FATAL: no store partitions found for years {years} in {self._store_dir}"
+
+        df = gpd.GeoDataFrame(pd.concat(parts, ignore_index=True), crs=parts[0].crs)
+
+        return df
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ingest a reference dataset into a year-partitioned GeoParquet store")
+    parser.add_argument("--title", required=True, help="predefined reference title; selects the date schema")
+    parser.add_argument("--source", required=True, help="source file (local path or s3 url)")
+    parser.add_argument("--dest", required=True, help="store directory (local path or s3 url)")
+    parser.add_argument("--row-group-size", type=int, default=10000, help="rows per parquet row group")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    ReferenceStore(args.dest).ingest(args.source, args.title, row_group_size=args.row_group_size)
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
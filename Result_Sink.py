@@ -0,0 +1,307 @@
+"""
+Result_Sink Class
+
+"""
+
+import io
+import os
+import glob
+import logging
+import pandas as pd
+import geopandas as gpd
+from concurrent.futures import ThreadPoolExecutor
+
+import Utilities
+
+
+class S3MultipartWriter():
+    """ S3MultipartWriter
+        Binary file-like writer to one S3 (or S3-compatible) object; bytes are cut
+        into part_size parts and uploaded by background threads while the caller
+        keeps producing, then stitched together on close
+
+        objects smaller than one part are sent as a single put; on failure
+        the multipart upload is aborted so no orphaned parts are billed
+    """
+
+    # S3 minimum for every part but the last
+    MIN_PART_SIZE = 5 * 1024**2
+
+    def __init__(self, bucket: str, key: str, client, part_size: int = 8 * 1024**2, max_workers: int = 4):
+
+        # USER INPUT
+        self._bucket = bucket
+        self._key = key
+        self._client = client
+        self._part_size = max(part_size, S3MultipartWriter.MIN_PART_SIZE)
+        self._max_workers = max_workers
+
+        # PROGRAM SET
+        self._buffer = bytearray()
+        self._upload_id = None
+        self._futures = []
+        self._pool = ThreadPoolExecutor(max_workers=max_workers)
+        self._closed = False
+
+    @property
+    def url(self):
+        return f"s3://{self._bucket}/{self._key}"
+
+    def write(self, data: bytes):
+        assert not self._closed, f"FATAL: writer for {self.url} already closed"
+        self._buffer += data
+        while len(self._buffer) >= self._part_size:
+            part = bytes(self._buffer[:self._part_size])
+            del self._buffer[:self._part_size]
+            self.__submit_part(part)
+        return len(data)
+
+    def __submit_part(self, part: bytes):
+        if self._upload_id is None:
+            self._upload_id = self._client.create_multipart_upload(Bucket=self._bucket, Key=self._key)["UploadId"]
+        # bounded memory: at most two parts per worker in flight
+        if len(self._futures) >= 2 * self._max_workers:
+            self._futures[-2 * self._max_workers].result()
+        part_number = len(self._futures) + 1
+        self._futures.append(self._pool.submit(self.__upload_part, part_number, part))
+
+    def __upload_part(self, part_number: int, part: bytes) -> dict:
+        response = self._client.upload_part(Bucket=self._bucket,
+                                            Key=self._key,
+                                            UploadId=self._upload_id,
+                                            PartNumber=part_number,
+                                            Body=part)
+        return {"PartNumber": part_number, "ETag": response["ETag"]}
+
+    def close(self):
+        """ upload the remainder and complete the object """
+        if self._closed:
+            return self
+        self._closed = True
+        try:
+            if self._upload_id is None:
+                self._client.put_object(Bucket=self._bucket, Key=self._key, Body=bytes(self._buffer))
+            else:
+                if len(self._buffer):
+                    self.__submit_part(bytes(self._buffer))
+                parts = [future.result() for future in self._futures]
+                self._client.complete_multipart_upload(Bucket=self._bucket,
+                                                       Key=self._key,
+                                                       UploadId=self._upload_id,
+                                                       MultipartUpload={"Parts": parts})
+        except Exception:
+            self.abort()
+            raise
+        finally:
+            self._buffer = bytearray()
+            self._pool.shutdown(wait=True)
+        return self
+
+    def abort(self):
+        """ drop all uploaded parts; the object is not created """
+        self._closed = True
+        for future in self._futures:
+            future.cancel()
+        if self._upload_id is not None:
+            self._client.abort_multipart_upload(Bucket=self._bucket, Key=self._key, UploadId=self._upload_id)
+            self._upload_id = None
+        self._pool.shutdown(wait=True)
+        return self
+
+
+class ResultSink():
+    """ ResultSink
+        Append-only writer for OutputCalculation results produced in batches; only
+        rows written since the last flush are held (at most flush_rows, or one batch
+        when the caller flushes after each write); path is a local path or an
+        s3:// url (any S3-compatible store via endpoint_url)
+        
+        durability is per flush: rows still pending when a run dies are lost
+
+        csv: one file; the header is written once and every flush is appended
+             (local: flushed and fsynced, so rows written before a crash stay
+             readable; s3: streamed through one S3MultipartWriter)
+        parquet / geoparquet / arrow: path is a directory (prefix) of part files
+             (part-00000.parquet, ...); each flush becomes one complete part,
+             written under a temp name and renamed into place (local) or put as
+             its own object by a background upload (s3)
+        single_file: columnar rows are kept in memory until close and written as
+             one file; meant for results already held in memory, not for streaming
+             (flush is deferred to close, so part files are the only bounded mode)
+
+        tables are written as given; OutputCalculation prepares them per format
+    """
+
+    # part file extension per columnar format
+    PART_EXTENSIONS = {"parquet": "parquet", "geoparquet": "parquet", "arrow": "arrow"}
+
+    def __init__(self,
+                 path: str,
+                 output_format: str,
+                 flush_rows: int = 50000,
+                 single_file: bool = False,
+                 endpoint_url: str = None,
+                 part_size: int = 8 * 1024**2,
+                 upload_workers: int = 4):
+
+        # USER INPUT
+        self._path = path
+        self._output_format = output_format
+        self._flush_rows = flush_rows
+        self._single_file = single_file
+        self._endpoint_url = endpoint_url
+        self._part_size = part_size
+        self._upload_workers = upload_workers
+
+        # PROGRAM SET
+        self._pending = []
+        self._pending_rows = 0
+        self._rows_written = 0
+        self._parts_written = 0
+        self._closed = False
+        self._s3 = path.startswith("s3://")
+        self._client = None
+        self._uploads = None
+        self._part_uploads = []
+        self._csv_writer = None
+
+        assert output_format == "csv" or output_format in ResultSink.PART_EXTENSIONS, f"FATAL: no result sink for output format {output_format}"
+        assert flush_rows >= 1, f"Invalid flush row count {flush_rows}. Must be x >= 1"
+
+        if self._s3:
+            self._client = Utilities.s3_client(endpoint_url)
+            self._bucket, self._key = ResultSink.split_url(path)
+            self._uploads = ThreadPoolExecutor(max_workers=upload_workers)
+
+        self.__reset_output()
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def rows_written(self):
+        return self._rows_written
+
+    def split_url(url: str) -> tuple:
+        """ (bucket, key) of an s3:// url """
+        bucket, _, key = url[len("s3://"):].partition("/")
+        assert bucket and key, f"FATAL: s3 output url needs a bucket and key: {url}"
+        return bucket, key.rstrip("/")
+
+    def __reset_output(self):
+        """ clear a previous run's output so batches are never mixed across runs """
+        if self._output_format == "csv":
+            if self._s3:
+                self._csv_writer = S3MultipartWriter(self._bucket, self._key, self._client, self._part_size, self._upload_workers)
+            else:
+                os.makedirs(os.path.dirname(os.path.abspath(self._path)), exist_ok=True)
+                open(self._path, "w").close()
+        elif not self._single_file:
+            if self._s3:
+                paginator = self._client.get_paginator("list_objects_v2")
+                for page in paginator.paginate(Bucket=self._bucket, Prefix=f"{self._key}/part-"):
+                    old_parts = [{"Key": item["Key"]} for item in page.get("Contents", [])]
+                    if old_parts:
+                        self._client.delete_objects(Bucket=self._bucket, Delete={"Objects": old_parts})
+            else:
+                os.makedirs(self._path, exist_ok=True)
+                for old_part in glob.glob(os.path.join(self._path, "part-*")):
+                    os.remove(old_part)
+
+    # WRITING
+    def write(self, table: pd.DataFrame):
+        """ queue a batch of rows; flushes once flush_rows are pending """
+        assert not self._closed, "FATAL: result sink already closed"
+        if table.shape[0] == 0:
+            return self
+        self._pending.append(table)
+        self._pending_rows += table.shape[0]
+        if self._pending_rows >= self._flush_rows and not (self._single_file and self._output_format != "csv"):
+            self.flush()
+        return self
+
+    def flush(self):
+        """ write all pending rows to durable storage; a single columnar file is
+            only written once, on close
+        """
+        if not self._pending:
+            return self
+        if self._single_file and self._output_format != "csv" and not self._closed:
+            return self
+        table = pd.concat(self._pending, ignore_index=True)
+        if isinstance(self._pending[0], gpd.GeoDataFrame):
+            table = gpd.GeoDataFrame(table, geometry=self._pending[0].geometry.name, crs=self._pending[0].crs)
+        self._pending = []
+        self._pending_rows = 0
+
+        if self._output_format == "csv":
+            self.__append_csv(table)
+        elif self._single_file:
+            self.__write_file(table, self._key if self._s3 else self._path)
+        else:
+            part_name = f"part-{self._parts_written:05d}.{ResultSink.PART_EXTENSIONS[self._output_format]}"
+            self.__write_file(table, f"{self._key}/{part_name}" if self._s3 else os.path.join(self._path, part_name))
+            self._parts_written += 1
+        self._rows_written += table.shape[0]
+        logging.info(f"ResultSink: {self._rows_written} rows written to {self._path}")
+
+        return self
+
+    def __append_csv(self, table):
+        header = self._rows_written == 0
+        if self._s3:
+            self._csv_writer.write(table.to_csv(index=False, header=header, na_rep="nan").encode("utf-8"))
+            return
+        with open(self._path, "a", newline="") as csvfile:
+            table.to_csv(csvfile, index=False, header=header, na_rep="nan")
+            csvfile.flush()
+            os.fsync(csvfile.fileno())
+
+    def __serialize(self, table, target):
+        if self._output_format == "arrow":
+            table.reset_index(drop=True).to_feather(target)
+        else:
+            table.to_parquet(target, index=False)
+
+    def __write_file(self, table, path: str):
+        if self._s3:
+            # serialize now (bounded memory), upload in the background
+            data = io.BytesIO()
+            self.__serialize(table, data)
+            # bounded memory: at most two serialized parts per worker waiting to upload
+            while len(self._part_uploads) >= 2 * self._upload_workers:
+                self._part_uploads.pop(0).result()
+            self._part_uploads.append(self._uploads.submit(self.__put_object, path, data.getvalue()))
+            return
+        tmp_path = f"{path}.tmp"
+        self.__serialize(table, tmp_path)
+        os.replace(tmp_path, path)
+
+    def __put_object(self, key: str, data: bytes):
+        writer = S3MultipartWriter(self._bucket, key, self._client, self._part_size, max_workers=1)
+        writer.write(data)
+        writer.close()
+
+    def close(self):
+        """ flush the remainder and wait for uploads; the sink cannot be written to afterwards """
+        if self._closed:
+            return self
+        self._closed = True
+        try:
+            self.flush()
+        finally:
+            if self._csv_writer is not None:
+                self._csv_writer.close()
+            if self._uploads is not None:
+                self._uploads.shutdown(wait=True)
+                # surface failed uploads
+                [upload.result() for upload in self._part_uploads]
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        # keep what was produced before a failure
+        self.close()
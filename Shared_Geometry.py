@@ -0,0 +1,134 @@
+"""
+Shared_Geometry Class
+
+"""
+
+import numpy as np
+import geopandas as gpd
+from multiprocessing import shared_memory
+
+
+class SharedGeometry():
+    """ SharedGeometry
+        Geometries of an input as concatenated WKB in one shared memory block,
+        so worker processes attach by name instead of receiving pickled frames
+
+        block layout: [offsets (count+1) int64][bounds count x 4 float64][arrays][wkb bytes]
+        geometry i is wkb[offsets[i]:offsets[i+1]]; only requested positions are decoded
+
+        the exporting process owns the block and unlinks it on close
+    """
+
+    def __init__(self, handle: dict, owner: bool = False):
+
+        # USER INPUT
+        self._handle = handle
+        self._owner = owner
+
+        # PROGRAM SET
+        self._shm = SharedGeometry.open_block(handle["name"], create_size=handle["size"] if owner else None)
+        self._count = handle["count"]
+        buf = self._shm.buf
+
+        cursor = 0
+        self._offsets = np.ndarray((self._count + 1,), dtype=np.int64, buffer=buf, offset=cursor)
+        cursor += self._offsets.nbytes
+        self._bounds = np.ndarray((self._count, 4), dtype=np.float64, buffer=buf, offset=cursor)
+        cursor += self._bounds.nbytes
+        self._arrays = {}
+        for name, dtype in handle["arrays"]:
+            self._arrays[name] = np.ndarray((self._count,), dtype=np.dtype(dtype), buffer=buf, offset=cursor)
+            cursor += self._arrays[name].nbytes
+        self._data_start = cursor
+
+    @property
+    def handle(self):
+        """ picklable description of the block; pass to SharedGeometry.attach """
+        return self._handle
+
+    @property
+    def count(self):
+        return self._count
+
+    @property
+    def bounds(self):
+        """ (count, 4) minx, miny, maxx, maxy per geometry """
+        return self._bounds
+
+    def array(self, name: str) -> np.ndarray:
+        """ positional array exported alongside the geometries """
+        return self._arrays[name]
+
+    def geometries(self, positions) -> np.ndarray:
+        """ decode the geometries at the given positions, in that order """
+        positions = np.asarray(positions, dtype=np.int64)
+        starts = self._offsets[positions] + self._data_start
+        stops = self._offsets[positions + 1] + self._data_start
+        buf = self._shm.buf
+        wkbs = [bytes(buf[start:stop]) for start, stop in zip(starts.tolist(), stops.tolist())]
+        return gpd.GeoSeries.from_wkb(wkbs).values
+
+    def close(self):
+        """ detach; the owner also frees the block """
+        self._offsets = self._bounds = None
+        self._arrays = {}
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # CONSTRUCTION
+    def export(geometries, **arrays):
+        """ copy geometries (+ optional positional numeric arrays, e.g. times) into a
+            new shared block; returns the owning SharedGeometry
+        """
+        geoms = gpd.GeoSeries(geometries)
+        wkbs = geoms.to_wkb().tolist()
+        count = len(wkbs)
+
+        offsets = np.zeros(count + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(wkb) for wkb in wkbs])
+        bounds = geoms.bounds.values.astype(np.float64)
+
+        arrays = {name: np.asarray(values) for name, values in arrays.items()}
+        for name, values in arrays.items():
+            assert values.shape == (count,), f"FATAL: shared array {name} must have one value per geometry"
+            if values.dtype.kind == 'M':
+                # one fixed unit so every process reads the same layout; NaT is kept
+                arrays[name] = values.astype('datetime64[ns]')
+
+        header = offsets.nbytes + bounds.nbytes + sum(values.nbytes for values in arrays.values())
+        size = max(header + int(offsets[-1]), 1)
+
+        handle = {"name": None,
+                  "size": size,
+                  "count": count,
+                  "arrays": [(name, values.dtype.str) for name, values in arrays.items()]}
+        shared = SharedGeometry(handle, owner=True)
+        handle["name"] = shared._shm.name
+
+        shared._offsets[:] = offsets
+        shared._bounds[:] = bounds
+        for name, values in arrays.items():
+            shared._arrays[name][:] = values
+        shared._shm.buf[shared._data_start:shared._data_start + int(offsets[-1])] = b"".join(wkbs)
+
+        return shared
+
+    def attach(handle: dict):
+        """ open an exported block from another process (no copy) """
+        return SharedGeometry(handle, owner=False)
+
+    def open_block(name, create_size=None):
+        """ create (owner) or attach to a shared memory block
+            pool workers share the owner's resource tracker, so attaching does not
+            hand ownership to the worker
+        """
+        if create_size is not None:
+            return shared_memory.SharedMemory(create=True, size=create_size)
+        return shared_memory.SharedMemory(name=name)
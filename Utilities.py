@@ -3,16 +3,32 @@
     for additional processing functions to connect class instances
 """
 
+import os
 import glob
 import logging
 import sys
+import shapely
+import numpy as np
 import pandas as pd
 import geopandas as gpd
 from pyproj import CRS
 from owslib.ogcapi.features import Features
 import geopandas as gpd
 import datetime as dt
+import threading
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+
+# connections per pooled s3 client
+S3_POOL_SIZE = 32
+# process-wide s3 state: one client per endpoint, prefixes known to exist
+_S3_CLIENTS = {}
+_S3_PREFIXES = set()
+_S3_LOCK = threading.Lock()
 
 
 # USER INPUT PROCESSING
@@ -59,6 +75,99 @@ def check_crs(crs_in: int) -> bool:
     except Exception as gen_err:
         return False
 
+def split_time_range(start: str, stop: str, shard_days: int) -> list:
+    """ split an iso start/stop range into consecutive (start, stop) iso string
+        shards of at most shard_days each; shards share their boundary instants
+    """
+    assert shard_days is not None and shard_days > 0, "shard_days must be a positive number of days"
+    
+    range_start = datetime.fromisoformat(start)
+    range_stop = datetime.fromisoformat(stop)
+    step = timedelta(days=shard_days)
+    
+    shards = []
+    shard_start = range_start
+    while shard_start < range_stop:
+        shard_stop = min(shard_start + step, range_stop)
+        shards.append((shard_start.isoformat(), shard_stop.isoformat()))
+        shard_start = shard_stop
+    
+    return shards if len(shards) else [(start, stop)]
+
+# ARCGIS FEATURESERVER ACCESS
+def arcgis_layer_info(session, query_url: str, timeout: int = 300) -> dict:
+    """ layer metadata (maxRecordCount, paging support, editingInfo.lastEditDate)
+        for the layer behind a FeatureServer query url
+    """
+    layer_url = query_url[:-len("/query")] if query_url.endswith("/query") else query_url
+    response = session.get(layer_url, params={"f": "json"}, timeout=timeout)
+    response.raise_for_status()
+    return response.json()
+
+def iter_arcgis_pages(session, query_url: str, params: dict, layer_info: dict, page_size: int = 2000, max_workers: int = 4, timeout: int = 300):
+    """ run an ArcGIS FeatureServer layer query, yielding geojson feature lists
+        one page at a time in offset order
+        
+        counts matches first, then fetches resultOffset/resultRecordCount pages
+        concurrently; page size is capped at the layer maxRecordCount and paging
+        is skipped for layers that do not support it
+    """
+    supports_paging = layer_info.get("advancedQueryCapabilities", {}).get("supportsPagination", True)
+    max_records = layer_info.get("maxRecordCount")
+    if max_records:
+        page_size = min(page_size, int(max_records))
+    
+    count_params = dict(params, returnCountOnly="true", f="json")
+    count_response = session.get(query_url, params=count_params, timeout=timeout)
+    count_response.raise_for_status()
+    count_page = count_response.json()
+    if "error" in count_page:
+        raise IOError(f"ArcGIS count query failed: {count_page['error']}")
+    count = count_page.get("count", 0)
+    logging.info(f"ArcGIS query matched {count} features at {query_url}")
+    
+    def fetch(offset):
+        page_params = dict(params)
+        if supports_paging:
+            page_params.update(resultOffset=offset, resultRecordCount=page_size)
+        response = session.get(query_url, params=page_params, timeout=timeout)
+        response.raise_for_status()
+        page = response.json()
+        if "error" in page:
+            raise IOError(f"ArcGIS query failed: {page['error']}")
+        return page.get("features", [])
+    
+    offsets = list(range(0, count, page_size)) if supports_paging else [0]
+    returned = 0
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(offsets)))) as executor:
+        for features in executor.map(fetch, offsets):
+            returned += len(features)
+            yield features
+    
+    if returned < count:
+        logging.error(f"ArcGIS query returned {returned} of {count} matched features; results may be incomplete")
+
+
+# LOCAL FILE HELPERS
+def atomic_write(path: str, chunks, mode: str = "w"):
+    """ write an iterable of chunks to path via a temp file + rename, so readers
+        never see a partial file and a failed download leaves the old copy intact
+    """
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, mode) as tmp_file:
+            for chunk in chunks:
+                tmp_file.write(chunk)
+            tmp_file.flush()
+            os.fsync(tmp_file.fileno())
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    
+    return path
+
+
 # S3 PROCESSING & ACCESS
 def split_s3_path(s3_path: str):
     """ for bucket and key extraction"""
@@ -80,5 +189,103 @@ def split_s3_path(s3_path: str):
     
     return bucket, key, nested
 
+def s3_client(endpoint_url: str = None):
+    """ one pooled boto3 s3 client per endpoint, shared by every caller in the process """
+    with _S3_LOCK:
+        if endpoint_url not in _S3_CLIENTS:
+            _S3_CLIENTS[endpoint_url] = boto3.client("s3", 
+                                                     endpoint_url=endpoint_url, 
+                                                     config=Config(max_pool_connections=S3_POOL_SIZE))
+        return _S3_CLIENTS[endpoint_url]
+
+def s3_prefix_exists(bucket: str, prefix: str, endpoint_url: str = None) -> bool:
+    """ whether any object lives under bucket/prefix ("" checks the bucket itself)
+        one bounded request (MaxKeys=1 listing, or HEAD on the bucket); positive
+        results are cached for the process lifetime
+    """
+    cache_key = (endpoint_url, bucket, prefix)
+    if cache_key in _S3_PREFIXES:
+        return True
+    
+    client = s3_client(endpoint_url)
+    if prefix == "":
+        try:
+            client.head_bucket(Bucket=bucket)
+            exists = True
+        except ClientError:
+            exists = False
+    else:
+        response = client.list_objects_v2(Bucket=bucket, Prefix=prefix, MaxKeys=1)
+        exists = response.get("KeyCount", len(response.get("Contents", []))) > 0
+    
+    if exists:
+        with _S3_LOCK:
+            _S3_PREFIXES.add(cache_key)
+    return exists
+
+# OGC API ACCESS
+def iter_ogc_pages(session, items_url: str, params: dict, timeout: int = 120):
+    """ stream pages of an OGC API - Features items endpoint
+        follows rel="next" links; falls back to offset paging when the
+        server reports more matches but omits the link
+        
+        yields one decoded page (FeatureCollection dict) at a time so callers
+        can convert + drop the raw json before the next request
+    """
+    url = items_url
+    query = dict(params)
+    page_size = int(query.get("limit", 0) or 0)
+    seen = 0
+    
+    while url is not None:
+        response = session.get(url, params=query, timeout=timeout)
+        response.raise_for_status()
+        page = response.json()
+        
+        features = page.get("features", [])
+        seen += len(features)
+        yield page
+        
+        next_links = [link["href"] for link in page.get("links", []) if link.get("rel") == "next"]
+        matched = page.get("numberMatched")
+        
+        if not len(features):
+            url = None
+        elif next_links:
+            # next href already carries the full query
+            url, query = next_links[0], None
+        elif (matched is not None and seen < int(matched)) or (matched is None and len(features) == page_size):
+            url, query = items_url, dict(params, offset=seen)
+        else:
+            url = None
+
+
+# SPATIAL INDEX
+def sindex_query_bulk(sindex, geometries, predicate=None):
+    """ query a geopandas spatial index with an array of geometries in one call
+        returns (input positions, tree positions) as two int arrays
+        
+        note: older geopandas exposes the bulk form as query_bulk, newer
+        versions accept arrays directly in query
+    """
+    if hasattr(sindex, "query_bulk"):
+        result = sindex.query_bulk(geometries, predicate=predicate)
+    else:
+        result = sindex.query(geometries, predicate=predicate)
+    
+    return result[0], result[1]
+
+def geometry_wkt(geometries) -> np.ndarray:
+    """ full precision WKT per geometry, identical to geom.wkt
+        
+        note: newer shapely converts arrays in one call, but rounds to 6
+        decimals unless told otherwise; older shapely has no array form
+    """
+    if hasattr(shapely, "to_wkt"):
+        return shapely.to_wkt(np.asarray(geometries, dtype=object), rounding_precision=-1)
+    return np.array([None if geom is None else geom.wkt for geom in geometries], dtype=object)
+
+
+
 # DECORATORS
 # TODO
\ No newline at end of file
@@ -27,6 +27,12 @@ echo "Starting algorithm in subshell"
 cd "$basedir"
 echo "Running in directory: $(pwd -P)"
 
+# algorithm arguments are passed through to the batch runner
+runner="$basedir/Batch_Runner.py"
+if [[ ! -f "$runner" ]]; then
+  runner="$basedir/../Batch_Runner.py"
+fi
+python "$runner" "$@"
 )
 echo "Done!"
 
@@ -0,0 +1,504 @@
+""" regression checks on synthetic data (no network, no MAAP paths) """
+
+import io
+import os
+import socket
+import pytest
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+from shapely.geometry import box
+
+from Reference_Store import ReferenceStore
+
+
+# REFERENCE STORE
+def test_store_read_string_bbox(tmp_path):
+    """ usr_bbox is a list of strings; only row groups within it are read """
+    df = gpd.GeoDataFrame({"DATE_CUR_STAMP": pd.to_datetime(["2020-06-01"] * 4)},
+                          geometry=[box(i * 10, 0, i * 10 + 1, 1) for i in range(4)],
+                          crs=4326)
+    df[ReferenceStore.BOUNDS_COLS] = df.geometry.bounds.values
+    store = ReferenceStore(str(tmp_path))
+    (tmp_path / "year=2020").mkdir()
+    df.to_parquet(store.partition_path(2020), index=False, row_group_size=1)
+
+    read = store.read([2020], ["5.0", "-1.0", "25.0", "2.0"])
+
+    assert read.xmin.tolist() == [10.0, 20.0]
+    assert np.array_equal(store.read([2020]).xmin.values, df.xmin.values)
+
+
+
+# REFERENCE DATES
+@pytest.fixture
+def local_tz(monkeypatch):
+    """ a local zone with dst, so epoch conversion to local time is exercised """
+    import time
+    monkeypatch.setenv("TZ", "America/Los_Angeles")
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def test_normalize_dates_matches_rowwise(local_tz):
+    """ vectorized DATE_CUR_STAMP equals the original per-row strptime / fromtimestamp parsing """
+    import datetime
+    from Input_Reference import InputReference
+
+    geometry = [box(0, 0, 1, 1)] * 6
+    schemas = InputReference.SOURCE_SCHEMAS
+
+    # string dates: missing and wrong-length values are dropped
+    nifc = gpd.GeoDataFrame({"DATE_CUR": ["20200815", None, "2020081", "20201101", "202011011", "20210310"]}, geometry=geometry)
+    normalized = InputReference.normalize_dates(nifc, schemas["InterAgencyFirePerimeterHistory_All_Years_View"])
+    rowwise = [datetime.datetime.strptime(value, "%Y%m%d") for value in nifc.DATE_CUR if pd.notna(value) and len(value) == 8]
+    assert normalized.DATE_CUR_STAMP.tolist() == rowwise
+
+    # epoch milliseconds to local naive time, across both dst changes
+    epochs = [1597500000000, None, 1604221200000, 1604224800000, 1615712400000, 1615716000000]
+    wfigs = gpd.GeoDataFrame({"poly_PolygonDateTime": epochs}, geometry=geometry)
+    normalized = InputReference.normalize_dates(wfigs, schemas["WFIGS_current_interagency_fire_perimeters"])
+    rowwise = [datetime.datetime.fromtimestamp(value / 1000.0) for value in epochs if value is not None]
+    assert normalized.DATE_CUR_STAMP.tolist() == rowwise
+    assert normalized.index.tolist() == [0, 2, 3, 4, 5]
+
+
+# MATCHING
+class FakeInput():
+    """ minimal stand-in for InputFEDS / InputReference over a prepared frame """
+
+    def __init__(self, polygons, time_col: str, time_format: str = None):
+        from pyproj import CRS
+        from Polygon_Index import PolygonIndex
+
+        self.polygons = polygons
+        self.crs = CRS.from_user_input(polygons.crs)
+        self.polygon_index = PolygonIndex(polygons, time_col=time_col, time_format=time_format)
+
+
+def synthetic_inputs(n_feds: int = 20, n_ref: int = 60, seed: int = 0):
+    """ random feds boxes (with t) and reference boxes (with DATE_CUR_STAMP), some exactly touching """
+    from Input_FEDS import InputFEDS
+
+    rng = np.random.default_rng(seed)
+    base = pd.Timestamp("2020-08-01")
+
+    feds_xy = rng.uniform(0, 100, (n_feds, 2))
+    feds_size = rng.uniform(1, 5, (n_feds, 2))
+    feds = gpd.GeoDataFrame({"t": [(base + pd.Timedelta(days=int(day), hours=12)).strftime(InputFEDS.TIME_FORMAT) for day in rng.integers(0, 30, n_feds)],
+                             "fireid": rng.integers(0, 10, n_feds)},
+                            geometry=[box(x, y, x + w, y + h) for (x, y), (w, h) in zip(feds_xy, feds_size)],
+                            crs=3857)
+
+    ref_geoms = []
+    for j, ((x, y), (w, h)) in enumerate(zip(rng.uniform(0, 100, (n_ref, 2)), rng.uniform(1, 6, (n_ref, 2)))):
+        if j % 7 == 0:
+            # shares an edge with a feds box: touches, does not overlap
+            minx, miny, maxx, maxy = feds.geometry.iloc[j % n_feds].bounds
+            ref_geoms.append(box(maxx, miny, maxx + 2, maxy))
+        else:
+            ref_geoms.append(box(x, y, x + w, y + h))
+    ref = gpd.GeoDataFrame({"DATE_CUR_STAMP": [base + pd.Timedelta(days=int(day)) for day in rng.integers(0, 30, n_ref)],
+                            "INCIDENT": [f"fire{j}" for j in range(n_ref)]},
+                           geometry=ref_geoms,
+                           crs=3857)
+
+    for df in (feds, ref):
+        df["index"] = df.index
+    return FakeInput(feds, "t", InputFEDS.TIME_FORMAT), FakeInput(ref, "DATE_CUR_STAMP")
+
+
+def test_bulk_matches_loop():
+    """ vectorized candidate search agrees with the original per-polygon loop """
+    from Output_Calculation import OutputCalculation
+
+    for seed in range(2):
+        feds_input, ref_input = synthetic_inputs(seed=seed)
+        bulk = OutputCalculation.intersect_candidates(feds_input.polygons, ref_input.polygons)
+        loop = OutputCalculation.intersect_candidates_loop(feds_input.polygons, ref_input.polygons)
+        assert bulk == loop
+        assert any(len(refs) for refs in bulk.values())
+
+
+def test_bulk_and_loop_runs_identical(tmp_path):
+    """ whole runs (matching + metrics + output) agree across match modes """
+    from Output_Calculation import OutputCalculation
+
+    feds_input, ref_input = synthetic_inputs(seed=1)
+    outputs = {}
+    for match_mode in OutputCalculation.MATCH_MODES:
+        path = tmp_path / f"{match_mode}.csv"
+        OutputCalculation(feds_input, ref_input, "csv", str(path), 7, False, False,
+                                 match_mode=match_mode, use_metric_cache=False)
+        outputs[match_mode] = path.read_text()
+
+    assert outputs["bulk"] == outputs["loop"]
+    assert len(outputs["bulk"].splitlines()) > 1
+
+
+
+def test_parallel_runs_identical(tmp_path):
+    """ process pool runs write the serial output, sharded by fireid or in contiguous chunks """
+    from Input_FEDS import InputFEDS
+    from Output_Calculation import OutputCalculation
+
+    feds_input, ref_input = synthetic_inputs(n_feds=40, n_ref=120, seed=3)
+    unsharded = FakeInput(feds_input.polygons.drop(columns="fireid"), "t", InputFEDS.TIME_FORMAT)
+    for name, feds in [("fireid", feds_input), ("chunks", unsharded)]:
+        outputs = {}
+        for workers in [1, 3]:
+            path = tmp_path / f"{name}_{workers}.csv"
+            OutputCalculation(feds, ref_input, "csv", str(path), 7, False, False,
+                              workers=workers, use_metric_cache=False)
+            outputs[workers] = path.read_text()
+
+        assert len(outputs[1].splitlines()) > 1
+        assert outputs[3] == outputs[1]
+
+
+
+def test_out_of_range_warning_names_kept_reference(tmp_path, capsys):
+    """ the day range warning names the kept (nearest date) reference by its index key """
+    from Input_FEDS import InputFEDS
+    from Output_Calculation import OutputCalculation
+
+    feds = gpd.GeoDataFrame({"t": ["2020-08-20T12:00:00"], "fireid": [1]}, geometry=[box(0, 0, 10, 10)], crs=3857)
+    ref = gpd.GeoDataFrame({"DATE_CUR_STAMP": [pd.Timestamp("2020-06-01"), pd.Timestamp("2020-08-01")]},
+                           geometry=[box(5, 5, 15, 15), box(2, 2, 8, 8)], crs=3857)
+    feds["index"] = [7]
+    ref["index"] = [100, 101]
+
+    OutputCalculation(FakeInput(feds, "t", InputFEDS.TIME_FORMAT), FakeInput(ref, "DATE_CUR_STAMP"),
+                      "csv", str(tmp_path / "out.csv"), 7, False, False, use_metric_cache=False)
+
+    out = capsys.readouterr().out
+    assert "TIME MATCH WARNING" in out
+    assert "FEDS at index 7 and Reference at index [101]." in out
+
+
+def test_match_store_rejects_workers(tmp_path):
+    """ store runs are single process; workers > 1 is an error, not silently ignored """
+    from Output_Calculation import OutputCalculation
+    from Match_Store import MatchStore
+
+    feds_input, ref_input = synthetic_inputs(seed=1)
+    with pytest.raises(AssertionError, match="match_store"):
+        OutputCalculation(feds_input, ref_input, "csv", str(tmp_path / "out.csv"), 7, False, False,
+                          workers=2, match_store=MatchStore(str(tmp_path / "store")))
+    assert not (tmp_path / "out.csv").exists()
+
+
+# METRICS
+def overlay_metrics(feds_inst, nifc_inst) -> dict:
+    """ the original per-metric overlay pipeline, every overlay rebuilt per metric """
+    def area(geoms):
+        return sum(geoms.geometry.area.tolist())
+
+    def envelope():
+        return gpd.overlay(feds_inst, nifc_inst, how='union').geometry.envelope.to_frame()
+
+    TP = area(gpd.overlay(feds_inst, nifc_inst, how='intersection'))
+    FN = area(gpd.overlay(gpd.overlay(envelope(), feds_inst, how='difference'), nifc_inst, keep_geom_type=False, how='intersection'))
+    FP = area(gpd.overlay(gpd.overlay(envelope(), nifc_inst, how='difference'), feds_inst, keep_geom_type=False, how='intersection'))
+    TN = area(gpd.overlay(gpd.overlay(envelope(), feds_inst, how='difference'),
+                          gpd.overlay(envelope(), nifc_inst, how='difference'), keep_geom_type=False, how='intersection'))
+    area_total = area(envelope())
+    feds_area, nifc_area = area(feds_inst), area(nifc_inst)
+    precision, recall = TP / feds_area, TP / nifc_area
+
+    return {'ratio': feds_area / nifc_area,
+            'accuracy': (TN + TP) / area_total,
+            'precision': precision,
+            'recall': recall,
+            'iou': TP / (TP + FP + FN),
+            'f1': 2 * (precision*recall)/(precision+recall),
+            'symm_ratio': area(feds_inst.symmetric_difference(nifc_inst, align=False)) / nifc_area}
+
+
+def metric_pairs(n_pairs: int = 8) -> list:
+    """ intersecting single-row (feds, reference) frames from the synthetic inputs, plus a concave pair """
+    from Output_Calculation import OutputCalculation
+    from shapely.geometry import Polygon
+
+    feds_input, ref_input = synthetic_inputs(n_feds=40, n_ref=200, seed=2)
+    feds, ref = feds_input.polygons, ref_input.polygons
+    pairs = [(feds.iloc[[i]], ref.iloc[[j]])
+             for i, refs in OutputCalculation.intersect_candidates(feds, ref).items()
+             for j in refs
+             if feds.geometry.iloc[i].intersection(ref.geometry.iloc[j]).area > 0][:n_pairs]
+
+    # L-shaped feds: the union pieces have envelopes that overlap each other
+    ell = gpd.GeoDataFrame(geometry=[Polygon([(0, 0), (10, 0), (10, 2), (2, 2), (2, 10), (0, 10)])], crs=3857)
+    pairs.append((ell, gpd.GeoDataFrame(geometry=[box(1, 1, 6, 6)], crs=3857)))
+    return pairs
+
+
+def test_single_pass_matches_overlay():
+    """ PairMetrics and the metric wrappers return the original overlay numbers """
+    from Pair_Metrics import PairMetrics
+    from Output_Calculation import OutputCalculation
+
+    pairs = metric_pairs()
+    assert len(pairs) > 5
+    for feds_inst, nifc_inst in pairs:
+        expected = overlay_metrics(feds_inst, nifc_inst)
+        single = PairMetrics(feds_inst, nifc_inst).metrics()
+        assert single == pytest.approx(expected, rel=1e-9)
+        assert OutputCalculation.IOUCalculation(feds_inst, nifc_inst) == pytest.approx(expected['iou'], rel=1e-9)
+        assert OutputCalculation.accuracyCalculation(feds_inst, nifc_inst) == pytest.approx(expected['accuracy'], rel=1e-9)
+
+
+
+def test_batch_metrics_match_single_pass(tmp_path):
+    """ vectorized batch_metrics agrees with PairMetrics pair by pair, and whole runs agree across calc modes """
+    from Pair_Metrics import PairMetrics
+    from Output_Calculation import OutputCalculation
+
+    pairs = metric_pairs()
+    batch = PairMetrics.batch_metrics(pd.concat([feds_inst.geometry for feds_inst, _ in pairs]),
+                                      pd.concat([nifc_inst.geometry for _, nifc_inst in pairs]))
+    for i, (feds_inst, nifc_inst) in enumerate(pairs):
+        single = PairMetrics(feds_inst, nifc_inst).metrics()
+        assert {key: batch[key][i] for key in PairMetrics.METRICS} == pytest.approx(single, rel=1e-9)
+
+    feds_input, ref_input = synthetic_inputs(seed=1)
+    outputs = {}
+    for calc_mode in OutputCalculation.CALC_MODES:
+        path = tmp_path / f"{calc_mode}.csv"
+        OutputCalculation(feds_input, ref_input, "csv", str(path), 7, False, False,
+                          calc_mode=calc_mode, use_metric_cache=False)
+        outputs[calc_mode] = pd.read_csv(path)
+
+    assert outputs["batch"].shape[0] > 0
+    pd.testing.assert_frame_equal(outputs["batch"], outputs["pairwise"], rtol=1e-9)
+
+
+# S3 (moto server standing in for any S3-compatible endpoint)
+@pytest.fixture(scope="module")
+def s3_endpoint():
+    """ endpoint url of a local moto server with an empty "results" bucket """
+    moto_server = pytest.importorskip("moto.server")
+    import boto3
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    with pytest.MonkeyPatch.context() as patch:
+        for name in ["AWS_ACCESS_KEY_ID", "AWS_SECRET_ACCESS_KEY"]:
+            patch.setenv(name, "testing")
+        patch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+        server = moto_server.ThreadedMotoServer(ip_address="127.0.0.1", port=port, verbose=False)
+        server.start()
+        endpoint_url = f"http://127.0.0.1:{port}"
+        boto3.client("s3", endpoint_url=endpoint_url).create_bucket(Bucket="results")
+        yield endpoint_url
+        server.stop()
+
+
+def s3_object(endpoint_url: str, key: str) -> bytes:
+    import Utilities
+    return Utilities.s3_client(endpoint_url).get_object(Bucket="results", Key=key)["Body"].read()
+
+
+def test_s3_sink_round_trip(s3_endpoint, tmp_path):
+    """ the same batches written locally and to S3 give the same csv / parquet parts """
+    from Result_Sink import ResultSink
+
+    table = pd.DataFrame({"feds_index": np.arange(1000), "iou": np.linspace(0, 1, 1000), "incident_name": "fire"})
+    batches = [table.iloc[start:start + 150] for start in range(0, 1000, 150)]
+
+    for output_format, name in [("csv", "out.csv"), ("parquet", "out_parts")]:
+        with ResultSink(str(tmp_path / name), output_format, flush_rows=300) as local, \
+             ResultSink(f"s3://results/run/{name}", output_format, flush_rows=300, endpoint_url=s3_endpoint) as remote:
+            for batch in batches:
+                local.write(batch)
+                remote.write(batch)
+
+        if output_format == "csv":
+            assert s3_object(s3_endpoint, "run/out.csv") == (tmp_path / name).read_bytes()
+        else:
+            local_parts = sorted(os.listdir(tmp_path / name))
+            assert len(local_parts) > 1
+            for part in local_parts:
+                remote_part = pd.read_parquet(io.BytesIO(s3_object(s3_endpoint, f"run/{name}/{part}")))
+                assert remote_part.equals(pd.read_parquet(tmp_path / name / part))
+
+
+def test_s3_multipart_upload(s3_endpoint):
+    """ objects larger than one part are stitched back together, no upload left open """
+    import Utilities
+    from Result_Sink import S3MultipartWriter
+
+    client = Utilities.s3_client(s3_endpoint)
+    data = np.random.default_rng(0).bytes(11 * 1024**2 + 123)
+    writer = S3MultipartWriter("results", "run/big.bin", client, part_size=S3MultipartWriter.MIN_PART_SIZE, max_workers=2)
+    for start in range(0, len(data), 1024**2):
+        writer.write(data[start:start + 1024**2])
+    writer.close()
+
+    assert s3_object(s3_endpoint, "run/big.bin") == data
+    assert not client.list_multipart_uploads(Bucket="results").get("Uploads")
+
+
+def test_s3_prefix_exists(s3_endpoint):
+    """ missing prefixes are re-checked, found ones are cached for the process """
+    import Utilities
+
+    client = Utilities.s3_client(s3_endpoint)
+    calls = []
+    def count_call(model, **kwargs):
+        calls.append(model.name)
+    client.meta.events.register("before-call.s3", count_call)
+    try:
+        assert not Utilities.s3_prefix_exists("results", "checked/", s3_endpoint)
+        client.put_object(Bucket="results", Key="checked/a.csv", Body=b"a")
+        assert Utilities.s3_prefix_exists("results", "checked/", s3_endpoint)
+        n_calls = len(calls)
+        assert Utilities.s3_prefix_exists("results", "checked/", s3_endpoint)
+        assert len(calls) == n_calls
+        assert Utilities.s3_prefix_exists("results", "", s3_endpoint)
+    finally:
+        client.meta.events.unregister("before-call.s3", count_call)
+
+
+# REFERENCE CLIPPING
+def test_relabelled_reference_survives_bbox_clip(tmp_path):
+    """ degree coordinates relabelled as EPSG:3857 (the repo's convention) are
+        clipped in degrees, not against a bbox reprojected to metres
+    """
+    from Input_Reference import InputReference
+
+    source = gpd.GeoDataFrame({"DATE_CUR": ["20200805", "20200810"], "INCIDENT": ["inside", "outside"]},
+                              geometry=[box(-120.5, 38.0, -120.0, 38.5), box(-90.5, 38.0, -90.0, 38.5)],
+                              crs=4326)
+    path = tmp_path / "perimeters.geojson"
+    source.to_file(path, driver="GeoJSON")
+
+    ref_input = InputReference("2020-08-01T00:00:00+00:00", "2020-08-31T00:00:00+00:00",
+                               ["-125", "31", "-101", "49"], 3857,
+                               title="none", control_type="custom",
+                               custom_url=str(path), custom_read_type="shp_local",
+                               custom_col_assign={"time": "DATE_CUR", "time_format": "%Y%m%d", "incident_name": "INCIDENT"})
+
+    assert ref_input.polygons.INCIDENT.tolist() == ["inside"]
+    assert ref_input.polygons.crs == ref_input.crs
+
+
+def test_store_backed_reference_matches(tmp_path):
+    """ a reference read from a store matches FEDS polygons like the Downloaded_ path:
+        same coordinates (relabelled, not reprojected) and only the usr_start year
+    """
+    from Input_Reference import InputReference
+    from Output_Calculation import OutputCalculation
+
+    title = "Partitioned_InterAgencyFirePerimeterHistory_All_Years_View"
+    source = gpd.GeoDataFrame({"DATE_CUR": ["20200805", "20200812", "20210110"],
+                               "GIS_ACRES": [10.0, 20.0, 30.0],
+                               "INCIDENT": ["a", "b", "next_year"]},
+                              geometry=[box(-120.5, 38.0, -120.0, 38.5), box(-110.5, 40.0, -110.0, 40.5), box(-120.5, 38.0, -120.0, 38.5)],
+                              crs=4326)
+    source_path = tmp_path / "perimeters.geojson"
+    source.to_file(source_path, driver="GeoJSON")
+    ReferenceStore(str(tmp_path / "store")).ingest(str(source_path), title)
+
+    ref_input = InputReference("2020-08-01T00:00:00+00:00", "2021-01-31T00:00:00+00:00",
+                               ["-125", "31", "-101", "49"], 3857,
+                               title=title, control_type="custom",
+                               custom_url=str(tmp_path / "store"), custom_read_type="geoparquet_store")
+    assert sorted(ref_input.polygons.INCIDENT) == ["a", "b"]
+
+    # FEDS degree coordinates carry the user crs label as well
+    from Input_FEDS import InputFEDS
+    feds = gpd.GeoDataFrame({"t": ["2020-08-06T12:00:00", "2020-08-12T00:00:00"]},
+                            geometry=[box(-120.4, 38.1, -120.1, 38.4), box(-110.4, 40.1, -110.1, 40.6)],
+                            crs=4326).set_crs(3857, allow_override=True)
+    feds["index"] = feds.index
+    path = tmp_path / "out.csv"
+    OutputCalculation(FakeInput(feds, "t", InputFEDS.TIME_FORMAT), ref_input, "csv", str(path), 7, False, False,
+                      use_metric_cache=False)
+
+    results = pd.read_csv(path)
+    assert results.shape[0] == 2
+    assert sorted(results.incident_name) == ["a", "b"]
+    assert (results.iou > 0).all()
+
+
+# PAGED HTTP SOURCES
+class FakeResponse():
+    """ requests.Response stand-in around a decoded json body """
+
+    def __init__(self, body: dict, status: int = 200):
+        self._body = body
+        self.status_code = status
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            import requests
+            raise requests.HTTPError(f"{self.status_code} error")
+
+    def json(self):
+        return self._body
+
+
+class FakeSession():
+    """ requests.Session stand-in: answer(url, params) -> FakeResponse; records every call """
+
+    def __init__(self, answer):
+        self._answer = answer
+        self.calls = []
+
+    def get(self, url, params=None, timeout=None):
+        self.calls.append((url, None if params is None else dict(params)))
+        return self._answer(url, params)
+
+
+def feature_page(ids, **extra) -> dict:
+    return dict({"type": "FeatureCollection", "features": [{"id": i} for i in ids]}, **extra)
+
+
+def ogc_ids(pages) -> list:
+    return [feature["id"] for page in pages for feature in page["features"]]
+
+
+def test_ogc_pages_follow_next_links():
+    import Utilities
+
+    pages = {"http://ogc/items": feature_page([0, 1], links=[{"rel": "next", "href": "http://ogc/items?page=2"}]),
+             "http://ogc/items?page=2": feature_page([2, 3], links=[{"rel": "self", "href": "x"}, {"rel": "next", "href": "http://ogc/items?page=3"}]),
+             "http://ogc/items?page=3": feature_page([4])}
+    session = FakeSession(lambda url, params: FakeResponse(pages[url]))
+
+    assert ogc_ids(Utilities.iter_ogc_pages(session, "http://ogc/items", {"limit": 2})) == [0, 1, 2, 3, 4]
+    # the next href already carries the query
+    assert [params for _, params in session.calls] == [{"limit": 2}, None, None]
+
+
+def test_ogc_pages_offset_fallback_and_empty_page():
+    import Utilities
+
+    # no next links; numberMatched says there is more until the data runs out early
+    data = list(range(5))
+    def answer(url, params):
+        offset, limit = params.get("offset", 0), params["limit"]
+        return FakeResponse(feature_page(data[offset:offset + limit], numberMatched=8))
+    session = FakeSession(answer)
+
+    assert ogc_ids(Utilities.iter_ogc_pages(session, "http://ogc/items", {"limit": 2})) == data
+    # offsets 0, 2, 4, then 5 returns an empty page and paging stops
+    assert [params.get("offset", 0) for _, params in session.calls] == [0, 2, 4, 5]
+
+
+def test_arcgis_count_error_raises():
+    import Utilities
+
+    # an ArcGIS error body comes back with http 200; it must not read as zero matches
+    session = FakeSession(lambda url, params: FakeResponse({"error": {"code": 400, "message": "Invalid query"}}))
+    with pytest.raises(IOError, match="Invalid query"):
+        list(Utilities.iter_arcgis_pages(session, "http://arcgis/query", {"where": "1=1"}, {}))
+
+    session = FakeSession(lambda url, params: FakeResponse({}, status=500))
+    with pytest.raises(Exception, match="500"):
+        list(Utilities.iter_arcgis_pages(session, "http://arcgis/query", {"where": "1=1"}, {}))